@@ -0,0 +1,200 @@
+"""
+In-process cache of each user's activities as compact NumPy columns.
+
+A user's exercises are loaded once (date, duration and exerciseType only) into
+parallel arrays: the UTC day ordinal, the duration and a code into the user's
+list of interned exercise types. Totals, per-type breakdowns and windowed sums
+are then answered with vectorised NumPy operations instead of an aggregation
+or a Python loop over documents.
+
+Entries are evicted least recently used first once their arrays exceed
+``max_bytes`` in total, dropped by invalidate() when this process writes an
+activity, and reloaded after ``ttl`` seconds to pick up writes made elsewhere
+(the Node activity service, other workers).
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+# Only these fields are read from MongoDB
+ACTIVITY_FIELDS = {"_id": 0, "date": 1, "duration": 1, "exerciseType": 1}
+# Rough per-entry overhead on top of the arrays (the object, dict slot, type list)
+ENTRY_OVERHEAD = 256
+
+
+def day_ordinal(value):
+    """Proleptic Gregorian ordinal of a date, or of a datetime's UTC date"""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.toordinal()
+
+
+def as_number(value, digits=None):
+    """
+    Present a float total as an int when it is a whole number, like $sum would;
+    rounded to digits first if given
+    """
+    value = float(value)
+    if digits is not None:
+        value = round(value, digits)
+    return int(value) if value.is_integer() else value
+
+
+class UserActivities:
+    """One user's activities as parallel arrays, sorted by day"""
+
+    __slots__ = ("days", "durations", "type_codes", "types", "loaded_at", "nbytes")
+
+    def __init__(self, days, durations, type_codes, types, loaded_at):
+        order = np.argsort(days, kind="stable")
+        self.days = days[order]
+        self.durations = durations[order]
+        self.type_codes = type_codes[order]
+        self.types = types
+        self.loaded_at = loaded_at
+        self.nbytes = (self.days.nbytes + self.durations.nbytes + self.type_codes.nbytes
+                       + sum(sys.getsizeof(t) for t in types) + ENTRY_OVERHEAD)
+
+    @classmethod
+    def from_documents(cls, docs, loaded_at=0.0):
+        days, durations, type_codes = [], [], []
+        types, codes = [], {}
+        for doc in docs:
+            when = doc.get("date")
+            if not isinstance(when, (datetime, date)):
+                continue
+            duration = doc.get("duration")
+            exercise_type = doc.get("exerciseType")
+            if isinstance(exercise_type, str):
+                exercise_type = sys.intern(exercise_type)
+            code = codes.get(exercise_type)
+            if code is None:
+                code = codes[exercise_type] = len(types)
+                types.append(exercise_type)
+            days.append(day_ordinal(when))
+            # $sum ignores non-numeric durations, so they count as 0 here
+            numeric = isinstance(duration, (int, float)) and not isinstance(duration, bool)
+            durations.append(duration if numeric else 0)
+            type_codes.append(code)
+        return cls(np.array(days, dtype=np.int32), np.array(durations, dtype=np.float64),
+                   np.array(type_codes, dtype=np.int32), types, loaded_at)
+
+    def __len__(self):
+        return len(self.days)
+
+    def _window(self, start_day=None, end_day=None):
+        """Slice bounds for start_day <= day < end_day (ordinals, either may be None)"""
+        lo = 0 if start_day is None else int(np.searchsorted(self.days, start_day, side="left"))
+        hi = len(self.days) if end_day is None else int(np.searchsorted(self.days, end_day, side="left"))
+        return lo, hi
+
+    def total(self, start_day=None, end_day=None):
+        lo, hi = self._window(start_day, end_day)
+        return as_number(self.durations[lo:hi].sum())
+
+    def count(self, start_day=None, end_day=None):
+        lo, hi = self._window(start_day, end_day)
+        return hi - lo
+
+    def by_type(self, start_day=None, end_day=None):
+        """[(exerciseType, total duration, sessions)] in the window, largest total first"""
+        lo, hi = self._window(start_day, end_day)
+        codes = self.type_codes[lo:hi]
+        totals = np.bincount(codes, weights=self.durations[lo:hi], minlength=len(self.types))
+        counts = np.bincount(codes, minlength=len(self.types))
+        present = np.flatnonzero(counts)
+        present = present[np.argsort(-totals[present], kind="stable")]
+        return [(self.types[i], as_number(totals[i]), int(counts[i])) for i in present]
+
+    def recent(self, limit=None, start_day=None):
+        """[(day ordinal, duration, exerciseType)] newest first"""
+        lo, hi = self._window(start_day)
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return [(int(self.days[i]), as_number(self.durations[i]), self.types[self.type_codes[i]])
+                for i in range(hi - 1, lo - 1, -1)]
+
+
+class ActivityCache:
+    """LRU of UserActivities bounded by total array memory, with a TTL"""
+
+    def __init__(self, loader, max_bytes=64 * 1024 * 1024, ttl=300, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._loader = loader
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # usernames being loaded -> True once a write lands mid-load
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        """Cached activities for a user, loaded from the database if missing or expired"""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and now - entry.loaded_at < self.ttl:
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            self._loading.setdefault(username, False)
+
+        try:
+            entry = UserActivities.from_documents(self._loader(username), loaded_at=now)
+        except Exception:
+            with self._lock:
+                self._loading.pop(username, None)
+            raise
+
+        with self._lock:
+            stale = self._loading.pop(username, False)
+            if not stale:
+                self._store(username, entry)
+        return entry
+
+    def _store(self, username, entry):
+        old = self._entries.pop(username, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        self._entries[username] = entry
+        self._bytes += entry.nbytes
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def invalidate(self, *usernames):
+        """Forget users whose activities were just written"""
+        with self._lock:
+            for username in usernames:
+                old = self._entries.pop(username, None)
+                if old is not None:
+                    self._bytes -= old.nbytes
+                if username in self._loading:
+                    self._loading[username] = True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "users": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
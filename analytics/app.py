@@ -1,20 +1,34 @@
 from dotenv import load_dotenv
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, request, Response, make_response
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from flask_pymongo import PyMongo
 from flask_cors import CORS
 from urllib.parse import quote_plus
-from bson import json_util
 import traceback
 import logging
+import json
 import os
-from datetime import datetime, timedelta
 from bson import ObjectId
-from datetime import datetime, timedelta, timezone
-from zoneinfo import ZoneInfo
+from datetime import datetime, timezone
 import jwt
 from functools import wraps
 import hashlib
+from rollups import ROLLUP_COLLECTION
+from indexes import start_index_build, index_report
+from token_cache import TokenCache
+from activity_cache import ActivityCache, UserActivities, ACTIVITY_FIELDS
+from insights import InsightsCache
+from data_versions import DataVersions, bump as bump_versions, bump_user
+import metrics
+from encoding import (json_response, encoded_response, streamed_response, dumps,
+                      stream_json_array, stream_json_object, stream_ndjson)
+from exports import (FORMATS as EXPORT_FORMATS, available as export_available, build_export, iter_file,
+                     file_size as export_size)
+from queries import (stats_pipeline, batch_stats_pipeline, parse_series_args, series_pipeline,
+                     daily_trend_pipeline, daily_trend_points, parse_day_range, weekly_journal_pipeline,
+                     dashboard_week, dashboard_pipeline, range_query, format_activity, activity_id_query,
+                     normalise_activity)
 
 def anonymize_username(username):
     """Anonymize username for logging purposes"""
@@ -27,15 +41,57 @@ app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"},
                      r"/api/*": {"origins": "*"},
                      r"/stats/*": {"origins": "*"}},
-     methods="GET,HEAD,POST,OPTIONS,PUT,PATCH,DELETE")
+     methods="GET,HEAD,POST,OPTIONS,PUT,PATCH,DELETE",
+     expose_headers=["X-Next-After", "ETag"])
+metrics.init_app(app, "analytics")
 
 load_dotenv()
 mongo_uri = os.getenv('MONGO_URI')
 mongo_db = os.getenv('MONGO_DB')
 JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
 
-client = MongoClient(mongo_uri)
+ROLLUPS_ENABLED = os.getenv('ROLLUPS_ENABLED', 'false').lower() == 'true'
+
+client = MongoClient(mongo_uri, event_listeners=metrics.mongo_event_listeners())
 db = client[mongo_db]
+start_index_build(db)
+
+# Stats are served from the daily_rollups collection kept current by
+# `python rollups.py watch`. Rollup documents share the exercise shape,
+# so the same pipelines run against either collection.
+def stats_collection():
+    return db[ROLLUP_COLLECTION] if ROLLUPS_ENABLED else db.exercises
+
+# Per-user activity columns for the per-user stats routes; writes through this
+# app invalidate them, anything written elsewhere shows up after the TTL.
+ACTIVITY_CACHE_MB = int(os.getenv('ACTIVITY_CACHE_MB', 64))
+
+def load_user_activities(username):
+    return db.exercises.find({"username": username}, ACTIVITY_FIELDS).batch_size(INDEX_BATCH_SIZE)
+
+activity_cache = ActivityCache(load_user_activities,
+                               max_bytes=ACTIVITY_CACHE_MB * 1024 * 1024,
+                               ttl=int(os.getenv('ACTIVITY_CACHE_TTL', 300))) if ACTIVITY_CACHE_MB > 0 else None
+
+def user_activities(username):
+    if activity_cache is not None:
+        return activity_cache.get(username)
+    return UserActivities.from_documents(load_user_activities(username))
+
+# Streaks and training load, patched in place as this app logs activities
+insights_cache = InsightsCache(user_activities, ttl=int(os.getenv('ACTIVITY_CACHE_TTL', 300)))
+
+# Decoded claims are cached until the token's exp so dashboards polling
+# several endpoints with the same token only pay for one HMAC check.
+token_cache = TokenCache(max_size=int(os.getenv('TOKEN_CACHE_SIZE', 1024)))
+
+def decode_token(token):
+    claims = token_cache.get(token)
+    if claims is None:
+        # Raises on a bad signature or expiry, so failures are never cached
+        claims = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
+        token_cache.put(token, claims)
+    return claims
 
 # JWT verification
 def token_required(f):
@@ -46,338 +102,381 @@ def token_required(f):
         
         auth_header = request.headers.get('Authorization', None)
         if not auth_header:
-            return jsonify({'error': 'Missing token'}), 401
+            return json_response({'error': 'Missing token'}), 401
         
         try:
             token = auth_header.split(' ')[1]
-            decoded_token = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
+            decoded_token = decode_token(token)
             request.user = decoded_token
         except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expired'}), 401
+            return json_response({'error': 'Token expired'}), 401
         except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+            return json_response({'error': 'Invalid token'}), 401
         
         return f(*args, **kwargs)
     return decorated
 
+# The auth service issues plain user tokens, so admin routes also need an
+# `admin: true` claim or a subject listed in ADMIN_USERS (comma-separated).
+ADMIN_USERS = {name.strip() for name in os.getenv('ADMIN_USERS', '').split(',') if name.strip()}
+
+def is_admin(claims):
+    return claims.get('admin') is True or claims.get('sub') in ADMIN_USERS
+
+def admin_required(f):
+    @wraps(f)
+    @token_required
+    def decorated(*args, **kwargs):
+        if request.method != 'OPTIONS' and not is_admin(request.user):
+            return json_response({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated
+
+def forget_user_data(username):
+    """Drop the cached activities and insights an ETag'd response would be built from"""
+    if activity_cache is not None:
+        activity_cache.invalidate(username)
+    insights_cache.forget(username)
+
+# Per-user data versions (kept complete by `python data_versions.py watch`)
+# let unchanged polls be answered with 304 without querying exercises. A user's
+# cached activities and insights are dropped whenever their version moves, so a
+# fresh ETag is never attached to data cached before a write made elsewhere.
+data_versions = DataVersions(db, on_change=forget_user_data)
+
+def conditional(f):
+    """Serve a per-user GET with an ETag, answering a matching If-None-Match with 304"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        username = kwargs.get('username') or request.args.get('user')
+        if request.method != 'GET' or not username:
+            return f(*args, **kwargs)
+        try:
+            # Default windows end today, so the date is part of the representation
+            key = f"{request.full_path}:{datetime.now(timezone.utc).date()}"
+            etag = data_versions.etag(username, key)
+        except Exception as e:
+            logging.error(f"Error reading data version: {e}")
+            etag = None
+        if etag is None:
+            return f(*args, **kwargs)
+
+        # Compressed variants carry a -br/-gzip suffix on the same tag
+        matched = next((tag for tag in request.if_none_match.as_set() if tag.split('-')[0] == etag), None)
+        if matched is not None:
+            response = Response(status=304)
+            response.set_etag(matched)
+            response.headers['Vary'] = 'Accept-Encoding'
+            return response
+
+        response = make_response(f(*args, **kwargs))
+        if response.status_code == 200:
+            encoding = response.headers.get('Content-Encoding')
+            response.set_etag(f"{etag}-{encoding}" if encoding else etag)
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return decorated
+
 # Public health check endpoint
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify(status='healthy', timestamp=datetime.now().isoformat()), 200
+    return json_response(status='healthy', timestamp=datetime.now().isoformat()), 200
+
+
+# Documents are read from the cursor this many at a time when streaming
+INDEX_BATCH_SIZE = 500
+MAX_PAGE_SIZE = 1000
+
+
+def log_stream_error(e):
+    # Headers are already sent, so all we can do is log and cut the body short
+    logging.error(f"Error streaming exercises: {e}")
+    traceback.print_exc()
 
 
 @app.route('/')
 @token_required
 def index():
+    # Keyset pagination on _id: ?limit=N&after=<last _id of previous page>
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    ndjson = (request.args.get('format') == 'ndjson'
+              or request.accept_mimetypes.best == 'application/x-ndjson')
+
+    query = {}
+    if after:
+        try:
+            query['_id'] = {'$gt': ObjectId(after)}
+        except Exception:
+            return json_response(error="after must be an exercise id"), 400
+
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            return json_response(error="limit must be an integer"), 400
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return json_response(error=f"limit must be between 1 and {MAX_PAGE_SIZE}"), 400
+
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
     try:
-        exercises = db.exercises.find()
-        exercises_list = list(exercises)
-        return json_util.dumps(exercises_list)
+        cursor = db.exercises.find(query).sort('_id', 1).batch_size(INDEX_BATCH_SIZE)
+
+        if limit is None:
+            # Whole collection: stream straight from the cursor so memory stays flat
+            stream = stream_ndjson if ndjson else stream_json_array
+            return streamed_response(stream(cursor, extended=True, on_error=log_stream_error), mimetype)
+
+        page = list(cursor.limit(limit))
+        if ndjson:
+            body = b"".join(stream_ndjson(page, extended=True))
+        else:
+            body = dumps(page, extended=True)
+        response = encoded_response(body, mimetype)
+        if len(page) == limit:
+            response.headers['X-Next-After'] = str(page[-1]['_id'])
+        return response
     except Exception as e:
         logging.error(f"Error fetching index data: {e}")
         traceback.print_exc()
-        return jsonify(error="An internal error occurred"), 500
+        return json_response(error="An internal error occurred"), 500
 
 @app.route('/stats')
 @token_required
 def stats():
-    pipeline = [
-        {
-            "$group": {
-                "_id": {
-                    "username": "$username",
-                    "exerciseType": "$exerciseType"
-                },
-                "totalDuration": {"$sum": "$duration"}
-            }
-        },
-        {
-            "$group": {
-                "_id": "$_id.username",
-                "exercises": {
-                    "$push": {
-                        "exerciseType": "$_id.exerciseType",
-                        "totalDuration": "$totalDuration"
-                    }
-                }
-            }
-        },
-        {
-            "$project": {
-                "username": "$_id",
-                "exercises": 1,
-                "_id": 0
-            }
-        }
-    ]
-
     try:
-        stats = list(db.exercises.aggregate(pipeline))
-        return jsonify(stats=stats)
+        stats = list(stats_collection().aggregate(stats_pipeline()))
+        return json_response(stats=stats)
     except Exception as e:
         logging.error(f"Error fetching all stats: {e}")
         traceback.print_exc()
-        return jsonify(error="An internal error occurred"), 500
+        return json_response(error="An internal error occurred"), 500
 
 
 @app.route('/stats/<username>', methods=['GET'])
 @token_required
+@conditional
 def user_stats(username):
-    pipeline = [
-        {
-            "$match": {"username": username}
-        },
-        {
-            "$group": {
-                "_id": {
-                    "username": "$username",
-                    "exerciseType": "$exerciseType"
-                },
-                "totalDuration": {"$sum": "$duration"}
-            }
-        },
-        {
-            "$group": {
-                "_id": "$_id.username",
-                "exercises": {
-                    "$push": {
-                        "exerciseType": "$_id.exerciseType",
-                        "totalDuration": "$totalDuration"
-                    }
-                }
-            }
-        },
-        {
-            "$project": {
-                "username": "$_id",
-                "exercises": 1,
-                "_id": 0
-            }
-        }
-    ]
-
     try:
-        stats = list(db.exercises.aggregate(pipeline))
-        return jsonify(stats=stats)
+        if activity_cache is not None:
+            activities = activity_cache.get(username)
+            exercises = [{"exerciseType": exercise_type, "totalDuration": total}
+                         for exercise_type, total, _ in activities.by_type()]
+            stats = [{"username": username, "exercises": exercises}] if exercises else []
+        else:
+            stats = list(stats_collection().aggregate(stats_pipeline({"username": username})))
+        return json_response(stats=stats)
     except Exception as e:
         logging.error(f"Error fetching user stats for{anonymize_username(username)}: {e}")
         traceback.print_exc()
-        return jsonify(error="An internal error occurred"), 500
+        return json_response(error="An internal error occurred"), 500
+
+# Coach/admin views: stats for many users from one aggregation per chunk of usernames
+MAX_BATCH_USERS = int(os.getenv('MAX_BATCH_USERS', 1000))
+BATCH_STATS_CHUNK = 100
+
+
+def iter_batch_stats(usernames, start_date=None, end_date=None):
+    """Yield (username, exercises) in request order, one aggregation per chunk"""
+    for i in range(0, len(usernames), BATCH_STATS_CHUNK):
+        chunk = usernames[i:i + BATCH_STATS_CHUNK]
+        found = {row["username"]: row["exercises"]
+                 for row in stats_collection().aggregate(batch_stats_pipeline(chunk, start_date, end_date))}
+        for username in chunk:
+            yield username, found.get(username, [])
+
+
+def log_batch_error(e):
+    logging.error(f"Error streaming batch stats: {e}")
+    traceback.print_exc()
+
+
+@app.post('/stats/batch')
+@token_required
+def batch_stats():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        body = {}
+    usernames = body.get('usernames')
+    if not isinstance(usernames, list) or not usernames \
+            or not all(isinstance(u, str) and u for u in usernames):
+        return json_response(error="usernames must be a non-empty list of usernames"), 400
+    usernames = list(dict.fromkeys(usernames))
+    if len(usernames) > MAX_BATCH_USERS:
+        return json_response(error=f"at most {MAX_BATCH_USERS} usernames per request"), 400
+
+    start_date = end_date = None
+    if body.get('start') or body.get('end'):
+        try:
+            start_date, end_date = parse_day_range(body.get('start'), body.get('end'))
+        except (TypeError, ValueError):
+            return json_response(error="start and end must both be YYYY-MM-DD"), 400
+
+    results = iter_batch_stats(usernames, start_date, end_date)
+    if request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson':
+        lines = ({"username": username, "exercises": exercises} for username, exercises in results)
+        return streamed_response(stream_ndjson(lines, on_error=log_batch_error), 'application/x-ndjson')
+
+    def body_chunks():
+        yield b'{"stats":'
+        if (yield from stream_json_object(results, batch_size=BATCH_STATS_CHUNK, on_error=log_batch_error)):
+            yield b'}'
+    return streamed_response(body_chunks())
+
 
 # Fetch total duration aggregated by day for the last 7 days
 @app.route('/stats/daily_trend/<username>', methods=['GET'])
 @token_required
+@conditional
 def daily_trend_stats(username):
-    # Calculate the start date (7 days ago)
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=6)
-    
-    # Normalize start_date to the beginning of the day for accurate matching
-    start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    # 1. Match: Filter by user and last 7 days
-    # 2. Group: Aggregate duration by the date of the exercise
-    # 3. Sort: Order the data chronologically
-    pipeline = [
-        {
-            "$match": {
-                "username": username,
-                "date": {
-                    "$gte": start_date,
-                    "$lte": end_date
-                }
-            }
-        },
-        {
-            "$group": {
-                "_id": { 
-                    "dayOfWeek": {"$dayOfWeek": "$date"},
-                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}
-                },
-                "totalDuration": {"$sum": "$duration"}
-            }
-        },
-        {
-            "$sort": {"_id.date": 1}
-        },
-        {
-            "$project": {
-                "_id": 0,
-                # Map MongoDB's day index (1=Sun, 2=Mon) to a name and use 'Duration' key for Recharts
-                "name": {
-                    "$switch": {
-                        "branches": [
-                            {"case": {"$eq": ["$_id.dayOfWeek", 2]}, "then": "Mon"},
-                            {"case": {"$eq": ["$_id.dayOfWeek", 3]}, "then": "Tue"},
-                            {"case": {"$eq": ["$_id.dayOfWeek", 4]}, "then": "Wed"},
-                            {"case": {"$eq": ["$_id.dayOfWeek", 5]}, "then": "Thu"},
-                            {"case": {"$eq": ["$_id.dayOfWeek", 6]}, "then": "Fri"},
-                            {"case": {"$eq": ["$_id.dayOfWeek", 7]}, "then": "Sat"},
-                            {"case": {"$eq": ["$_id.dayOfWeek", 1]}, "then": "Sun"}
-                        ],
-                        "default": "Unknown"
-                    }
-                },
-                "Duration": "$totalDuration",
-                "date": "$_id.date"
-            }
-        }
-    ]
-
     try:
-        stats = list(db.exercises.aggregate(pipeline))
-        
-        date_data = {item['date']: item for item in stats}
-        full_range = []
-        current = start_date
-        
-        while current <= end_date:
-            date_str = current.strftime("%Y-%m-%d")
-            day_name = current.strftime("%a")
-            
-            if date_str in date_data:
-                full_range.append(date_data[date_str])
-            else:
-                full_range.append({
-                    "name": day_name,
-                    "Duration": 0,
-                    "date": date_str
-                })
-            current += timedelta(days=1)
-            
-        return jsonify(trend=full_range)
+        stats = list(stats_collection().aggregate(daily_trend_pipeline(username)))
+        return json_response(trend=stats)
     except Exception as e:
         logging.error(f"An error occurred while querying MongoDB: {e}")
         traceback.print_exc()
-        return jsonify(error="An internal error occurred"), 500
-    
+        return json_response(error="An internal error occurred"), 500
+
+
+# Duration per day/week/month over any range, bucketed and gap-filled by MongoDB
+@app.route('/stats/series/<username>', methods=['GET'])
+@token_required
+@conditional
+def series_stats(username):
+    try:
+        granularity, start_day, end_day, tz = parse_series_args(request.args.get('granularity'),
+                                                                request.args.get('start'),
+                                                                request.args.get('end'),
+                                                                request.args.get('tz'))
+    except ValueError as e:
+        return json_response(error=str(e)), 400
+
+    try:
+        stats = list(stats_collection().aggregate(series_pipeline(username, granularity, start_day, end_day, tz)))
+        return json_response(series=stats)
+    except Exception as e:
+        logging.error(f"Error fetching series for {anonymize_username(username)}: {e}")
+        traceback.print_exc()
+        return json_response(error="An internal error occurred"), 500
+
+
+# Streaks, rolling 7/28-day load, acute:chronic ratio and week-over-week change
+@app.route('/stats/insights/<username>', methods=['GET'])
+@token_required
+@conditional
+def insights_stats(username):
+    try:
+        today = datetime.now(timezone.utc).date().toordinal()
+        return json_response(insights=insights_cache.summary(username, today))
+    except Exception as e:
+        logging.error(f"Error computing insights for {anonymize_username(username)}: {e}")
+        traceback.print_exc()
+        return json_response(error="An internal error occurred"), 500
+
 
 @app.route('/stats/weekly/', methods=['GET'])
 @token_required
+@conditional
 def weekly_journal_stats():
     username = request.args.get('user')
     start_date_str = request.args.get('start')
     end_date_str = request.args.get('end')
-    date_format = "%Y-%m-%d"
 
     if not all([username, start_date_str, end_date_str]):
-        return jsonify(error="Missing required parameters: user, start, end"), 400
+        return json_response(error="Missing required parameters: user, start, end"), 400
 
     try:
-        start_date = datetime.strptime(start_date_str, date_format)
-        end_date = datetime.strptime(end_date_str, date_format) + timedelta(days=1)
+        start_date, end_date = parse_day_range(start_date_str, end_date_str)
     except Exception as e:
         logging.error(f"Error parsing dates for weekly journal: {e}")
-        return jsonify(error="Invalid date format"), 400
-
-    pipeline = [
-        {
-            "$match": {
-                "username": username,
-                "date": {
-                    "$gte": start_date,
-                    "$lt": end_date
-                }
-            }
-        },
-        {
-            "$group": {
-                "_id": {
-                    "exerciseType": "$exerciseType"
-                },
-                "totalDuration": {"$sum": "$duration"}
-            }
-        },
-        {
-            "$project": {
-                "exerciseType": "$_id.exerciseType",
-                "totalDuration": 1,
-                "_id": 0
-            }
-        }
-    ]
+        return json_response(error="Invalid date format"), 400
 
     try:
-        stats = list(db.exercises.aggregate(pipeline))
-        return jsonify(stats=stats)
+        if activity_cache is not None:
+            activities = activity_cache.get(username)
+            stats = [{"exerciseType": exercise_type, "totalDuration": total}
+                     for exercise_type, total, _ in activities.by_type(start_date.toordinal(), end_date.toordinal())]
+        else:
+            stats = list(stats_collection().aggregate(weekly_journal_pipeline(username, start_date, end_date)))
+        return json_response(stats=stats)
     except Exception as e:
         logging.error(f"An error occurred while querying MongoDB for weekly journal: {e}")
         traceback.print_exc()
-        return jsonify(error="An internal error occurred"), 500
+        return json_response(error="An internal error occurred"), 500
 
 
-# Utility function to get the start of the current week (Monday)
-def get_start_of_week():
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    # Python's weekday() returns 0 for Monday, 6 for Sunday
-    start_of_week = today - timedelta(days=today.weekday())
-    return start_of_week
+# Totals, 7-day trend and weekly journal in one round trip for the statistics page
+@app.route('/stats/dashboard/<username>', methods=['GET'])
+@token_required
+@conditional
+def dashboard_stats(username):
+    try:
+        week_start, week_end = dashboard_week(request.args.get('start'), request.args.get('end'))
+    except ValueError:
+        return json_response(error="start and end must both be YYYY-MM-DD"), 400
+
+    try:
+        today = datetime.now(timezone.utc).date()
+        result = list(stats_collection().aggregate(dashboard_pipeline(username, week_start, week_end, today)))[0]
+        return json_response(stats=result["stats"], trend=daily_trend_points(result["trend"], today),
+                             weekly=result["weekly"])
+    except Exception as e:
+        logging.error(f"Error fetching dashboard stats for {anonymize_username(username)}: {e}")
+        traceback.print_exc()
+        return json_response(error="An internal error occurred"), 500
 
 
 @app.route('/api/activities/range', methods=['GET']) # Handles the URL with the slash
 @token_required
+@conditional
 def get_activities_by_range():
     username = request.args.get('user')
     start_date_str = request.args.get('start')
     end_date_str = request.args.get('end')
 
     if not all([username, start_date_str, end_date_str]):
-        return jsonify(error="Missing required query parameters: user, start, end"), 400
+        return json_response(error="Missing required query parameters: user, start, end"), 400
 
     try:
-        start_date = datetime.strptime(start_date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-        end_date = datetime.strptime(end_date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
-
+        start_date, end_date = parse_day_range(start_date_str, end_date_str, tzinfo=timezone.utc)
     except Exception:
-        return jsonify(error="Invalid date format. Use YYYY-MM-DD."), 400
-
-    query = {
-        "username": username,
-        "date": {"$gte": start_date, "$lt": end_date}
-    }
+        return json_response(error="Invalid date format. Use YYYY-MM-DD."), 400
 
     try:
         # sort newest first
-        activities_list = list(db.exercises.find(query).sort("date", -1))
-
-        uk = ZoneInfo("Europe/London")
-        out = []
-        for a in activities_list:
-            # group date
-            dt = a.get("date")
-            if isinstance(dt, datetime):
-                date_str = dt.astimezone(uk).strftime("%Y-%m-%d")
-            else:
-                date_str = a["_id"].generation_time.replace(tzinfo=timezone.utc).astimezone(uk).strftime("%Y-%m-%d")
-
-            created = a.get("created_at")
-            if not isinstance(created, datetime):
-                # For old records without created_at, derive from ObjectId and UPDATE the record
-                created = a["_id"].generation_time.replace(tzinfo=timezone.utc)
-                # Store it permanently so we don't recalculate next time
-                db.exercises.update_one(
-                    {"_id": a["_id"]},
-                    {"$set": {"created_at": created}}
-                )
-                
-            time_str = created.astimezone(uk).strftime("%H:%M")
-
-            out.append({
-                "id": str(a["_id"]),
-                "username": a.get("username"),
-                "date": date_str,
-                "time": time_str,
-                "activityType": a.get("exerciseType"),
-                "duration": a.get("duration"),
-                "comments": a.get("description", ""),
-                "createdAt": created.isoformat()
-            })
-
-        return jsonify(out)
+        activities_list = db.exercises.find(range_query(username, start_date, end_date)).sort("date", -1)
+        return json_response([format_activity(a) for a in activities_list])
     except Exception as e:
         logging.error(f"activities/range error: {e}")
         traceback.print_exc()
-        return jsonify(error="An internal server error occurred"), 500
+        return json_response(error="An internal server error occurred"), 500
+
+
+@app.route('/api/activities/export', methods=['GET'])
+@token_required
+def export_activities():
+    username = request.args.get('user')
+    fmt = request.args.get('format', 'csv')
+
+    if not username:
+        return json_response(error="Missing required query parameter: user"), 400
+    if fmt not in EXPORT_FORMATS:
+        return json_response(error=f"format must be one of: {', '.join(EXPORT_FORMATS)}"), 400
+    if not export_available(fmt):
+        return json_response(error=f"{fmt} export is not available on this server"), 501
+
+    try:
+        export = build_export(db, username, fmt, data_versions)
+    except Exception as e:
+        logging.error(f"Error exporting activities for {anonymize_username(username)}: {e}")
+        traceback.print_exc()
+        return json_response(error="An internal error occurred"), 500
+
+    filename = f"{username}-activities.{EXPORT_FORMATS[fmt]['extension']}"
+    return Response(iter_file(export), mimetype=EXPORT_FORMATS[fmt]["mimetype"], headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Content-Length": str(export_size(export)),
+    })
 
 
 @app.route('/api/activities/<activity_id>', methods=['PATCH'])
@@ -387,31 +486,29 @@ def update_activity_comment(activity_id):
         body = request.get_json(silent=True) or {}
         comments = body.get('comments', body.get('description'))
         if comments is None:
-            return jsonify(error="comments is required"), 400
+            return json_response(error="comments is required"), 400
 
-        ors = []
-        try:
-            ors.append({'_id': ObjectId(activity_id)})
-        except Exception:
-            pass
-        ors.append({'_id': activity_id})   # in case _id is stored as string
-        ors.append({'id': activity_id})    # in case 'id' field is used
-
-        query = {'$or': ors}
+        query = activity_id_query(activity_id)
 
-        result = db.exercises.update_one(query, {'$set': {'description': comments}})
-        app.logger.info(
-            f"PATCH /api/activities/{activity_id} matched={result.matched_count} modified={result.modified_count}"
-        )
+        # find_one_and_update so we learn whose cached activities to drop
+        updated = db.exercises.find_one_and_update(query, {'$set': {'description': comments,
+                                                                    'updated_at': datetime.now(timezone.utc)}},
+                                                   projection={'username': 1})
+        app.logger.info(f"PATCH /api/activities/{activity_id} matched={int(updated is not None)}")
 
-        if result.matched_count == 0:
-            return jsonify(error="activity not found", tried=query), 404
+        if updated is None:
+            return json_response(error="activity not found", tried=query), 404
+        if activity_cache is not None:
+            activity_cache.invalidate(updated.get('username'))
+        if updated.get('username'):
+            # A note doesn't change insights, so they needn't be dropped on the next read
+            data_versions.written(updated['username'], bump_user(db, updated['username']))
 
-        return jsonify(ok=True)
+        return json_response(ok=True)
     except Exception as e:
         logging.error(f"Error updating activity note: {e}")
         traceback.print_exc()
-        return jsonify(error="internal error"), 500
+        return json_response(error="internal error"), 500
 
 
 @app.post("/api/activities")
@@ -419,44 +516,116 @@ def update_activity_comment(activity_id):
 def create_activity():
     body = request.get_json(force=True)
 
-    username = body.get("username")
-    exerciseType = body.get("exerciseType")
-    description = body.get("description", "")
-    duration = body.get("duration", 0)
-    date_in = body.get("date") # expected in ISO format or "YYYY-MM-DD"
+    doc, error = normalise_activity(body)
+    if error:
+        return json_response(error=error), 400
 
-    if not all([username, exerciseType, date_in]):
-        return jsonify(error="username, exerciseType and date are required"), 400
+    db.exercises.insert_one(doc)
+    if activity_cache is not None:
+        activity_cache.invalidate(doc["username"])
+    insights_cache.record(doc["username"], doc["date"].toordinal(), doc["duration"])
+    # Bumped after the insights are patched, and reported as this process's own
+    # write so the next conditional GET keeps the patched entry
+    data_versions.written(doc["username"], bump_user(db, doc["username"]))
+    return json_response(ok=True)
 
-    # normalise the chosen calendar date to midnight UTC
-    if isinstance(date_in, str):
-        # accepts "YYYY-MM-DD" or ISO
+
+# Bulk ingest writes this many documents per insert_many call
+BULK_CHUNK_SIZE = 1000
+# Only the first errors are echoed back, the total is always reported
+MAX_REPORTED_ERRORS = 1000
+
+
+@app.post("/api/activities/bulk")
+@token_required
+def bulk_create_activities():
+    """Insert activities from an NDJSON body, one activity per line"""
+    inserted = 0
+    failed = 0
+    errors = []
+    chunk = []  # (line number, document)
+
+    def report(line, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line, "error": message})
+
+    def flush():
+        nonlocal inserted
         try:
-            if len(date_in) == 10:
-                dt = datetime.strptime(date_in, "%Y-%m-%d")
-            else:
-                dt = datetime.fromisoformat(date_in.replace("Z", "+00:00"))
-        except Exception:
-            return jsonify(error="date must be YYYY-MM-DD or ISO"), 400
-    else:
-        dt = datetime.timezone.utc.localize()
-
-    date_utc = dt.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
-
-    doc = {
-        "username": username,
-        "exerciseType": exerciseType,
-        "description": description,
-        "duration": int(duration),
-        "date": date_utc,
-        # fixed time of logging set by the server once
-        "created_at": datetime.now(timezone.utc),
-    }
+            # unordered so one bad document doesn't stop the rest of the chunk
+            result = db.exercises.insert_many([doc for _, doc in chunk], ordered=False)
+            inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            inserted += e.details.get("nInserted", 0)
+            for write_error in e.details.get("writeErrors", []):
+                report(chunk[write_error["index"]][0], write_error.get("errmsg", "write failed"))
+        usernames = {doc["username"] for _, doc in chunk}
+        bump_versions(db, *usernames)
+        if activity_cache is not None:
+            activity_cache.invalidate(*usernames)
+        insights_cache.forget(*usernames)
+        chunk.clear()
 
-    db.exercises.insert_one(doc)
-    return jsonify(ok=True)
+    try:
+        for line_no, raw in enumerate(request.stream, start=1):
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                body = json.loads(raw)
+            except ValueError:
+                report(line_no, "invalid JSON")
+                continue
+            if not isinstance(body, dict):
+                report(line_no, "each line must be a JSON object")
+                continue
+
+            doc, error = normalise_activity(body)
+            if error:
+                report(line_no, error)
+                continue
+
+            chunk.append((line_no, doc))
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                flush()
+
+        if chunk:
+            flush()
+    except Exception as e:
+        logging.error(f"Error during bulk activity ingest: {e}")
+        traceback.print_exc()
+        return json_response(error="An internal error occurred", inserted=inserted), 500
+
+    return json_response(ok=failed == 0, inserted=inserted, failed=failed, errors=errors)
+
+
+@app.route('/admin/indexes', methods=['GET'])
+@admin_required
+def admin_indexes():
+    try:
+        return json_response(index_report(db))
+    except Exception as e:
+        logging.error(f"Error building index report: {e}")
+        traceback.print_exc()
+        return json_response(error="An internal error occurred"), 500
+
+
+@app.route('/admin/token-cache', methods=['GET'])
+@admin_required
+def admin_token_cache():
+    return json_response(token_cache.stats())
+
+
+@app.route('/admin/activity-cache', methods=['GET'])
+@admin_required
+def admin_activity_cache():
+    if activity_cache is None:
+        return json_response(enabled=False)
+    return json_response(enabled=True, **activity_cache.stats())
 
 
 if __name__ == "__main__":
 
-    app.run(debug=True, host='0.0.0.0', port=5050)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5050)
@@ -0,0 +1,444 @@
+"""
+Asyncio serving mode for the analytics API.
+
+Serves the read-only stats routes of app.py (/stats, /stats/<username>,
+/stats/daily_trend, /stats/series, /stats/insights, /stats/weekly/,
+/stats/dashboard and POST /stats/batch), /api/activities/range, activity
+creation and comment edits, /health and /metrics, with the same paths and
+response shapes, but on Starlette with the Motor driver, so one worker process
+keeps many aggregations in flight instead of blocking on each one:
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5050
+
+The admin reports, the full collection dump, bulk ingest and file exports
+stay on the Flask app (app.py), which remains the default deployment.
+"""
+import hashlib
+import logging
+import os
+import traceback
+from datetime import datetime, timezone
+from functools import wraps
+
+import jwt
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse as StarletteJSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+from chat_context import daily_load_pipeline, daily_load_rows
+from encoding import dumps, ERROR_LINE, MIN_COMPRESS_SIZE
+from insights import TrainingLoad
+from queries import (stats_pipeline, batch_stats_pipeline, parse_series_args, series_pipeline,
+                     daily_trend_pipeline, daily_trend_points, parse_day_range, weekly_journal_pipeline,
+                     dashboard_week, dashboard_pipeline, range_query, format_activity, activity_id_query,
+                     normalise_activity)
+from rollups import ROLLUP_COLLECTION
+from data_versions import VERSIONS_COLLECTION, AsyncDataVersions, bump_ops
+from token_cache import TokenCache
+
+load_dotenv()
+mongo_uri = os.getenv('MONGO_URI')
+mongo_db = os.getenv('MONGO_DB')
+JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
+ROLLUPS_ENABLED = os.getenv('ROLLUPS_ENABLED', 'false').lower() == 'true'
+MAX_BATCH_USERS = int(os.getenv('MAX_BATCH_USERS', 1000))
+BATCH_STATS_CHUNK = 100
+
+client = AsyncIOMotorClient(mongo_uri, event_listeners=metrics.mongo_event_listeners())
+db = client[mongo_db]
+token_cache = TokenCache(max_size=int(os.getenv('TOKEN_CACHE_SIZE', 1024)))
+
+
+def anonymize_username(username):
+    """Anonymize username for logging purposes"""
+    if not username:
+        return "unknown"
+    hash_object = hashlib.md5(username.encode())
+    return f"user_{hash_object.hexdigest()[:8]}"
+
+
+class JSONResponse(StarletteJSONResponse):
+    """Starlette's JSONResponse, encoded with the shared fast encoder"""
+
+    def render(self, content):
+        return dumps(content)
+
+
+def stats_collection():
+    return db[ROLLUP_COLLECTION] if ROLLUPS_ENABLED else db.exercises
+
+
+def error(message, status):
+    return JSONResponse({"error": message}, status_code=status)
+
+
+def decode_token(token):
+    claims = token_cache.get(token)
+    if claims is None:
+        claims = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
+        token_cache.put(token, claims)
+    return claims
+
+
+# JWT verification
+def token_required(handler):
+    @wraps(handler)
+    async def decorated(request):
+        if request.method == 'OPTIONS':
+            return Response("", status_code=200)
+
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            return error('Missing token', 401)
+
+        try:
+            token = auth_header.split(' ')[1]
+            request.state.user = decode_token(token)
+        except jwt.ExpiredSignatureError:
+            return error('Token expired', 401)
+        except jwt.InvalidTokenError:
+            return error('Invalid token', 401)
+
+        return await handler(request)
+    return decorated
+
+
+# Same versions and tags as the Flask app's conditional GETs
+data_versions = AsyncDataVersions(db)
+
+
+def if_none_match_tags(request):
+    """Opaque tags of If-None-Match, without W/ prefixes or -br/-gzip suffixes"""
+    tags = request.headers.get('if-none-match', '')
+    return {tag.strip().removeprefix('W/').strip('"').split('-')[0] for tag in tags.split(',') if tag.strip()}
+
+
+def conditional(handler):
+    """Serve a per-user GET with an ETag, answering a matching If-None-Match with 304"""
+    @wraps(handler)
+    async def decorated(request):
+        username = request.path_params.get('username') or request.query_params.get('user')
+        if request.method != 'GET' or not username:
+            return await handler(request)
+        try:
+            # Default windows end today, so the date is part of the representation
+            key = f"{request.url.path}?{request.url.query}:{datetime.now(timezone.utc).date()}"
+            etag = await data_versions.etag(username, key)
+        except Exception as e:
+            logging.error(f"Error reading data version: {e}")
+            etag = None
+        if etag is None:
+            return await handler(request)
+
+        # Weak, since GZipMiddleware compresses after the tag is set
+        headers = {'ETag': f'W/"{etag}"', 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if etag in if_none_match_tags(request):
+            return Response(status_code=304, headers=headers)
+
+        response = await handler(request)
+        if response.status_code == 200:
+            response.headers.update(headers)
+        return response
+    return decorated
+
+
+async def bump_versions(*usernames):
+    """Keep the Flask app's ETags honest about writes made here"""
+    ops = bump_ops(usernames)
+    if ops:
+        await db[VERSIONS_COLLECTION].bulk_write(ops, ordered=False)
+
+
+async def aggregate(collection, pipeline):
+    return await collection.aggregate(pipeline).to_list(length=None)
+
+
+async def health_check(request):
+    return JSONResponse({"status": "healthy", "timestamp": datetime.now().isoformat()})
+
+
+async def prometheus_metrics(request):
+    return Response(metrics.latest(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+
+@token_required
+async def stats(request):
+    try:
+        return JSONResponse({"stats": await aggregate(stats_collection(), stats_pipeline())})
+    except Exception as e:
+        logging.error(f"Error fetching all stats: {e}")
+        traceback.print_exc()
+        return error("An internal error occurred", 500)
+
+
+@token_required
+@conditional
+async def user_stats(request):
+    username = request.path_params['username']
+    try:
+        stats = await aggregate(stats_collection(), stats_pipeline({"username": username}))
+        return JSONResponse({"stats": stats})
+    except Exception as e:
+        logging.error(f"Error fetching user stats for{anonymize_username(username)}: {e}")
+        traceback.print_exc()
+        return error("An internal error occurred", 500)
+
+
+async def iter_batch_stats(usernames, start_date=None, end_date=None):
+    """Yield [(username, exercises)] in request order, one aggregation per chunk"""
+    for i in range(0, len(usernames), BATCH_STATS_CHUNK):
+        chunk = usernames[i:i + BATCH_STATS_CHUNK]
+        found = {row["username"]: row["exercises"]
+                 for row in await aggregate(stats_collection(), batch_stats_pipeline(chunk, start_date, end_date))}
+        yield [(username, found.get(username, [])) for username in chunk]
+
+
+async def batch_stats_chunks(results, ndjson):
+    """Encode batch results a chunk at a time; cut short on error like the Flask app's streams"""
+    if not ndjson:
+        yield b'{"stats":{'
+    first = True
+    try:
+        async for rows in results:
+            if ndjson:
+                yield b"".join(dumps({"username": username, "exercises": exercises}) + b"\n"
+                               for username, exercises in rows)
+            else:
+                yield (b"" if first else b",") + b",".join(dumps(username) + b":" + dumps(exercises)
+                                                           for username, exercises in rows)
+                first = False
+    except Exception as e:
+        logging.error(f"Error streaming batch stats: {e}")
+        traceback.print_exc()
+        if ndjson:
+            yield ERROR_LINE
+        return
+    if not ndjson:
+        yield b'}}'
+
+
+@token_required
+async def batch_stats(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        body = {}
+    if not isinstance(body, dict):
+        body = {}
+    usernames = body.get('usernames')
+    if not isinstance(usernames, list) or not usernames \
+            or not all(isinstance(u, str) and u for u in usernames):
+        return error("usernames must be a non-empty list of usernames", 400)
+    usernames = list(dict.fromkeys(usernames))
+    if len(usernames) > MAX_BATCH_USERS:
+        return error(f"at most {MAX_BATCH_USERS} usernames per request", 400)
+
+    start_date = end_date = None
+    if body.get('start') or body.get('end'):
+        try:
+            start_date, end_date = parse_day_range(body.get('start'), body.get('end'))
+        except (TypeError, ValueError):
+            return error("start and end must both be YYYY-MM-DD", 400)
+
+    ndjson = request.query_params.get('format') == 'ndjson' \
+        or request.headers.get('accept', '').startswith('application/x-ndjson')
+    chunks = batch_stats_chunks(iter_batch_stats(usernames, start_date, end_date), ndjson)
+    return StreamingResponse(chunks, media_type='application/x-ndjson' if ndjson else 'application/json')
+
+
+@token_required
+@conditional
+async def daily_trend_stats(request):
+    username = request.path_params['username']
+    try:
+        return JSONResponse({"trend": await aggregate(stats_collection(), daily_trend_pipeline(username))})
+    except Exception as e:
+        logging.error(f"An error occurred while querying MongoDB: {e}")
+        traceback.print_exc()
+        return error("An internal error occurred", 500)
+
+
+@token_required
+@conditional
+async def series_stats(request):
+    username = request.path_params['username']
+    params = request.query_params
+    try:
+        granularity, start_day, end_day, tz = parse_series_args(params.get('granularity'), params.get('start'),
+                                                                params.get('end'), params.get('tz'))
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        stats = await aggregate(stats_collection(), series_pipeline(username, granularity, start_day, end_day, tz))
+        return JSONResponse({"series": stats})
+    except Exception as e:
+        logging.error(f"Error fetching series for {anonymize_username(username)}: {e}")
+        traceback.print_exc()
+        return error("An internal error occurred", 500)
+
+
+@token_required
+@conditional
+async def insights_stats(request):
+    username = request.path_params['username']
+    try:
+        today = datetime.now(timezone.utc).date().toordinal()
+        rows = daily_load_rows(await aggregate(db.exercises, daily_load_pipeline(username)))
+        return JSONResponse({"insights": TrainingLoad.from_days(rows, today).summary(today)})
+    except Exception as e:
+        logging.error(f"Error computing insights for {anonymize_username(username)}: {e}")
+        traceback.print_exc()
+        return error("An internal error occurred", 500)
+
+
+@token_required
+@conditional
+async def weekly_journal_stats(request):
+    username = request.query_params.get('user')
+    start_date_str = request.query_params.get('start')
+    end_date_str = request.query_params.get('end')
+
+    if not all([username, start_date_str, end_date_str]):
+        return error("Missing required parameters: user, start, end", 400)
+
+    try:
+        start_date, end_date = parse_day_range(start_date_str, end_date_str)
+    except Exception as e:
+        logging.error(f"Error parsing dates for weekly journal: {e}")
+        return error("Invalid date format", 400)
+
+    try:
+        stats = await aggregate(stats_collection(), weekly_journal_pipeline(username, start_date, end_date))
+        return JSONResponse({"stats": stats})
+    except Exception as e:
+        logging.error(f"An error occurred while querying MongoDB for weekly journal: {e}")
+        traceback.print_exc()
+        return error("An internal error occurred", 500)
+
+
+@token_required
+@conditional
+async def dashboard_stats(request):
+    username = request.path_params['username']
+    try:
+        week_start, week_end = dashboard_week(request.query_params.get('start'), request.query_params.get('end'))
+    except ValueError:
+        return error("start and end must both be YYYY-MM-DD", 400)
+
+    try:
+        today = datetime.now(timezone.utc).date()
+        result = (await aggregate(stats_collection(), dashboard_pipeline(username, week_start, week_end, today)))[0]
+        return JSONResponse({"stats": result["stats"], "trend": daily_trend_points(result["trend"], today),
+                             "weekly": result["weekly"]})
+    except Exception as e:
+        logging.error(f"Error fetching dashboard stats for {anonymize_username(username)}: {e}")
+        traceback.print_exc()
+        return error("An internal error occurred", 500)
+
+
+@token_required
+@conditional
+async def get_activities_by_range(request):
+    username = request.query_params.get('user')
+    start_date_str = request.query_params.get('start')
+    end_date_str = request.query_params.get('end')
+
+    if not all([username, start_date_str, end_date_str]):
+        return error("Missing required query parameters: user, start, end", 400)
+
+    try:
+        start_date, end_date = parse_day_range(start_date_str, end_date_str, tzinfo=timezone.utc)
+    except Exception:
+        return error("Invalid date format. Use YYYY-MM-DD.", 400)
+
+    try:
+        cursor = db.exercises.find(range_query(username, start_date, end_date)).sort("date", -1)
+        return JSONResponse([format_activity(a) async for a in cursor])
+    except Exception as e:
+        logging.error(f"activities/range error: {e}")
+        traceback.print_exc()
+        return error("An internal server error occurred", 500)
+
+
+@token_required
+async def update_activity_comment(request):
+    activity_id = request.path_params['activity_id']
+    try:
+        try:
+            body = await request.json()
+        except ValueError:
+            body = {}
+        if not isinstance(body, dict):
+            body = {}
+        comments = body.get('comments', body.get('description'))
+        if comments is None:
+            return error("comments is required", 400)
+
+        query = activity_id_query(activity_id)
+        updated = await db.exercises.find_one_and_update(
+            query, {'$set': {'description': comments, 'updated_at': datetime.now(timezone.utc)}},
+            projection={'username': 1})
+        logging.info(f"PATCH /api/activities/{activity_id} matched={int(updated is not None)}")
+
+        if updated is None:
+            return JSONResponse({"error": "activity not found", "tried": query}, status_code=404)
+        await bump_versions(updated.get('username'))
+
+        return JSONResponse({"ok": True})
+    except Exception as e:
+        logging.error(f"Error updating activity note: {e}")
+        traceback.print_exc()
+        return error("internal error", 500)
+
+
+@token_required
+async def create_activity(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return error("request body must be JSON", 400)
+
+    doc, message = normalise_activity(body if isinstance(body, dict) else {})
+    if message:
+        return error(message, 400)
+
+    await db.exercises.insert_one(doc)
+    await bump_versions(doc["username"])
+    return JSONResponse({"ok": True})
+
+
+routes = [
+    Route('/health', health_check, methods=['GET']),
+    Route('/metrics', prometheus_metrics, methods=['GET']),
+    Route('/stats', stats, methods=['GET', 'OPTIONS']),
+    Route('/stats/batch', batch_stats, methods=['POST', 'OPTIONS']),
+    Route('/stats/daily_trend/{username}', daily_trend_stats, methods=['GET', 'OPTIONS']),
+    Route('/stats/insights/{username}', insights_stats, methods=['GET', 'OPTIONS']),
+    Route('/stats/weekly/', weekly_journal_stats, methods=['GET', 'OPTIONS']),
+    Route('/stats/dashboard/{username}', dashboard_stats, methods=['GET', 'OPTIONS']),
+    Route('/stats/series/{username}', series_stats, methods=['GET', 'OPTIONS']),
+    Route('/stats/{username}', user_stats, methods=['GET', 'OPTIONS']),
+    Route('/api/activities/range', get_activities_by_range, methods=['GET', 'OPTIONS']),
+    Route('/api/activities/{activity_id}', update_activity_comment, methods=['PATCH', 'OPTIONS']),
+    Route('/api/activities', create_activity, methods=['POST', 'OPTIONS']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware,
+                   allow_origins=["*"],
+                   allow_methods=["GET", "HEAD", "POST", "OPTIONS", "PUT", "PATCH", "DELETE"],
+                   allow_headers=["*"],
+                   expose_headers=["X-Next-After", "ETag"]),
+        Middleware(GZipMiddleware, minimum_size=MIN_COMPRESS_SIZE),
+        Middleware(metrics.RequestMetrics, service="analytics", routes=routes),
+    ],
+)
@@ -0,0 +1,102 @@
+"""
+Backfill ``created_at`` on exercises that were logged before the analytics
+service started recording it, using the ObjectId generation time.
+
+Usage:
+    python backfill_created_at.py [--batch-size 500] [--sleep 0.2] [--restart]
+
+Progress is checkpointed in the ``migrations`` collection after every batch,
+so an interrupted run picks up where it left off.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import PyMongoError
+
+CHECKPOINT_COLLECTION = "migrations"
+MIGRATION_ID = "backfill_created_at"
+
+logger = logging.getLogger("backfill_created_at")
+
+
+def backfill(db, batch_size=500, pause=0.2, restart=False):
+    """Set created_at in _id order, one bulk_write per batch"""
+    checkpoints = db[CHECKPOINT_COLLECTION]
+    state = {} if restart else (checkpoints.find_one({"_id": MIGRATION_ID}) or {})
+    last_id = state.get("last_id")
+    updated = state.get("updated", 0)
+
+    if last_id is not None:
+        logger.info("Resuming after %s (%d already updated)", last_id, updated)
+
+    missing = {"created_at": {"$not": {"$type": "date"}}}
+    while True:
+        query = dict(missing, _id={"$type": "objectId"})
+        if last_id is not None:
+            query["_id"] = {"$type": "objectId", "$gt": last_id}
+
+        batch = list(db.exercises.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        ops = [
+            # Re-check the filter so records written since the read are left alone
+            UpdateOne(dict(missing, _id=doc["_id"]), {"$set": {"created_at": doc["_id"].generation_time}})
+            for doc in batch
+        ]
+        result = db.exercises.bulk_write(ops, ordered=False)
+        updated += result.modified_count
+        last_id = batch[-1]["_id"]
+
+        checkpoints.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"last_id": last_id, "updated": updated, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        logger.info("Backfilled %d records (up to %s)", updated, last_id)
+
+        # Throttle so the migration doesn't starve the live services
+        if pause:
+            time.sleep(pause)
+
+    checkpoints.update_one(
+        {"_id": MIGRATION_ID},
+        {"$set": {"completed_at": datetime.now(timezone.utc), "updated": updated}},
+        upsert=True,
+    )
+    return updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill created_at from ObjectId generation time")
+    parser.add_argument("--batch-size", type=int, default=500, help="records per bulk_write")
+    parser.add_argument("--sleep", type=float, default=0.2, help="seconds to pause between batches")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGO_URI'))
+    db = client[os.getenv('MONGO_DB')]
+
+    try:
+        updated = backfill(db, batch_size=args.batch_size, pause=args.sleep, restart=args.restart)
+    except KeyboardInterrupt:
+        logger.info("Interrupted, re-run to resume from the last checkpoint")
+        return 1
+    except PyMongoError as e:
+        logger.error("Backfill failed: %s", e)
+        return 1
+
+    logger.info("Done, %d records updated", updated)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Per-request cost of a user's per-type totals and 7-day sum: building them from
+fetched documents in Python versus the cached NumPy columns.
+
+The MongoDB round trip is left out, so this measures only the Python work each
+request saves once the user's activities are cached.
+
+Usage:
+    python benchmarks/bench_activity_cache.py [--activities 5000] [--requests 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from activity_cache import UserActivities  # noqa: E402
+
+TYPES = ["Running", "Cycling", "Swimming", "Yoga", "Gym", "Walking", "Rowing"]
+
+
+def make_docs(n):
+    start = datetime(2020, 1, 1)
+    return [{"date": start + timedelta(days=random.randrange(1800)),
+             "duration": random.randint(10, 120),
+             "exerciseType": random.choice(TYPES)} for _ in range(n)]
+
+
+def from_documents(docs, week_start):
+    totals = defaultdict(int)
+    week = 0
+    for doc in docs:
+        totals[doc["exerciseType"]] += doc["duration"]
+        if doc["date"] >= week_start:
+            week += doc["duration"]
+    return sorted(totals.items(), key=lambda item: -item[1]), week
+
+
+def from_columns(activities, week_day):
+    return activities.by_type(), activities.total(week_day)
+
+
+def time_per_call(fn, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        fn()
+    return (time.perf_counter() - start) / requests * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--activities", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    docs = make_docs(args.activities)
+    week_start = datetime(2024, 11, 1)
+    activities = UserActivities.from_documents(docs)
+
+    before = time_per_call(lambda: from_documents(docs, week_start), args.requests)
+    after = time_per_call(lambda: from_columns(activities, week_start.toordinal()), args.requests)
+
+    print(f"{args.activities} activities, {activities.nbytes / 1024:.1f} KiB cached")
+    print(f"python loop over documents: {before:9.2f} µs/request")
+    print(f"numpy columns:              {after:9.2f} µs/request")
+    print(f"speed-up:                   {before / after:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Statistics-screen throughput of one analytics process: the Flask app as
+Dockerfile runs it (gunicorn app:app, one sync worker) against the asyncio
+serving mode as Dockerfile.asgi runs it (uvicorn asgi_app:app).
+
+Seeds a throwaway database, starts each server in turn and drives it with the
+clients from load_test.py at each number of concurrent clients. The Flask app
+runs with ACTIVITY_CACHE_MB=0 so both servers answer every request from
+MongoDB and only the serving model differs.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_asgi.py \\
+        [--clients 10 50 100 200] [--duration 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import jwt
+from pymongo import MongoClient
+
+ANALYTICS = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ANALYTICS)
+from benchmarks.bench_chatbot_concurrency import spawn, stop, wait_until_up  # noqa: E402
+from benchmarks.load_test import dashboard_requests, percentile, run_client  # noqa: E402
+
+DB_NAME = "bench_asgi"
+USERS = 50
+PORT = 5063
+SECRET = "bench-secret"
+
+SERVERS = {
+    "flask (gunicorn app:app)": [sys.executable, "-m", "gunicorn", "-b", f"127.0.0.1:{PORT}", "app:app"],
+    "asyncio (uvicorn asgi_app:app)": [sys.executable, "-m", "uvicorn", "asgi_app:app",
+                                       "--port", str(PORT), "--log-level", "warning"],
+}
+
+
+def seed(mongo_uri):
+    db = MongoClient(mongo_uri)[DB_NAME]
+    now = datetime.now()
+    db.exercises.insert_many([
+        {"username": f"user{i % USERS}", "exerciseType": random.choice(["Running", "Cycling", "Yoga", "Swimming"]),
+         "duration": random.randint(10, 90), "date": now - timedelta(days=random.randrange(365))}
+        for i in range(USERS * 500)
+    ])
+    db.exercises.create_index([("username", 1), ("date", -1)])
+
+
+def client_requests(client):
+    return dashboard_requests(f"user{client % USERS}")
+
+
+async def load(base_url, token, clients, duration):
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60,
+                                 headers={"Authorization": f"Bearer {token}"}) as http:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(run_client(http, client_requests(client), deadline, latencies, errors)
+                               for client in range(clients)))
+    return latencies, errors
+
+
+async def main(args):
+    mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+    seed(mongo_uri)
+    env = dict(os.environ, MONGO_URI=mongo_uri, MONGO_DB=DB_NAME, JWT_SECRET_KEY=SECRET, ACTIVITY_CACHE_MB="0")
+    token = jwt.encode({"sub": "bench", "exp": int(time.time()) + 3600}, SECRET, algorithm="HS256")
+    base_url = f"http://127.0.0.1:{PORT}"
+    try:
+        print(f"{args.duration} s per level, requests: /stats/<user>, /stats/daily_trend/<user>, /stats/weekly/")
+        print(f"{'server':32} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for name, command in SERVERS.items():
+            server = spawn(command, env)
+            try:
+                await wait_until_up(base_url + "/health")
+                for clients in args.clients:
+                    latencies, errors = await load(base_url, token, clients, args.duration)
+                    print(f"{name:32} {clients:>7} {len(latencies) / args.duration:>8.1f} "
+                          f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 99) * 1000:>8.1f} "
+                          f"{len(errors):>7}")
+            finally:
+                stop(server)
+    finally:
+        MongoClient(mongo_uri).drop_database(DB_NAME)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--duration", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
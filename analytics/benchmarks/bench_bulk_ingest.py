@@ -0,0 +1,70 @@
+"""
+Ingest throughput of POST /api/activities (one request per activity) against
+POST /api/activities/bulk (one NDJSON body), in documents per second.
+
+Runs the Flask app in-process against a local mongod and writes to a throwaway
+database that is dropped afterwards.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_bulk_ingest.py [--docs 10000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import jwt
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ["MONGO_DB"] = "bench_bulk_ingest"
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import app, client  # noqa: E402
+
+
+def activities(count):
+    for i in range(count):
+        yield {
+            "username": f"bench_user_{i % 50}",
+            "exerciseType": ["Running", "Cycling", "Swimming", "Yoga"][i % 4],
+            "description": "benchmark",
+            "duration": 10 + i % 80,
+            "date": f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}",
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=10000)
+    args = parser.parse_args()
+
+    token = jwt.encode({"sub": "bench", "exp": int(time.time()) + 3600},
+                       os.environ["JWT_SECRET_KEY"], algorithm='HS256')
+    headers = {"Authorization": f"Bearer {token}"}
+    test_client = app.test_client()
+    client.drop_database("bench_bulk_ingest")
+
+    try:
+        start = time.perf_counter()
+        for activity in activities(args.docs):
+            test_client.post("/api/activities", json=activity, headers=headers)
+        single = args.docs / (time.perf_counter() - start)
+
+        body = "\n".join(json.dumps(a) for a in activities(args.docs))
+        start = time.perf_counter()
+        response = test_client.post("/api/activities/bulk", data=body, headers=headers,
+                                    content_type="application/x-ndjson")
+        bulk = args.docs / (time.perf_counter() - start)
+        assert response.get_json()["inserted"] == args.docs, response.get_json()
+    finally:
+        client.drop_database("bench_bulk_ingest")
+
+    print(f"POST /api/activities      {single:10.0f} docs/s")
+    print(f"POST /api/activities/bulk {bulk:10.0f} docs/s")
+    print(f"speed-up                  {bulk / single:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Round trips and latency of building a chat turn's context: the previous
+sequential queries (a find and two aggregations for the period, a find and
+three aggregations for the 7-day context) against the single $facet
+aggregation in chat_context.py.
+
+Runs against a local mongod and writes to a throwaway database that is dropped
+afterwards.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_chat_context.py [--activities 2000] [--turns 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient, monitoring
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from chat_context import context_window, fetch_contexts  # noqa: E402
+
+TYPES = ["Running", "Cycling", "Swimming", "Yoga", "Gym", "Walking", "Rowing"]
+DB_NAME = "bench_chat_context"
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        if event.database_name == DB_NAME:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def sequential_contexts(db, username, days_back, now):
+    """The per-turn queries the chatbot used to make, one after another"""
+    period_start, week_start = context_window(days_back, now)
+    period = list(db.exercises.find({"username": username, "date": {"$gte": period_start}}).sort("date", -1))
+    period_total = list(db.exercises.aggregate([
+        {"$match": {"username": username, "date": {"$gte": period_start}}},
+        {"$group": {"_id": None, "totalDuration": {"$sum": "$duration"}}},
+    ]))
+    breakdown = list(db.exercises.aggregate([
+        {"$match": {"username": username, "date": {"$gte": period_start}}},
+        {"$group": {"_id": "$exerciseType", "totalDuration": {"$sum": "$duration"}, "count": {"$sum": 1}}},
+        {"$sort": {"totalDuration": -1}},
+    ]))
+    week = list(db.exercises.find({"username": username, "date": {"$gte": week_start}}).sort("date", -1))
+    top = list(db.exercises.aggregate([
+        {"$match": {"username": username}},
+        {"$group": {"_id": "$exerciseType", "totalDuration": {"$sum": "$duration"}, "count": {"$sum": 1}}},
+        {"$sort": {"totalDuration": -1}},
+        {"$limit": 5},
+    ]))
+    week_total = list(db.exercises.aggregate([
+        {"$match": {"username": username, "date": {"$gte": week_start}}},
+        {"$group": {"_id": None, "totalDuration": {"$sum": "$duration"}}},
+    ]))
+    week_breakdown = list(db.exercises.aggregate([
+        {"$match": {"username": username, "date": {"$gte": week_start}}},
+        {"$group": {"_id": "$exerciseType", "totalDuration": {"$sum": "$duration"}, "count": {"$sum": 1}}},
+        {"$sort": {"totalDuration": -1}},
+    ]))
+    return period, period_total, breakdown, week, top, week_total, week_breakdown
+
+
+def measure(fn, turns, counter):
+    counter.count = 0
+    latencies = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "round_trips": counter.count / turns,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--activities", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--days-back", type=int, default=30)
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"), event_listeners=[counter])
+    db = client[DB_NAME]
+    now = datetime.now()
+    try:
+        db.exercises.create_index([("username", 1), ("date", -1)])
+        db.exercises.insert_many([
+            {"username": "bench_user", "exerciseType": random.choice(TYPES), "duration": random.randint(10, 120),
+             "date": now - timedelta(days=random.randrange(730), hours=random.randrange(24))}
+            for _ in range(args.activities)
+        ])
+
+        before = measure(lambda: sequential_contexts(db, "bench_user", args.days_back, now), args.turns, counter)
+        after = measure(lambda: fetch_contexts(db, "bench_user", args.days_back, now), args.turns, counter)
+
+        print(f"{args.activities} activities, {args.days_back}-day period, {args.turns} turns")
+        for name, result in (("sequential queries", before), ("single $facet", after)):
+            print(f"{name:20} {result['round_trips']:4.1f} round trips/turn  "
+                  f"p50 {result['p50']:7.2f} ms  p95 {result['p95']:7.2f} ms")
+        print(f"latency reduction (p50): {(1 - after['p50'] / before['p50']) * 100:.0f}%")
+    finally:
+        client.drop_database(DB_NAME)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Reply latency and model spend for a mix of chat questions, with and without
+the local answer path for factual lookups (chat_intents.py).
+
+Questions that aren't answered locally go to the fake OpenAI-compatible
+server in fake_openai.py, so the model's latency is fixed and nothing is
+billed. The context is the same canned one for every question, as the
+context fetch costs the same either way.
+
+Usage:
+    python benchmarks/bench_chat_intents.py [--turns 200] [--first-token-ms 300] [--token-ms 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+from openai import OpenAI
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.fake_openai import start as start_fake_openai  # noqa: E402
+from chat_context import build_dynamic_system_prompt  # noqa: E402
+from chat_intents import IntentRouter  # noqa: E402
+from chat_usage import calculate_cost  # noqa: E402
+
+MODEL = "gpt-4o-mini"
+
+# Roughly the mix of chat questions: lookups and open-ended coaching questions
+QUESTIONS = [
+    "How many workouts did I do this week?",
+    "What's my total workout time this week?",
+    "What was my last workout?",
+    "How many exercises have I done this week?",
+    "How am I doing this week?",
+    "What should I focus on next?",
+    "Any tips to improve my running?",
+    "Am I training too hard?",
+    "Give me a plan for next week",
+    "How does this week compare to last week?",
+]
+
+CONTEXT = {
+    "activities": [
+        {"type": "Running", "duration": 45, "date": "2024-05-16"},
+        {"type": "Yoga", "duration": 30, "date": "2024-05-15"},
+        {"type": "Cycling", "duration": 90, "date": "2024-05-13"},
+        {"type": "Running", "duration": 35, "date": "2024-05-11"},
+    ],
+    "breakdown": [
+        {"type": "Cycling", "duration": 90, "count": 1},
+        {"type": "Running", "duration": 80, "count": 2},
+        {"type": "Yoga", "duration": 30, "count": 1},
+    ],
+    "total_activities": 4,
+    "total_minutes": 200,
+    "period_days": 7,
+}
+
+
+def reply(client, router, question):
+    """(seconds, dollars) for one chat reply"""
+    start = time.perf_counter()
+    if router is not None and router.route(question, CONTEXT, 7):
+        return time.perf_counter() - start, 0.0
+    response = client.chat.completions.create(
+        model=MODEL,
+        messages=[{"role": "system", "content": build_dynamic_system_prompt({}, CONTEXT, 7)},
+                  {"role": "user", "content": question}],
+        max_tokens=150,
+    )
+    return time.perf_counter() - start, calculate_cost(response.usage, MODEL)["total_cost"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--first-token-ms", type=int, default=300)
+    parser.add_argument("--token-ms", type=int, default=20)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_openai(first_token_delay=args.first_token_ms / 1000,
+                                         token_delay=args.token_ms / 1000)
+    client = OpenAI(api_key="fake", base_url=base_url)
+    turns = [random.choice(QUESTIONS) for _ in range(args.turns)]
+    router = IntentRouter()
+    try:
+        results = {
+            "model for every turn": [reply(client, None, q) for q in turns],
+            "local answers first": [reply(client, router, q) for q in turns],
+        }
+    finally:
+        server.shutdown()
+
+    print(f"{args.turns} turns; model: {args.first_token_ms} ms to first token, {args.token_ms} ms per token")
+    for name, rows in results.items():
+        latencies = sorted(seconds * 1000 for seconds, _ in rows)
+        spend = sum(cost for _, cost in rows)
+        print(f"{name:22} mean {statistics.mean(latencies):7.1f} ms   p50 {statistics.median(latencies):7.1f} ms   "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1]:7.1f} ms   spend ${spend:.6f}")
+    print(f"answered locally: {router.stats()['hit_rate']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
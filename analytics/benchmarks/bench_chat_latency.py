@@ -0,0 +1,95 @@
+"""
+End-to-end latency of POST /api/chat against the model's own latency, and
+the follow-up suggestion work that used to run after the reply.
+
+The chatbot runs in-process against a local mongod and the fake
+OpenAI-compatible server in fake_openai.py, whose latency is fixed. With the
+suggestions' 7-day context fetched before the model call, /api/chat should
+take little more than the model call itself; the third line shows what
+fetching it after the reply, as the chatbot used to, would add.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_chat_latency.py \\
+        [--requests 20] [--first-token-ms 300] [--token-ms 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.bench_chat_stream import timed_post  # noqa: E402
+from benchmarks.fake_openai import start as start_fake_openai  # noqa: E402
+
+USERNAME = "bench_user"
+QUESTION = "How am I doing this week?"
+
+
+def p50_ms(fn, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--first-token-ms", type=int, default=300)
+    parser.add_argument("--token-ms", type=int, default=20)
+    args = parser.parse_args()
+
+    fake, base_url = start_fake_openai(first_token_delay=args.first_token_ms / 1000,
+                                       token_delay=args.token_ms / 1000)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+    os.environ["MONGO_DB"] = "bench_chat_latency"
+
+    from werkzeug.serving import make_server
+    import chatbot_service
+    from chat_context import fetch_contexts
+
+    now = datetime.now()
+    chatbot_service.db.exercises.insert_many([
+        {"username": USERNAME, "exerciseType": random.choice(["Running", "Cycling", "Yoga", "Swimming"]),
+         "duration": random.randint(10, 90), "date": now - timedelta(days=random.randrange(120))}
+        for _ in range(500)
+    ])
+    server = make_server("127.0.0.1", 0, chatbot_service.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    body = {"message": QUESTION, "username": USERNAME, "context": {"screen": "journal"}}
+
+    def model_call():
+        chatbot_service.client.chat.completions.create(
+            model=chatbot_service.MODEL, messages=[{"role": "user", "content": QUESTION}], max_tokens=150)
+
+    def serial_suggestion_work():
+        _, fitness_context = fetch_contexts(chatbot_service.db, USERNAME, 7)
+        chatbot_service.get_dynamic_suggestions(
+            "journal", chatbot_service.conversation_store.recent(USERNAME, 6), fitness_context)
+
+    try:
+        timed_post(server.server_port, "/api/chat", body)  # warm up the context caches
+        model = p50_ms(model_call, args.requests)
+        chat = statistics.median(timed_post(server.server_port, "/api/chat", body)[1]
+                                 for _ in range(args.requests)) * 1000
+        suggestions = p50_ms(serial_suggestion_work, args.requests)
+
+        print(f"model call alone:               p50 {model:7.1f} ms")
+        print(f"/api/chat end to end:           p50 {chat:7.1f} ms  (+{chat - model:.1f} ms over the model)")
+        print(f"suggestion work if run serially: p50 {suggestions:7.1f} ms  (now fetched before the model call)")
+    finally:
+        server.shutdown()
+        fake.shutdown()
+        chatbot_service.mongo_client.drop_database("bench_chat_latency")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Time to first byte and total time of POST /api/chat (blocking) against
+POST /api/chat/stream (Server-Sent Events).
+
+The chatbot runs in-process against a local mongod and talks to the fake
+OpenAI-compatible server in fake_openai.py, so the model's latency is fixed
+and nothing is billed.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_chat_stream.py \\
+        [--requests 20] [--first-token-ms 300] [--token-ms 20]
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.fake_openai import start as start_fake_openai  # noqa: E402
+
+
+def timed_post(port, path, body):
+    """(seconds to the first body byte, seconds to the end of the body)"""
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    start = time.perf_counter()
+    conn.request("POST", path, body=json.dumps(body), headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    response.read(1)
+    first_byte = time.perf_counter() - start
+    response.read()
+    total = time.perf_counter() - start
+    conn.close()
+    return first_byte, total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--first-token-ms", type=int, default=300)
+    parser.add_argument("--token-ms", type=int, default=20)
+    args = parser.parse_args()
+
+    fake, base_url = start_fake_openai(first_token_delay=args.first_token_ms / 1000,
+                                       token_delay=args.token_ms / 1000)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+    os.environ["MONGO_DB"] = "bench_chat_stream"
+
+    from werkzeug.serving import make_server
+    from chatbot_service import app, mongo_client
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+    body = {"message": "How did I do this week?", "username": "bench_user", "context": {"screen": "journal"}}
+
+    try:
+        timed_post(port, "/api/chat", body)  # warm up the context caches
+        print(f"model: {args.first_token_ms} ms to first token, {args.token_ms} ms per token; "
+              f"{args.requests} requests each")
+        for path in ("/api/chat", "/api/chat/stream"):
+            results = [timed_post(port, path, body) for _ in range(args.requests)]
+            ttfb = statistics.median(r[0] for r in results) * 1000
+            total = statistics.median(r[1] for r in results) * 1000
+            print(f"{path:18} TTFB p50 {ttfb:7.1f} ms   total p50 {total:7.1f} ms")
+    finally:
+        server.shutdown()
+        fake.shutdown()
+        mongo_client.drop_database("bench_chat_stream")
+
+
+if __name__ == "__main__":
+    main()
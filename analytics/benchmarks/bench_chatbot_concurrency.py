@@ -0,0 +1,138 @@
+"""
+How many concurrent chats one chatbot process sustains: the Flask service as
+Dockerfile.chatbot runs it (python chatbot_service.py) against the asyncio
+serving mode (uvicorn chatbot_asgi:app). Both call the fake
+OpenAI-compatible server in fake_openai.py, whose latency is fixed.
+
+Each simulated user keeps asking a coaching question that goes to the model
+(opting out of the response cache) for --duration seconds, at each number of
+concurrent users in turn. Chats per second stop growing once the process is
+saturated; latency and errors show what happens past that point.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_chatbot_concurrency.py \\
+        [--users 10 50 200 500] [--duration 20] [--first-token-ms 300] [--token-ms 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from pymongo import MongoClient
+
+ANALYTICS = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ANALYTICS)
+from benchmarks.load_test import percentile  # noqa: E402
+
+DB_NAME = "bench_chatbot_concurrency"
+USERS = 50
+QUESTION = "What should I focus on next?"
+FAKE_PORT = 8099
+CHATBOT_PORT = 5062
+
+SERVERS = {
+    "flask (chatbot_service.py)": [sys.executable, "chatbot_service.py"],
+    "asyncio (chatbot_asgi.py)": [sys.executable, "-m", "uvicorn", "chatbot_asgi:app",
+                                  "--port", str(CHATBOT_PORT), "--log-level", "warning"],
+}
+
+
+def seed(mongo_uri):
+    db = MongoClient(mongo_uri)[DB_NAME]
+    now = datetime.now()
+    db.exercises.insert_many([
+        {"username": f"user{i % USERS}", "exerciseType": random.choice(["Running", "Cycling", "Yoga", "Swimming"]),
+         "duration": random.randint(10, 90), "date": now - timedelta(days=random.randrange(120))}
+        for i in range(USERS * 100)
+    ])
+
+
+def spawn(command, env):
+    # A session of its own, so the Flask reloader's child process is stopped too
+    return subprocess.Popen(command, cwd=ANALYTICS, env=env, start_new_session=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    process.wait()
+
+
+async def wait_until_up(url, timeout=30):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.perf_counter() < deadline:
+            try:
+                if (await http.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} didn't come up in {timeout} s")
+
+
+async def run_user(http, user, deadline, latencies, errors):
+    body = {"message": QUESTION, "username": f"user{user % USERS}", "context": {"screen": "journal"}, "cache": False}
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await http.post("/api/chat", json=body)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def load(base_url, users, duration):
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as http:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(run_user(http, user, deadline, latencies, errors) for user in range(users)))
+    return latencies, errors
+
+
+async def main(args):
+    mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+    seed(mongo_uri)
+    env = dict(os.environ, MONGO_URI=mongo_uri, MONGO_DB=DB_NAME, OPENAI_API_KEY="fake",
+               OPENAI_BASE_URL=f"http://127.0.0.1:{FAKE_PORT}/v1", CHATBOT_PORT=str(CHATBOT_PORT))
+    fake = spawn([sys.executable, "benchmarks/fake_openai.py", "--port", str(FAKE_PORT),
+                  "--first-token-ms", str(args.first_token_ms), "--token-ms", str(args.token_ms)], env)
+    base_url = f"http://127.0.0.1:{CHATBOT_PORT}"
+    try:
+        print(f"model: {args.first_token_ms} ms to first token, {args.token_ms} ms per token; "
+              f"{args.duration} s per level")
+        print(f"{'server':28} {'users':>6} {'chats/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for name, command in SERVERS.items():
+            server = spawn(command, env)
+            try:
+                await wait_until_up(base_url + "/health")
+                for users in args.users:
+                    latencies, errors = await load(base_url, users, args.duration)
+                    print(f"{name:28} {users:>6} {len(latencies) / args.duration:>8.1f} "
+                          f"{percentile(latencies, 50) * 1000:>8.0f} {percentile(latencies, 99) * 1000:>8.0f} "
+                          f"{len(errors):>7}")
+            finally:
+                stop(server)
+    finally:
+        stop(fake)
+        MongoClient(mongo_uri).drop_database(DB_NAME)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 50, 200, 500])
+    parser.add_argument("--duration", type=int, default=20)
+    parser.add_argument("--first-token-ms", type=int, default=300)
+    parser.add_argument("--token-ms", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
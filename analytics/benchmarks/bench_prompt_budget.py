@@ -0,0 +1,61 @@
+"""
+Prompt tokens per chat turn as a conversation grows: the previous assembly
+(whole system prompt plus the last 10 raw history messages) against the
+token-budgeted one in prompt_budget.py.
+
+Nothing is sent to a model; tokens are counted locally, exactly when
+tiktoken is installed and estimated otherwise. The replies are canned ones of
+about the length the chatbot produces (max_tokens=150).
+
+Usage:
+    python benchmarks/bench_prompt_budget.py [--turns 20] [--budget 1200] [--history 6]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.bench_chat_intents import CONTEXT, MODEL, QUESTIONS  # noqa: E402
+from chat_context import STATIC_INSTRUCTIONS, build_context_prompt  # noqa: E402
+from prompt_budget import (LEGACY_HISTORY_MESSAGES, PromptAssembler,  # noqa: E402
+                           count_message_tokens, count_tokens)
+
+REPLY = ("Great work this week! 💪 You logged 4 sessions and 200 minutes, with cycling leading the way. "
+         "Keep your long run easy, add one short interval session, and make sure Sunday stays a rest day. "
+         "Aim for 7-8 hours of sleep and keep hydrating after the longer rides. 🚴")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--budget", type=int, default=1200)
+    parser.add_argument("--history", type=int, default=LEGACY_HISTORY_MESSAGES)
+    args = parser.parse_args()
+
+    assembler = PromptAssembler(budget=args.budget, max_history=args.history, model=MODEL)
+    context_prompt = build_context_prompt({}, CONTEXT, 7)
+    history = []
+    legacy_total = budgeted_total = 0
+
+    print(f"static prefix: {count_tokens(STATIC_INSTRUCTIONS, MODEL)} tokens, "
+          f"context block: {count_tokens(context_prompt, MODEL)} tokens, "
+          f"exact counts: {assembler.stats()['exact_counts']}")
+    print(f"{'turn':>4}  {'legacy':>7}  {'budgeted':>8}  {'saved':>6}")
+    for turn in range(args.turns):
+        history.append({"role": "user", "content": QUESTIONS[turn % len(QUESTIONS)]})
+        legacy = count_message_tokens(
+            [{"role": "system", "content": STATIC_INSTRUCTIONS + "\n" + context_prompt}]
+            + history[-LEGACY_HISTORY_MESSAGES:], MODEL)
+        _, report = assembler.assemble("bench_user", STATIC_INSTRUCTIONS, context_prompt, history)
+        legacy_total += legacy
+        budgeted_total += report["prompt_tokens"]
+        print(f"{turn + 1:>4}  {legacy:>7}  {report['prompt_tokens']:>8}  {report['prompt_tokens_saved']:>6}")
+        history.append({"role": "assistant", "content": REPLY})
+
+    stats = assembler.stats()
+    print(f"total prompt tokens: legacy {legacy_total}, budgeted {budgeted_total} "
+          f"({stats['prompt_tokens_saved']} saved, ${stats['estimated_savings']:.6f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Reply latency and model spend for users tapping suggestion chips, with and
+without the response cache (response_cache.py).
+
+Replies come from the fake OpenAI-compatible server in fake_openai.py, so the
+model's latency is fixed and nothing is billed. Each user's context is
+unchanged for the run, as it is between writes.
+
+Usage:
+    python benchmarks/bench_response_cache.py [--users 20] [--taps 10] [--first-token-ms 300] [--token-ms 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+from openai import OpenAI
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.bench_chat_intents import CONTEXT, MODEL  # noqa: E402
+from benchmarks.fake_openai import start as start_fake_openai  # noqa: E402
+from chat_context import STATIC_INSTRUCTIONS, build_context_prompt  # noqa: E402
+from chat_usage import calculate_cost  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+
+# Chips the journal screen offers
+CHIPS = [
+    "How am I doing this week? 📊",
+    "What's my strongest activity? 💪",
+    "What should I focus on next? 🎯",
+    "What's my workout streak? 🔥",
+]
+
+
+def reply(client, cache, username, question):
+    """(seconds, dollars) for one chat reply"""
+    start = time.perf_counter()
+    context_prompt = build_context_prompt({"screen": "journal"}, CONTEXT, 7)
+    key = cache.key(username, question, 7, "journal", context_prompt) if cache is not None else None
+    if cache is not None and cache.get(key) is not None:
+        return time.perf_counter() - start, 0.0
+    response = client.chat.completions.create(
+        model=MODEL,
+        messages=[{"role": "system", "content": STATIC_INSTRUCTIONS},
+                  {"role": "system", "content": context_prompt},
+                  {"role": "user", "content": question}],
+        max_tokens=150,
+    )
+    cost = calculate_cost(response.usage, MODEL)["total_cost"]
+    if cache is not None:
+        cache.put(key, response.choices[0].message.content, cost)
+    return time.perf_counter() - start, cost
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--taps", type=int, default=10)
+    parser.add_argument("--first-token-ms", type=int, default=300)
+    parser.add_argument("--token-ms", type=int, default=20)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_openai(first_token_delay=args.first_token_ms / 1000,
+                                         token_delay=args.token_ms / 1000)
+    client = OpenAI(api_key="fake", base_url=base_url)
+    taps = [(f"user{random.randrange(args.users)}", random.choice(CHIPS)) for _ in range(args.users * args.taps)]
+    cache = ResponseCache()
+    try:
+        results = {
+            "model for every tap": [reply(client, None, u, q) for u, q in taps],
+            "response cache": [reply(client, cache, u, q) for u, q in taps],
+        }
+    finally:
+        server.shutdown()
+
+    print(f"{len(taps)} taps by {args.users} users; model: {args.first_token_ms} ms to first token, "
+          f"{args.token_ms} ms per token")
+    for name, rows in results.items():
+        latencies = sorted(seconds * 1000 for seconds, _ in rows)
+        spend = sum(cost for _, cost in rows)
+        print(f"{name:20} mean {statistics.mean(latencies):7.1f} ms   p50 {statistics.median(latencies):7.1f} ms   "
+              f"spend ${spend:.6f}")
+    stats = cache.stats()
+    print(f"hit rate: {stats['hit_rate']:.0%}, saved ${stats['saved_cost']:.6f}")
+
+
+if __name__ == "__main__":
+    main()
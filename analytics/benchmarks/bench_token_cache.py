@@ -0,0 +1,61 @@
+"""
+Per-request auth overhead of token_required with and without the claims cache.
+
+Usage:
+    python benchmarks/bench_token_cache.py [--requests 20000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import jwt
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from token_cache import TokenCache  # noqa: E402
+
+SECRET = "benchmark-secret"
+
+
+def uncached(token):
+    return jwt.decode(token, SECRET, algorithms=['HS256'])
+
+
+def cached(cache):
+    def decode(token):
+        claims = cache.get(token)
+        if claims is None:
+            claims = jwt.decode(token, SECRET, algorithms=['HS256'])
+            cache.put(token, claims)
+        return claims
+    return decode
+
+
+def time_per_call(decode, auth_header, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        # Mirror token_required: split the header, then verify
+        decode(auth_header.split(' ')[1])
+    return (time.perf_counter() - start) / requests * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = jwt.encode({"sub": "alice", "exp": int(time.time()) + 3600}, SECRET, algorithm='HS256')
+    auth_header = f"Bearer {token}"
+    cache = TokenCache()
+
+    before = time_per_call(uncached, auth_header, args.requests)
+    after = time_per_call(cached(cache), auth_header, args.requests)
+
+    print(f"jwt.decode every request: {before:8.2f} µs/request")
+    print(f"cached claims:            {after:8.2f} µs/request")
+    print(f"speed-up:                 {before / after:8.1f}x")
+    print(f"cache stats:              {cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+A local OpenAI-compatible chat completions server for tests and benchmarks.
+
+It answers POST /v1/chat/completions with a canned reply, either all at once
+or streamed chunk by chunk, after simulated model latency: a delay before the
+first token and a delay per token. Token usage is reported the way the real
+API does, including the final usage chunk requested by stream_options.
+
+Usage:
+    python benchmarks/fake_openai.py [--port 8099] [--first-token-ms 300] [--token-ms 20]
+    OPENAI_BASE_URL=http://localhost:8099/v1 OPENAI_API_KEY=fake python chatbot_service.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = ("Great work this week! You logged 4 sessions for 3 hr 20 min, "
+         "mostly running, which is up on last week. Keep it going! 🏃")
+
+
+def _tokens(text):
+    """Split text into word-sized chunks that join back into it"""
+    words = text.split(" ")
+    return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    reply = REPLY
+    first_token_delay = 0.3
+    token_delay = 0.02
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        tokens = _tokens(self.reply)
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body.get("model", "fake")}
+
+        time.sleep(self.first_token_delay)
+        if body.get("stream"):
+            self._stream(base, tokens, usage, (body.get("stream_options") or {}).get("include_usage"))
+        else:
+            time.sleep(self.token_delay * (len(tokens) - 1))
+            payload = json.dumps({
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": self.reply}}],
+                "usage": usage,
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    def _chunk(self, data):
+        frame = f"data: {data}\n\n".encode()
+        self.wfile.write(f"{len(frame):x}\r\n".encode() + frame + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, base, tokens, usage, include_usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.token_delay)
+            delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+            self._chunk(json.dumps({**base, "object": "chat.completion.chunk",
+                                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}))
+        self._chunk(json.dumps({**base, "object": "chat.completion.chunk",
+                                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+        if include_usage:
+            self._chunk(json.dumps({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}))
+        self._chunk("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def start(port=0, first_token_delay=0.3, token_delay=0.02, reply=REPLY):
+    """Serve on a daemon thread; returns (server, base_url)"""
+    handler = type("Handler", (FakeOpenAIHandler,), {
+        "first_token_delay": first_token_delay, "token_delay": token_delay, "reply": reply})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--first-token-ms", type=int, default=300)
+    parser.add_argument("--token-ms", type=int, default=20)
+    args = parser.parse_args()
+
+    server, base_url = start(args.port, args.first_token_ms / 1000, args.token_ms / 1000)
+    print(f"Fake OpenAI API at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Concurrent dashboard load test for the analytics API.
+
+Each simulated client repeatedly loads the statistics screen (user stats,
+daily trend and weekly journal) for the duration of the run. Point it at the
+gunicorn (app.py) and uvicorn (asgi_app.py) deployments in turn to compare
+requests per second and latency percentiles.
+
+Usage:
+    JWT_SECRET_KEY=... python benchmarks/load_test.py --base-url http://localhost:5050 \\
+        --user alice --clients 100 --duration 30
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import date, timedelta
+
+import httpx
+import jwt
+
+
+def dashboard_requests(username):
+    today = date.today()
+    week_start = today - timedelta(days=today.weekday())
+    return [
+        ("/stats/" + username, None),
+        ("/stats/daily_trend/" + username, None),
+        ("/stats/weekly/", {"user": username, "start": week_start.isoformat(), "end": today.isoformat()}),
+    ]
+
+
+async def run_client(http, requests, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        for path, params in requests:
+            start = time.perf_counter()
+            try:
+                response = await http.get(path, params=params)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+                    continue
+            except httpx.HTTPError as e:
+                errors.append(type(e).__name__)
+                continue
+            latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def main(args):
+    token = args.token or jwt.encode({"sub": args.user, "exp": int(time.time()) + 3600},
+                                     os.environ["JWT_SECRET_KEY"], algorithm='HS256')
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30,
+                                 headers={"Authorization": f"Bearer {token}"}) as http:
+        requests = dashboard_requests(args.user)
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(run_client(http, requests, deadline, latencies, errors)
+                               for _ in range(args.clients)))
+        elapsed = time.perf_counter() - start
+
+    print(f"{args.base_url}: {args.clients} clients for {elapsed:.1f}s")
+    print(f"  requests/s  {len(latencies) / elapsed:10.1f}")
+    print(f"  p50         {percentile(latencies, 50) * 1000:10.1f} ms")
+    print(f"  p99         {percentile(latencies, 99) * 1000:10.1f} ms")
+    print(f"  errors      {len(errors):10d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:5050")
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--token", help="JWT to send (minted from JWT_SECRET_KEY if omitted)")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,328 @@
+"""
+Fitness context for a chatbot turn.
+
+A turn needs two views of the user's activities: the period the question is
+about (``days_back`` days, for the prompt) and the last 7 days plus all-time
+top types (for follow-up suggestions). Both are built together, either from
+the user's cached activity columns or, when the cache is disabled, from a
+single ``$facet`` aggregation instead of a find and several aggregations per
+view.
+
+The prompt is built here too, so tests can check it doesn't depend on where
+the context came from. It has a static instruction block, the same for every
+turn, and a context block built from the user's data.
+"""
+from datetime import date, datetime, timedelta
+
+WEEK_DAYS = 7
+# Individual activities kept in the 7-day context
+RECENT_LIMIT = 10
+# All-time exercise types kept in the 7-day context
+TOP_TYPES = 5
+
+
+def context_window(days_back, now=None):
+    """Midnights starting the requested period and the 7-day window ending today"""
+    today = (now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=days_back - 1), today - timedelta(days=WEEK_DAYS - 1)
+
+
+def _breakdown_branch(start):
+    return [
+        {"$match": {"date": {"$gte": start}}},
+        {"$group": {
+            "_id": "$exerciseType",
+            "totalDuration": {"$sum": "$duration"},
+            "count": {"$sum": 1},
+        }},
+        {"$sort": {"totalDuration": -1}},
+    ]
+
+
+def _activities_branch(start, limit=None):
+    branch = [
+        {"$match": {"date": {"$gte": start}}},
+        {"$sort": {"date": -1}},
+    ]
+    if limit is not None:
+        branch.append({"$limit": limit})
+    branch.append({"$project": {"_id": 0, "exerciseType": 1, "duration": 1, "date": 1}})
+    return branch
+
+
+def context_pipeline(username, period_start, week_start):
+    """One aggregation returning everything both contexts need.
+
+    Totals and counts are summed from the breakdowns rather than grouped
+    again. When the period is the last 7 days the week branches are left out
+    and the period's are reused.
+    """
+    branches = {
+        "period": _activities_branch(period_start),
+        "period_breakdown": _breakdown_branch(period_start),
+        "top_types": [
+            {"$group": {
+                "_id": "$exerciseType",
+                "totalDuration": {"$sum": "$duration"},
+                "count": {"$sum": 1},
+            }},
+            {"$sort": {"totalDuration": -1}},
+            {"$limit": TOP_TYPES},
+        ],
+    }
+    if week_start != period_start:
+        branches["week"] = _activities_branch(week_start, RECENT_LIMIT)
+        branches["week_breakdown"] = _breakdown_branch(week_start)
+    return [
+        {"$match": {"username": username}},
+        {"$facet": branches},
+    ]
+
+
+def daily_load_pipeline(username):
+    """Minutes and sessions per UTC day over the user's whole history, for TrainingLoad.from_days"""
+    return [
+        {"$match": {"username": username, "date": {"$type": "date"}}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}},
+            "minutes": {"$sum": "$duration"},
+            "sessions": {"$sum": 1},
+        }},
+    ]
+
+
+def daily_load_rows(docs):
+    """(day ordinal, minutes, sessions) rows from daily_load_pipeline's documents"""
+    return [(date.fromisoformat(doc["_id"]).toordinal(), doc["minutes"], doc["sessions"]) for doc in docs]
+
+
+def _activity(exercise_type, duration, when):
+    return {
+        "type": exercise_type,
+        "duration": duration,
+        "date": when.strftime("%Y-%m-%d") if isinstance(when, (datetime, date)) else str(when or ""),
+    }
+
+
+def _breakdown(rows):
+    """[(exerciseType, total duration, sessions)] -> context rows, with the total and session count"""
+    breakdown = [{"type": exercise_type, "duration": total, "count": count} for exercise_type, total, count in rows]
+    return breakdown, sum(b["duration"] for b in breakdown), sum(b["count"] for b in breakdown)
+
+
+def _contexts(days_back, period, period_rows, week, week_rows, top_rows):
+    breakdown, total_minutes, total_activities = _breakdown(period_rows)
+    weekly_breakdown, weekly_minutes, weekly_activities = _breakdown(week_rows)
+    period_context = {
+        "activities": period,
+        "breakdown": breakdown,
+        "total_activities": total_activities,
+        "total_minutes": total_minutes,
+        "period_days": days_back,
+    }
+    fitness_context = {
+        "recent_activities": week[:RECENT_LIMIT],
+        "stats": [
+            {"type": exercise_type, "total_duration": total, "count": count}
+            for exercise_type, total, count in top_rows
+        ],
+        "weekly_breakdown": weekly_breakdown,
+        "total_activities": weekly_activities,
+        "weekly_minutes": weekly_minutes,
+    }
+    return period_context, fitness_context
+
+
+def contexts_from_facet(result, days_back):
+    """(period context, 7-day context) from the document returned by context_pipeline"""
+    def activities(docs):
+        return [_activity(doc.get("exerciseType", "Unknown"), doc.get("duration", 0), doc.get("date"))
+                for doc in docs]
+
+    def rows(groups):
+        return [(g["_id"], g["totalDuration"], g["count"]) for g in groups]
+
+    period = activities(result.get("period", []))
+    period_rows = rows(result.get("period_breakdown", []))
+    if "week" in result:
+        week = activities(result["week"])
+        week_rows = rows(result.get("week_breakdown", []))
+    else:
+        week, week_rows = period, period_rows
+    return _contexts(days_back, period, period_rows, week, week_rows, rows(result.get("top_types", [])))
+
+
+def contexts_from_activities(activities, days_back, now=None):
+    """(period context, 7-day context) from a user's cached UserActivities"""
+    period_start, week_start = context_window(days_back, now)
+    period_day, week_day = period_start.toordinal(), week_start.toordinal()
+
+    def recent(start_day, limit=None):
+        return [_activity(exercise_type if exercise_type is not None else "Unknown", duration, date.fromordinal(day))
+                for day, duration, exercise_type in activities.recent(limit, start_day)]
+
+    return _contexts(days_back,
+                     recent(period_day), activities.by_type(period_day),
+                     recent(week_day, RECENT_LIMIT), activities.by_type(week_day),
+                     activities.by_type()[:TOP_TYPES])
+
+
+def fetch_contexts(db, username, days_back, now=None):
+    """(period context, 7-day context) in one round trip to MongoDB"""
+    period_start, week_start = context_window(days_back, now)
+    result = next(db.exercises.aggregate(context_pipeline(username, period_start, week_start)), {})
+    return contexts_from_facet(result, days_back)
+
+
+def empty_contexts(days_back):
+    return _contexts(days_back, [], [], [], [], [])
+
+
+# Identical on every turn for every user, so it's sent first: providers can
+# then serve it from their prompt cache
+STATIC_INSTRUCTIONS = """You are FitCoach, a friendly and motivating AI fitness assistant for the MLA Fitness App.
+
+YOUR RESPONSE STYLE:
+- MAXIMUM 1-2 SHORT SENTENCES
+- Always mention the time period you're analyzing
+- Use the TOTAL ACTIVITIES number when answering "how many"
+- Be enthusiastic but brief
+- Max 1 emoji per message
+
+EMOJI USAGE GUIDE:
+- Running: 🏃
+- Swimming: 🏊
+- Cycling: 🚴
+- Gym/Strength: 💪
+- Yoga: 🧘
+- Celebration: 🎉, 🏆, ⭐
+- Progress: 📈, 🔥, ⚡
+"""
+
+
+def detect_days_back(user_message):
+    """Number of days the question is about, 7 unless it names another period"""
+    days_back = 7  # default
+    message_lower = user_message.lower()
+    
+    if '30 day' in message_lower or 'past month' in message_lower or 'last month' in message_lower or 'month' in message_lower:
+        days_back = 30
+    elif '14 day' in message_lower or '2 week' in message_lower or 'two week' in message_lower:
+        days_back = 14
+    elif 'today' in message_lower:
+        days_back = 1
+    elif 'yesterday' in message_lower:
+        days_back = 2
+    # Default to 7 days for "week", "last 7 days", etc.
+    
+    print(f"🔍 Detected time period: {days_back} days")
+    return days_back
+
+
+def describe_period(days_back):
+    """How the prompt and replies name the period: "today", "last 7 days", ..."""
+    return "today" if days_back == 1 else f"last {days_back} days"
+
+
+def format_minutes(minutes):
+    hours, remaining = divmod(minutes, 60)
+    return f"{hours} hr {remaining} min" if hours > 0 else f"{minutes} min"
+
+
+def build_context_prompt(context, user_context, days_back):
+    """The per-user, per-period part of the system prompt"""
+    screen = context.get('screen', 'general')
+
+    # Get the period name
+    period_name = describe_period(days_back)
+
+    # Format activities - show ALL if ≤10, otherwise show first 5 + summary
+    activities_str = ""
+    total_activities = len(user_context.get('activities', []))
+
+    if user_context.get('activities'):
+        formatted = []
+        activities_to_show = user_context['activities'][:5] if total_activities > 10 else user_context['activities']
+
+        for i, a in enumerate(activities_to_show):
+            duration_mins = a['duration']
+            if duration_mins >= 60:
+                hours = duration_mins // 60
+                mins = duration_mins % 60
+                duration_str = f"{hours} hr {mins} min" if mins > 0 else f"{hours} hr"
+            else:
+                duration_str = f"{duration_mins} min"
+            formatted.append(f"{i+1}. {a['type']}: {duration_str} on {a['date']}")
+
+        activities_str = "\n".join(formatted)
+
+        # Add summary if there are more activities
+        if total_activities > len(activities_to_show):
+            activities_str += f"\n... and {total_activities - len(activities_to_show)} more activities"
+    else:
+        activities_str = f"No activities in the {period_name}."
+
+    # Format breakdown
+    breakdown_str = ""
+    if user_context.get('breakdown'):
+        formatted = []
+        for b in user_context['breakdown']:
+            mins = b['duration']
+            hours = mins // 60
+            remaining = mins % 60
+            time_str = f"{hours} hr {remaining} min" if hours > 0 else f"{mins} min"
+            formatted.append(f"- {b['type']}: {time_str} ({b['count']} sessions)")
+        breakdown_str = "\n".join(formatted)
+    else:
+        breakdown_str = f"No breakdown available for {period_name}."
+
+    time_display = format_minutes(user_context.get('total_minutes', 0))
+
+    # Streak, consistency and week-over-week answers come from the insights engine
+    trends_str = "Not enough history yet."
+    insights = user_context.get('insights')
+    if insights:
+        streak = insights['streak']
+        wow = insights['week_over_week']
+        change = wow['minutes_change_pct']
+        change_str = f"{change:+}%" if change is not None else "no activity the week before"
+        acwr = insights['load']['acwr']
+        trends_str = "\n".join([
+            f"- Current streak: {streak['current']} days (longest ever: {streak['longest']} days)",
+            f"- Active days in the last 28 days: {insights['consistency']['active_days_28d']} of 28",
+            f"- Last 7 days: {wow['this_week']['minutes']} min over {wow['this_week']['sessions']} sessions; "
+            f"previous 7 days: {wow['last_week']['minutes']} min over {wow['last_week']['sessions']} sessions "
+            f"({change_str})",
+            f"- Acute:chronic workload ratio: {acwr if acwr is not None else 'n/a'}"
+            " (0.8-1.3 is a steady build, above 1.5 is a sharp spike)",
+        ])
+
+    # Explicitly state the total count
+    return f"""USER'S FITNESS DATA ({period_name.upper()}):
+- TOTAL ACTIVITIES: {user_context.get('total_activities', 0)} (use for "how many" questions)
+- Total workout time: {time_display}
+
+BREAKDOWN BY ACTIVITY TYPE (This shows the complete summary):
+{breakdown_str}
+
+RECENT INDIVIDUAL ACTIVITIES (showing most recent):
+{activities_str}
+
+TRAINING TRENDS (use for streak, consistency and "compare my weeks" questions):
+{trends_str}
+
+CRITICAL INSTRUCTIONS:
+- The TOTAL ACTIVITIES count ({user_context.get('total_activities', 0)}) is the COMPLETE count for {period_name}
+- The individual activities list above may only show a sample - always use the total count
+- When asked "how many exercises", respond with the TOTAL ACTIVITIES number: {user_context.get('total_activities', 0)}
+- Always mention the time period: "In the {period_name}..."
+
+Remember: 
+- TOTAL activities in {period_name}: {user_context.get('total_activities', 0)}
+- Always reference this number when asked "how many"
+"""
+
+
+def build_dynamic_system_prompt(context, user_context, days_back):
+    """Build context-aware system prompt with dynamic time period"""
+    return STATIC_INSTRUCTIONS + "\n" + build_context_prompt(context, user_context, days_back)
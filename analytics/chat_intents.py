@@ -0,0 +1,133 @@
+"""
+Answers to factual chat questions without calling the model.
+
+"How many workouts this week", "total minutes this month" and "what was my
+last workout" are lookups in the context every turn already fetches, and the
+prompt only asks the model to repeat those numbers. IntentRouter recognises
+these questions and answers them from a template, so they cost no tokens and
+no model round trip. Anything it isn't sure of (advice, comparisons, a
+specific exercise type, several questions at once) goes to the model as
+before.
+"""
+import re
+import threading
+
+from chat_context import describe_period, format_minutes
+
+_ACTIVITY = r"(?:workouts?|exercises?|activities|activity|sessions?|training sessions?)"
+
+INTENTS = {
+    "count": [
+        re.compile(rf"\bhow many (?:total )?{_ACTIVITY}\b"),
+        re.compile(r"\bhow many times (?:have |did )?i (?:work(?:ed)? out|exercised?|trained?)\b"),
+        re.compile(rf"\b(?:number|count) of {_ACTIVITY}\b"),
+    ],
+    "total_time": [
+        re.compile(r"\btotal (?:workout |exercise |training |active )?(?:minutes|time|hours|duration)\b"),
+        re.compile(r"\bhow (?:much time|many minutes|many hours|long) (?:have |did )?i (?:spen[dt] )?"
+                   r"(?:work(?:ed)? out|working out|exercis(?:ed?|ing)|train(?:ed|ing)?)\b"),
+    ],
+    "last_workout": [
+        re.compile(rf"\b(?:what|when|which) (?:was|is) my (?:last|latest|most recent|previous) {_ACTIVITY}\b"),
+        re.compile(r"\bwhen did i (?:last )?(?:work out|exercise|train)(?: last)?\b"),
+    ],
+}
+
+# Questions these words appear in need the model
+_NEEDS_MODEL = re.compile(
+    r"\b(?:should|need|must|can|could|would|will|want|why|recommend\w*|suggest\w*|advice|ideal|target|goal|plan"
+    r"|compare|compared|versus|vs|than|better|worse|improve|average|per|each|every|calories|streak"
+    r"|and|or|but|if)\b")
+# Exercise types: "how many runs" or "total yoga time" is about one type, not all activities
+_EXERCISE_TYPE = re.compile(
+    r"\b(?:run\w*|jog\w*|swim\w*|cycl\w*|bik\w*|ride|rides|yoga|gym|walk\w*|hik\w*|lift\w*|strength|weights?"
+    r"|row\w*|pilates|hiit|cardio|sport\w*|tennis|football|soccer|basketball|danc\w*|box\w*|climb\w*|stretch\w*)\b")
+
+
+def normalise(message):
+    """Lower case, punctuation dropped, whitespace collapsed"""
+    return " ".join(re.sub(r"[^\w\s']", " ", message.lower()).split())
+
+
+def classify(message):
+    """The intent a message asks for, or None if the model should answer it"""
+    text = normalise(message)
+    # One question at a time: a second sentence may ask something else
+    if message.count("?") > 1 or _NEEDS_MODEL.search(text) or _EXERCISE_TYPE.search(text):
+        return None
+    for intent, patterns in INTENTS.items():
+        if any(pattern.search(text) for pattern in patterns):
+            return intent
+    return None
+
+
+def _in_period(days_back):
+    return "Today" if days_back == 1 else f"In the {describe_period(days_back)}"
+
+
+def answer(intent, user_context, days_back):
+    """Templated reply to an intent from the period context, or None if it can't be answered from it"""
+    total = user_context.get("total_activities", 0)
+    minutes = user_context.get("total_minutes", 0)
+    noun = "activity" if total == 1 else "activities"
+
+    if intent == "count":
+        if not total:
+            return f"{_in_period(days_back)}, you haven't logged any activities yet. A short session is a great start! 💪"
+        return f"{_in_period(days_back)}, you've logged {total} {noun} for {format_minutes(minutes)} in total. Keep it up! 🔥"
+
+    if intent == "total_time":
+        if not total:
+            return f"{_in_period(days_back)}, you haven't logged any workout time yet. A short session is a great start! 💪"
+        return f"{_in_period(days_back)}, you've trained for {format_minutes(minutes)} across {total} {noun}. 📈"
+
+    if intent == "last_workout":
+        activities = user_context.get("activities") or []
+        if not activities:
+            # It may be older than the period: let the model explain
+            return None
+        last = activities[0]
+        return f"Your last workout was {last['type']} for {format_minutes(last['duration'])} on {last['date']}. ⭐"
+
+    return None
+
+
+class IntentRouter:
+    """classify() and answer() with hit-rate and estimated savings counters"""
+
+    def __init__(self):
+        self.questions = 0
+        self.hits = {intent: 0 for intent in INTENTS}
+        self.model_replies = 0
+        self.model_cost = 0.0
+        self._lock = threading.Lock()
+
+    def route(self, message, user_context, days_back):
+        """(intent, reply) if the question can be answered locally, else None"""
+        intent = classify(message)
+        reply = answer(intent, user_context, days_back) if intent else None
+        with self._lock:
+            self.questions += 1
+            if reply is not None:
+                self.hits[intent] += 1
+        return (intent, reply) if reply is not None else None
+
+    def record_model_reply(self, cost):
+        """Track what a model reply cost, to estimate what local answers save"""
+        with self._lock:
+            self.model_replies += 1
+            self.model_cost += cost
+
+    def stats(self):
+        with self._lock:
+            hits = sum(self.hits.values())
+            average_cost = self.model_cost / self.model_replies if self.model_replies else 0.0
+            return {
+                "questions": self.questions,
+                "answered_locally": hits,
+                "hit_rate": round(hits / self.questions, 4) if self.questions else 0.0,
+                "by_intent": dict(self.hits),
+                "model_replies": self.model_replies,
+                "model_cost": round(self.model_cost, 6),
+                "estimated_savings": round(hits * average_cost, 6),
+            }
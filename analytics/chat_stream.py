@@ -0,0 +1,90 @@
+"""
+Server-Sent Events for streamed chat completions.
+
+stream_chat() forwards each content delta from the model as a ``token`` event
+as soon as it arrives. When the model finishes it calls ``finish`` with the
+full reply and the token usage, and sends whatever that returns (suggestions,
+cost) as a final ``done`` event. If the model fails part-way, an ``error``
+event is sent instead and ``finish`` is never called, so nothing half-written
+reaches the conversation history.
+
+astream_chat() does the same with the async OpenAI client, for the asyncio
+serving mode; its ``finish`` is a coroutine function.
+"""
+import json
+from types import SimpleNamespace
+
+ERROR_REPLY = "I'm having trouble connecting right now. Please try again! 😊"
+
+
+def sse(event, data):
+    """One SSE frame with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _usage(value):
+    # Clients that predate stream_options keep the usage chunk's field as a plain dict
+    if isinstance(value, dict):
+        return SimpleNamespace(**value)
+    return value
+
+
+def stream_chat(client, model, messages, finish, **params):
+    """Yield SSE frames for one streamed completion"""
+    parts, usage = [], None
+    try:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            # Ask for a last chunk carrying the token counts, so cost can be reported
+            extra_body={"stream_options": {"include_usage": True}},
+            **params
+        )
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = _usage(chunk.usage)
+            for choice in chunk.choices:
+                content = choice.delta.content
+                if content:
+                    parts.append(content)
+                    yield sse("token", {"content": content})
+    except Exception as e:
+        print(f"OpenAI streaming error: {str(e)}")
+        yield sse("error", {"response": ERROR_REPLY, "success": False, "error": str(e)})
+        return
+
+    yield sse("done", finish("".join(parts), usage))
+
+
+async def astream_chat(client, model, messages, finish, **params):
+    """Async stream_chat(), for an AsyncOpenAI client"""
+    parts, usage = [], None
+    try:
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            extra_body={"stream_options": {"include_usage": True}},
+            **params
+        )
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = _usage(chunk.usage)
+            for choice in chunk.choices:
+                content = choice.delta.content
+                if content:
+                    parts.append(content)
+                    yield sse("token", {"content": content})
+    except Exception as e:
+        print(f"OpenAI streaming error: {str(e)}")
+        yield sse("error", {"response": ERROR_REPLY, "success": False, "error": str(e)})
+        return
+
+    yield sse("done", await finish("".join(parts), usage))
+
+
+def stream_text(text, finish):
+    """SSE frames for a reply that is already complete, e.g. one answered without the model"""
+    yield sse("token", {"content": text})
+    yield sse("done", finish(text))
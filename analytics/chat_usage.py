@@ -0,0 +1,48 @@
+"""
+Token usage and estimated cost of chat replies.
+"""
+from types import SimpleNamespace
+
+# Usage reported for replies that never reach the model
+ZERO_USAGE = SimpleNamespace(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+
+
+def calculate_cost(usage, model):
+    """Calculate estimated cost based on token usage"""
+    pricing = {
+        "gpt-4o-mini": {
+            "input": 0.150 / 1_000_000,
+            "output": 0.600 / 1_000_000
+        },
+        "gpt-4o": {
+            "input": 2.50 / 1_000_000,
+            "output": 10.00 / 1_000_000
+        },
+        "gpt-3.5-turbo": {
+            "input": 0.50 / 1_000_000,
+            "output": 1.50 / 1_000_000
+        }
+    }
+
+    model_pricing = pricing.get(model, pricing["gpt-4o-mini"])
+    input_cost = usage.prompt_tokens * model_pricing["input"]
+    output_cost = usage.completion_tokens * model_pricing["output"]
+    total_cost = input_cost + output_cost
+
+    return {
+        "input_cost": round(input_cost, 6),
+        "output_cost": round(output_cost, 6),
+        "total_cost": round(total_cost, 6)
+    }
+
+
+def usage_summary(usage, model):
+    """Token counts and estimated cost for a response, None if the model didn't report usage"""
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+        "estimated_cost": calculate_cost(usage, model)
+    }
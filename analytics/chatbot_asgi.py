@@ -0,0 +1,439 @@
+"""
+Asyncio serving mode for the chatbot.
+
+Serves the routes of chatbot_service.py with the same paths and request and
+response shapes, but on Starlette with the async OpenAI client and the Motor
+driver. A turn waiting on the model holds no thread, so one process keeps
+many chats in flight:
+
+    uvicorn chatbot_asgi:app --host 0.0.0.0 --port 5052
+
+A turn's two context aggregations (the period and 7-day views in one $facet,
+and the per-day load behind the training insights) run concurrently with each
+other and with loading the conversation history. Built contexts are cached
+per user and period for CHAT_CONTEXT_TTL seconds; this process doesn't read
+data_versions, so the TTL alone bounds how stale they get. At most
+CHAT_MAX_CONCURRENCY chats are in flight per process; the rest wait up to
+CHAT_QUEUE_TIMEOUT seconds for a slot and are then turned away with a 503.
+
+The history store is the one chatbot_service.py uses. Its MongoDB backend
+runs on worker threads.
+"""
+import asyncio
+import os
+import sys
+import time
+import traceback
+from datetime import datetime
+
+import httpx
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from openai import AsyncOpenAI
+from pymongo import MongoClient
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+from chat_context import (STATIC_INSTRUCTIONS, build_context_prompt, context_pipeline, context_window,
+                          contexts_from_facet, daily_load_pipeline, daily_load_rows, detect_days_back,
+                          empty_contexts)
+from chat_intents import IntentRouter
+from chat_stream import ERROR_REPLY, astream_chat, sse
+from chat_suggestions import get_dynamic_suggestions, suggestions_after_reply
+from chat_usage import ZERO_USAGE, usage_summary
+from context_cache import ContextCache
+from conversation_store import from_env as conversation_store_from_env
+from insights import TrainingLoad
+from prompt_budget import LEGACY_HISTORY_MESSAGES, PromptAssembler, RollingSummaries
+from response_cache import ResponseCache
+
+load_dotenv()
+
+openai_api_key = os.getenv("OPENAI_API_KEY")
+if not openai_api_key:
+    print("ERROR: OPENAI_API_KEY not found in environment variables!")
+    sys.exit(1)
+
+mongo_uri = os.getenv('MONGO_URI')
+mongo_db = os.getenv('MONGO_DB')
+if not mongo_uri or not mongo_db:
+    print("ERROR: MONGO_URI and MONGO_DB must be set in environment variables!")
+    sys.exit(1)
+
+MODEL = "gpt-4o-mini"
+CHAT_MAX_CONCURRENCY = int(os.getenv('CHAT_MAX_CONCURRENCY', 200))
+CHAT_QUEUE_TIMEOUT = float(os.getenv('CHAT_QUEUE_TIMEOUT', 10))
+BUSY_REPLY = "I'm a bit busy right now. Please try again in a moment! 😊"
+
+# One pooled connection per chat slot, so slots never queue for a connection
+client = AsyncOpenAI(
+    api_key=openai_api_key,
+    base_url=os.getenv('OPENAI_BASE_URL') or None,
+    http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=CHAT_MAX_CONCURRENCY,
+                                                      max_keepalive_connections=CHAT_MAX_CONCURRENCY)))
+
+mongo_client = AsyncIOMotorClient(mongo_uri, event_listeners=metrics.mongo_event_listeners())
+db = mongo_client[mongo_db]
+
+# Conversation history, shared with chatbot_service.py; the MongoDB backend is synchronous
+conversation_store = conversation_store_from_env(MongoClient(mongo_uri)[mongo_db])
+
+intent_router = IntentRouter()
+response_cache = ResponseCache(
+    ttl=int(os.getenv('CHAT_RESPONSE_TTL', 600)),
+    max_entries=int(os.getenv('CHAT_RESPONSE_CACHE_SIZE', 2048)))
+prompt_assembler = PromptAssembler(
+    budget=int(os.getenv('CHAT_PROMPT_TOKENS', 1200)),
+    max_history=int(os.getenv('CHAT_PROMPT_HISTORY', LEGACY_HISTORY_MESSAGES)),
+    model=MODEL,
+    summaries=RollingSummaries(idle_ttl=int(os.getenv('CHAT_HISTORY_TTL', 3600))))
+
+# Cached values are tasks, so concurrent turns for the same user and period await one build
+context_cache = ContextCache(
+    lambda username, days_back: asyncio.ensure_future(build_chat_contexts(username, days_back)),
+    ttl=int(os.getenv('CHAT_CONTEXT_TTL', 60)))
+
+
+class ChatSlots:
+    """At most ``limit`` chats in flight; one past it waits up to ``timeout`` seconds for a slot"""
+
+    def __init__(self, limit, timeout):
+        self.limit = limit
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = None
+
+    async def acquire(self):
+        """True once a slot is held, False if none came free in time"""
+        if self._semaphore is None:
+            # Created on first use so it belongs to the server's event loop
+            self._semaphore = asyncio.Semaphore(self.limit)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {"limit": self.limit, "in_flight": self.in_flight, "waiting": self.waiting,
+                "rejected": self.rejected}
+
+
+chat_slots = ChatSlots(CHAT_MAX_CONCURRENCY, CHAT_QUEUE_TIMEOUT)
+
+
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+async def aggregate(collection, pipeline):
+    return await collection.aggregate(pipeline).to_list(length=None)
+
+
+async def build_chat_contexts(username, days_back):
+    """(period context, 7-day fitness context) from two aggregations run together"""
+    today = datetime.now()
+    period_start, week_start = context_window(days_back, today)
+    facet, daily = await asyncio.gather(
+        aggregate(db.exercises, context_pipeline(username, period_start, week_start)),
+        aggregate(db.exercises, daily_load_pipeline(username)))
+    period_context, fitness_context = contexts_from_facet(facet[0] if facet else {}, days_back)
+    day = today.toordinal()
+    period_context["insights"] = TrainingLoad.from_days(daily_load_rows(daily), day).summary(day)
+    return period_context, fitness_context
+
+
+async def get_chat_contexts(username, days_back=7):
+    """(period context, 7-day fitness context), built at most once per TTL per user and period"""
+    try:
+        # Shielded: a client hanging up mustn't cancel a build other turns are waiting on
+        return await asyncio.shield(context_cache.get(username, days_back, datetime.now().date()))
+    except Exception as e:
+        # Don't keep serving the failed build
+        context_cache.invalidate(username)
+        print(f"❌ Error fetching user context: {e}")
+        traceback.print_exc()
+        return empty_contexts(days_back)
+
+
+async def load_turn(username, user_message, days_back):
+    """The turn's contexts and its history ending with the question, fetched concurrently"""
+    (user_context, user_ctx), history = await asyncio.gather(
+        get_chat_contexts(username, days_back),
+        asyncio.to_thread(conversation_store.recent, username))
+    return user_context, user_ctx, history + [{"role": "user", "content": user_message}]
+
+
+async def record_turn(username, user_message, reply):
+    def append():
+        conversation_store.append(username, "user", user_message)
+        conversation_store.append(username, "assistant", reply)
+    await asyncio.to_thread(append)
+
+
+async def finish_local_reply(username, user_message, reply, context, user_ctx, history, **source):
+    """
+    Record a reply answered without calling the model and build its response
+    payload; source says where it came from (intent=..., or cached=True)
+    """
+    await record_turn(username, user_message, reply)
+    return {
+        "response": reply,
+        "success": True,
+        "suggestions": suggestions_after_reply(context.get('screen', 'general'), history, reply, user_ctx),
+        "usage": usage_summary(ZERO_USAGE, MODEL),
+        **source
+    }
+
+
+def reply_cost(usage):
+    return usage["estimated_cost"]["total_cost"] if usage is not None else 0.0
+
+
+def record_model_cost(usage):
+    if usage is not None:
+        cost = reply_cost(usage)
+        intent_router.record_model_reply(cost)
+        metrics.CHAT_MODEL_COST.inc(cost)
+
+
+def local_reply(data, username, user_message, days_back, context, user_context, history):
+    """
+    (reply, source) for a turn answered without the model, from an intent or
+    the response cache; otherwise (None, (cache key, context prompt))
+    """
+    routed = intent_router.route(user_message, user_context, days_back)
+    if routed:
+        intent, reply = routed
+        return reply, {"intent": intent}
+    context_prompt = build_context_prompt(context, user_context, days_back)
+    cache_key = response_cache.key(username, user_message, days_back, context.get('screen', 'general'),
+                                   context_prompt, use_cache=data.get('cache', True))
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached, {"cached": True}
+    return None, (cache_key, context_prompt)
+
+
+def busy_response():
+    return JSONResponse({"response": BUSY_REPLY, "success": False, "error": "busy"}, status_code=503)
+
+
+def missing_message_response():
+    return JSONResponse({
+        "response": "I didn't receive a message. Please try again!",
+        "success": False
+    }, status_code=400)
+
+
+async def chat(request):
+    """Main chat endpoint"""
+    data = await read_json(request)
+    user_message = data.get('message', '')
+    username = data.get('username', '')
+    context = data.get('context', {})
+
+    if not user_message or not username:
+        return missing_message_response()
+    if not await chat_slots.acquire():
+        return busy_response()
+
+    try:
+        started = time.perf_counter()
+        days_back = detect_days_back(user_message)
+        user_context, user_ctx, history = await load_turn(username, user_message, days_back)
+
+        reply, source = local_reply(data, username, user_message, days_back, context, user_context, history)
+        if reply is not None:
+            payload = await finish_local_reply(username, user_message, reply, context, user_ctx, history, **source)
+            metrics.CHAT_REPLY_LATENCY.labels("local" if "intent" in source else "cache").observe(
+                time.perf_counter() - started)
+            return JSONResponse(payload)
+        cache_key, context_prompt = source
+
+        messages, prompt_report = prompt_assembler.assemble(username, STATIC_INSTRUCTIONS, context_prompt, history)
+
+        try:
+            response = await client.chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                max_tokens=150,
+                temperature=0.7,
+                presence_penalty=0.1,
+                frequency_penalty=0.1
+            )
+        except Exception as e:
+            print(f"OpenAI API Error: {str(e)}")
+            traceback.print_exc()
+            return JSONResponse({"response": ERROR_REPLY, "success": False, "error": str(e)}, status_code=500)
+
+        assistant_message = response.choices[0].message.content
+        await record_turn(username, user_message, assistant_message)
+        usage = usage_summary(response.usage, MODEL)
+        record_model_cost(usage)
+        response_cache.put(cache_key, assistant_message, reply_cost(usage))
+        metrics.CHAT_REPLY_LATENCY.labels("model").observe(time.perf_counter() - started)
+
+        return JSONResponse({
+            "response": assistant_message,
+            "success": True,
+            "suggestions": suggestions_after_reply(context.get('screen', 'general'), history, assistant_message,
+                                                   user_ctx),
+            "usage": usage,
+            "prompt_budget": prompt_report
+        })
+    finally:
+        chat_slots.release()
+
+
+async def chat_stream(request):
+    """
+    Chat endpoint streaming the reply as Server-Sent Events: a "token" event
+    per chunk of text, then a "done" event with suggestions and usage
+    """
+    data = await read_json(request)
+    user_message = data.get('message', '')
+    username = data.get('username', '')
+    context = data.get('context', {})
+
+    if not user_message or not username:
+        return missing_message_response()
+    return StreamingResponse(stream_turn(data, username, user_message, context), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def stream_turn(data, username, user_message, context):
+    # The slot is held for as long as the reply streams
+    if not await chat_slots.acquire():
+        yield sse("error", {"response": BUSY_REPLY, "success": False, "error": "busy"})
+        return
+
+    try:
+        days_back = detect_days_back(user_message)
+        user_context, user_ctx, history = await load_turn(username, user_message, days_back)
+
+        reply, source = local_reply(data, username, user_message, days_back, context, user_context, history)
+        if reply is not None:
+            yield sse("token", {"content": reply})
+            yield sse("done", await finish_local_reply(username, user_message, reply, context, user_ctx, history,
+                                                       **source))
+            return
+        cache_key, context_prompt = source
+
+        messages, prompt_report = prompt_assembler.assemble(username, STATIC_INSTRUCTIONS, context_prompt, history)
+
+        # The message is only added to history once the reply has streamed in full
+        async def finish(assistant_message, usage):
+            await record_turn(username, user_message, assistant_message)
+            usage = usage_summary(usage, MODEL)
+            record_model_cost(usage)
+            response_cache.put(cache_key, assistant_message, reply_cost(usage))
+            return {
+                "response": assistant_message,
+                "success": True,
+                "suggestions": suggestions_after_reply(context.get('screen', 'general'), history, assistant_message,
+                                                       user_ctx),
+                "usage": usage,
+                "prompt_budget": prompt_report
+            }
+
+        async for frame in astream_chat(
+            client, MODEL, messages, finish,
+            max_tokens=150,
+            temperature=0.7,
+            presence_penalty=0.1,
+            frequency_penalty=0.1
+        ):
+            yield frame
+    finally:
+        chat_slots.release()
+
+
+async def get_suggestions(request):
+    """Get contextual quick suggestions"""
+    screen = request.query_params.get('screen', 'general')
+    username = request.query_params.get('username', '')
+
+    if username:
+        (_, user_context), conversation_history = await asyncio.gather(
+            get_chat_contexts(username),
+            asyncio.to_thread(conversation_store.recent, username, 6))
+    else:
+        user_context, conversation_history = {}, []
+
+    return JSONResponse({"suggestions": get_dynamic_suggestions(screen, conversation_history, user_context)})
+
+
+async def chat_stats(request):
+    """How many questions were answered without the model, and what that saved"""
+    return JSONResponse({
+        "intents": intent_router.stats(),
+        "response_cache": response_cache.stats(),
+        "context_cache": context_cache.stats(),
+        "prompt_budget": prompt_assembler.stats(),
+        "history": await asyncio.to_thread(conversation_store.stats),
+        "concurrency": chat_slots.stats()
+    })
+
+
+async def reset_conversation(request):
+    """Reset conversation history"""
+    username = (await read_json(request)).get('username', '')
+    if username:
+        await asyncio.to_thread(conversation_store.reset, username)
+        prompt_assembler.forget(username)
+        response_cache.forget(username)
+    return JSONResponse({"success": True, "message": "Conversation reset"})
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    return JSONResponse({
+        "status": "healthy",
+        "service": "chatbot",
+        "model": MODEL,
+        "mongodb_connected": True,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+async def prometheus_metrics(request):
+    return Response(metrics.latest(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+
+routes = [
+    Route('/api/chat', chat, methods=['POST']),
+    Route('/api/chat/stream', chat_stream, methods=['POST']),
+    Route('/api/chat/suggestions', get_suggestions, methods=['GET']),
+    Route('/api/chat/stats', chat_stats, methods=['GET']),
+    Route('/api/chat/reset', reset_conversation, methods=['POST']),
+    Route('/health', health_check, methods=['GET']),
+    Route('/metrics', prometheus_metrics, methods=['GET']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        Middleware(metrics.RequestMetrics, service="chatbot", routes=routes),
+    ],
+)
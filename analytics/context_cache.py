@@ -0,0 +1,140 @@
+"""
+Short-lived cache of built chat contexts, keyed by user and period.
+
+A chat turn and the suggestions that follow it, and every screen load of
+/api/chat/suggestions, need the same per-user context. Entries live for
+``ttl`` seconds, and only for the day they were built on, since the period
+windows end today.
+
+When a data-version source is given, each lookup compares the user's current
+version with the one the entry was built at, so a write from any service
+invalidates it before the TTL would. ``on_change`` is called once when a
+user's version moves, so the caches the builder reads from can be dropped
+too. Concurrent misses for the same key share a single build.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """A build in progress that other callers can wait on"""
+
+    __slots__ = ("done", "value", "error", "stale")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        # Set when the user is invalidated mid-build: the result is returned but not stored
+        self.stale = False
+
+
+class ContextCache:
+    """TTL + LRU cache of build(username, days_back) results with single-flight misses"""
+
+    def __init__(self, build, ttl=60, max_entries=4096, version_of=None, on_change=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.invalidations = 0
+        self._build = build
+        self._version_of = version_of
+        self._on_change = on_change
+        self._clock = clock
+        # (username, days_back) -> (value, built_at, day, version)
+        self._entries = OrderedDict()
+        # username -> last data version seen, least recently looked up first
+        self._versions = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _check_version(self, username):
+        """The user's current data version, calling on_change if it moved since the last lookup"""
+        if self._version_of is None:
+            return None
+        version = self._version_of(username)
+        with self._lock:
+            previous = self._versions.get(username, version)
+            self._versions[username] = version
+            self._versions.move_to_end(username)
+            while len(self._versions) > self.max_entries:
+                self._versions.popitem(last=False)
+            changed = previous != version
+            if changed:
+                self._drop(username)
+        if changed and self._on_change is not None:
+            self._on_change(username)
+        return version
+
+    def get(self, username, days_back, day):
+        """Cached build(username, days_back) for the given day, building it if missing or stale"""
+        version = self._check_version(username)
+        key = (username, days_back)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, built_at, built_day, built_version = entry
+                if now - built_at < self.ttl and built_day == day and built_version == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = self._build(username, days_back)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                if flight.error is None and not flight.stale:
+                    self._entries[key] = (flight.value, now, day, version)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            flight.done.set()
+        return flight.value
+
+    def _drop(self, username):
+        for key in [key for key in self._entries if key[0] == username]:
+            del self._entries[key]
+            self.invalidations += 1
+        for key, flight in self._flights.items():
+            if key[0] == username:
+                flight.stale = True
+
+    def invalidate(self, *usernames):
+        """Forget users whose activities were just created or edited"""
+        with self._lock:
+            for username in usernames:
+                self._drop(username)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.shared
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "hit_ratio": round((self.hits + self.shared) / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
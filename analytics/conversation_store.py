@@ -0,0 +1,173 @@
+"""
+Chat conversation history with bounded memory.
+
+Two backends implement the same interface (append, recent, reset, stats):
+
+- MemoryConversationStore keeps the last ``max_messages`` messages per user in
+  a ring buffer, evicts the least recently active user beyond ``max_users``
+  and forgets users idle for longer than ``idle_ttl`` seconds. History is
+  per process.
+- MongoConversationStore appends to a capped collection shared by every
+  worker process, so its size on disk is fixed and any worker can serve any
+  turn. Capped collections can't delete documents, so a reset appends a
+  marker and reads stop at the newest one.
+
+CHAT_HISTORY_BACKEND picks the backend (``memory`` or ``mongo``).
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+
+from pymongo import DESCENDING
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger("conversation_store")
+
+MESSAGES_COLLECTION = "chat_messages"
+# Role of the marker a reset appends to the Mongo backend
+RESET_ROLE = "reset"
+
+
+class MemoryConversationStore:
+    """Per-user ring buffers in one process, LRU-evicted and expired when idle"""
+
+    def __init__(self, max_messages=20, max_users=10000, idle_ttl=3600, clock=time.monotonic):
+        self.max_messages = max_messages
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.evictions = 0
+        self.expirations = 0
+        self._clock = clock
+        # username -> [deque of messages, last activity]; least recently active first
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._users:
+            username, (_, last_active) = next(iter(self._users.items()))
+            if now - last_active < self.idle_ttl:
+                break
+            del self._users[username]
+            self.expirations += 1
+
+    def append(self, username, role, content):
+        now = self._clock()
+        with self._lock:
+            self._expire(now)
+            entry = self._users.get(username)
+            if entry is None:
+                entry = self._users[username] = [deque(maxlen=self.max_messages), now]
+            entry[0].append({"role": role, "content": content})
+            entry[1] = now
+            self._users.move_to_end(username)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self.evictions += 1
+
+    def recent(self, username, limit=None):
+        """The user's last messages, oldest first"""
+        now = self._clock()
+        with self._lock:
+            self._expire(now)
+            entry = self._users.get(username)
+            if entry is None:
+                return []
+            messages = list(entry[0])
+        return messages[-limit:] if limit else messages
+
+    def reset(self, username):
+        with self._lock:
+            self._users.pop(username, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "users": len(self._users),
+                "messages": sum(len(messages) for messages, _ in self._users.values()),
+                "max_users": self.max_users,
+                "max_messages": self.max_messages,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class MongoConversationStore:
+    """Messages in a capped collection shared by every worker process"""
+
+    def __init__(self, db, max_messages=20, idle_ttl=3600, size_bytes=64 * 1024 * 1024,
+                 collection=MESSAGES_COLLECTION):
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self.size_bytes = size_bytes
+        self.collection = db[collection]
+        self._ensure_collection(db, collection)
+
+    def _ensure_collection(self, db, name):
+        try:
+            db.create_collection(name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            # Already there (another worker got to it first)
+            if not self.collection.options().get("capped"):
+                logger.warning("%s exists but isn't capped; chat history won't be bounded", name)
+        self.collection.create_index([("username", 1), ("_id", DESCENDING)], name="username_1__id_-1")
+
+    def append(self, username, role, content):
+        self.collection.insert_one({
+            "username": username,
+            "role": role,
+            "content": content,
+            "at": datetime.now(timezone.utc),
+        })
+
+    def recent(self, username, limit=None):
+        """The user's last messages since their last reset, oldest first"""
+        limit = min(limit or self.max_messages, self.max_messages)
+        docs = self.collection.find(
+            {"username": username}, {"_id": 0, "role": 1, "content": 1, "at": 1}
+        ).sort("_id", DESCENDING).limit(limit + 1)
+
+        messages = []
+        for doc in docs:
+            if doc["role"] == RESET_ROLE:
+                break
+            messages.append(doc)
+        if not messages:
+            return []
+        # The conversation has gone idle: start afresh, like the memory backend
+        newest = messages[0]["at"]
+        if newest.tzinfo is None:
+            newest = newest.replace(tzinfo=timezone.utc)
+        if datetime.now(timezone.utc) - newest > timedelta(seconds=self.idle_ttl):
+            return []
+        return [{"role": doc["role"], "content": doc["content"]} for doc in reversed(messages[:limit])]
+
+    def reset(self, username):
+        self.append(username, RESET_ROLE, "")
+
+    def stats(self):
+        collection_stats = self.collection.database.command("collStats", self.collection.name)
+        return {
+            "backend": "mongo",
+            "messages": collection_stats.get("count", 0),
+            "bytes": collection_stats.get("size", 0),
+            "max_bytes": collection_stats.get("maxSize", self.size_bytes),
+            "max_messages": self.max_messages,
+        }
+
+
+def from_env(db):
+    """The store selected by CHAT_HISTORY_BACKEND and the CHAT_HISTORY_* limits"""
+    backend = os.getenv("CHAT_HISTORY_BACKEND", "memory")
+    max_messages = int(os.getenv("CHAT_HISTORY_MESSAGES", 20))
+    idle_ttl = int(os.getenv("CHAT_HISTORY_TTL", 3600))
+    if backend == "mongo":
+        return MongoConversationStore(db, max_messages=max_messages, idle_ttl=idle_ttl,
+                                      size_bytes=int(os.getenv("CHAT_HISTORY_MB", 64)) * 1024 * 1024)
+    if backend != "memory":
+        raise ValueError(f"Unknown CHAT_HISTORY_BACKEND: {backend}")
+    return MemoryConversationStore(max_messages=max_messages, idle_ttl=idle_ttl,
+                                   max_users=int(os.getenv("CHAT_HISTORY_USERS", 10000)))
@@ -0,0 +1,261 @@
+"""
+Per-user data versions for conditional GETs.
+
+``data_versions`` holds one document per user, ``{_id: username, version: n}``.
+The version is incremented on every write to that user's exercises, so
+analytics responses can carry an ETag derived from it and a poll with a
+matching If-None-Match is answered with 304 from a single indexed lookup,
+without touching the exercises collection. AsyncDataVersions reads the same
+documents through Motor for the ASGI app.
+
+The analytics APIs bump versions for their own writes. Writes made by other
+services (the Node activity-tracking service) are picked up by the change
+stream worker:
+
+    python data_versions.py watch
+
+The worker records a heartbeat, and ETags are only issued while it is
+recent. If the worker is down, every request is served in full instead of
+risking a stale 304. Changes that can't be attributed to a user (a delete
+without a pre-image) and worker restarts bump a global epoch that is part of
+every ETag.
+
+A process that answers from in-memory caches passes ``on_change``: it is
+called whenever the versions read for a user differ from the last ones seen
+(or none were seen yet), so those caches never outlive an ETag. A write the
+process has already applied to its caches is reported with written(), so the
+version it produced doesn't count as a change.
+"""
+import argparse
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+VERSIONS_COLLECTION = "data_versions"
+STATE_COLLECTION = "data_version_state"
+WORKER_ID = "exercises_change_stream"
+# Bumped when a change can't be attributed to a user; part of every ETag
+ALL_USERS = "*"
+# The worker touches its heartbeat at least this often, even when idle
+HEARTBEAT_INTERVAL = 10
+
+logger = logging.getLogger("data_versions")
+
+
+def bump_ops(usernames):
+    """Write ops that increment each user's version"""
+    now = datetime.now(timezone.utc)
+    return [UpdateOne({"_id": username}, {"$inc": {"version": 1}, "$set": {"updated_at": now}}, upsert=True)
+            for username in sorted({u for u in usernames if u})]
+
+
+def bump(db, *usernames):
+    ops = bump_ops(usernames)
+    if ops:
+        db[VERSIONS_COLLECTION].bulk_write(ops, ordered=False)
+
+
+def bump_user(db, username):
+    """Increment one user's version and return the new value"""
+    doc = db[VERSIONS_COLLECTION].find_one_and_update(
+        {"_id": username}, {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        projection={"version": 1}, upsert=True, return_document=ReturnDocument.AFTER)
+    return doc["version"]
+
+
+def etag_for(versions, username, key):
+    """Strong ETag for one representation (key) of a user's data at the given versions"""
+    raw = f"{versions.get(username, 0)}:{versions.get(ALL_USERS, 0)}:{username}:{key}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def heartbeat_is_recent(state, grace):
+    heartbeat = (state or {}).get("heartbeat")
+    if not isinstance(heartbeat, datetime):
+        return False
+    if heartbeat.tzinfo is None:
+        heartbeat = heartbeat.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - heartbeat).total_seconds() < grace
+
+
+def versions_query(username):
+    return {"_id": {"$in": [username, ALL_USERS]}}
+
+
+class DataVersions:
+    """Reads versions for ETags, trusting them only while the change stream worker is alive"""
+
+    def __init__(self, db, heartbeat_grace=3 * HEARTBEAT_INTERVAL, check_every=5, on_change=None,
+                 max_users=4096, clock=time.monotonic):
+        self.db = db
+        self.heartbeat_grace = heartbeat_grace
+        self.check_every = check_every
+        self.max_users = max_users
+        self._on_change = on_change
+        self._clock = clock
+        self._trusted = False
+        self._checked_at = None
+        # username -> (version, epoch) last read, least recently read first
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached_trust(self, now):
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_every:
+                return self._trusted
+        return None
+
+    def _store_trust(self, trusted, now):
+        with self._lock:
+            self._trusted, self._checked_at = trusted, now
+        return trusted
+
+    def trusted(self):
+        """Whether the worker has reported in recently enough for versions to be complete"""
+        now = self._clock()
+        trusted = self._cached_trust(now)
+        if trusted is not None:
+            return trusted
+        state = self.db[STATE_COLLECTION].find_one({"_id": WORKER_ID}, {"heartbeat": 1})
+        return self._store_trust(heartbeat_is_recent(state, self.heartbeat_grace), now)
+
+    def current(self, username):
+        """{username: version, ALL_USERS: epoch} for the user"""
+        docs = self.db[VERSIONS_COLLECTION].find(versions_query(username), {"version": 1})
+        return {doc["_id"]: doc.get("version", 0) for doc in docs}
+
+    def _observe(self, username, versions):
+        """Call on_change if the user's versions moved since they were last read"""
+        if self._on_change is None:
+            return
+        seen = (versions.get(username, 0), versions.get(ALL_USERS, 0))
+        with self._lock:
+            previous = self._seen.get(username)
+            self._seen[username] = seen
+            self._seen.move_to_end(username)
+            while len(self._seen) > self.max_users:
+                self._seen.popitem(last=False)
+        if previous != seen:
+            self._on_change(username)
+
+    def written(self, username, version):
+        """
+        Note that this process wrote version (from bump_user) and already updated
+        its caches for it. Only a step of one from the last version seen is ours
+        alone; anything else still counts as a change when next read
+        """
+        with self._lock:
+            previous = self._seen.get(username)
+            if previous is not None and previous[0] == version - 1:
+                self._seen[username] = (version, previous[1])
+
+    def etag(self, username, key):
+        """ETag for a user's data, or None if versions can't be trusted right now"""
+        if not self.trusted():
+            return None
+        versions = self.current(username)
+        self._observe(username, versions)
+        return etag_for(versions, username, key)
+
+
+class AsyncDataVersions(DataVersions):
+    """DataVersions over a Motor database, for the ASGI app"""
+
+    async def trusted(self):
+        now = self._clock()
+        trusted = self._cached_trust(now)
+        if trusted is not None:
+            return trusted
+        state = await self.db[STATE_COLLECTION].find_one({"_id": WORKER_ID}, {"heartbeat": 1})
+        return self._store_trust(heartbeat_is_recent(state, self.heartbeat_grace), now)
+
+    async def current(self, username):
+        docs = self.db[VERSIONS_COLLECTION].find(versions_query(username), {"version": 1})
+        return {doc["_id"]: doc.get("version", 0) async for doc in docs}
+
+    async def etag(self, username, key):
+        if not await self.trusted():
+            return None
+        versions = await self.current(username)
+        self._observe(username, versions)
+        return etag_for(versions, username, key)
+
+
+def changed_username(change):
+    """The user an exercises change belongs to, if it can be told"""
+    for field in ("fullDocument", "fullDocumentBeforeChange"):
+        doc = change.get(field) or {}
+        if doc.get("username"):
+            return doc["username"]
+    return None
+
+
+def _heartbeat(db, resume_token=None):
+    update = {"heartbeat": datetime.now(timezone.utc)}
+    if resume_token is not None:
+        update["resume_token"] = resume_token
+    db[STATE_COLLECTION].update_one({"_id": WORKER_ID}, {"$set": update}, upsert=True)
+
+
+def run_worker(db):
+    """Tail the exercises change stream and bump the version of every user written to"""
+    try:
+        # Lets deletes be attributed to a user (MongoDB 6.0+)
+        db.command("collMod", "exercises", changeStreamPreAndPostImages={"enabled": True})
+    except OperationFailure as e:
+        logger.warning("Could not enable change stream pre-images: %s", e)
+
+    state = db[STATE_COLLECTION].find_one({"_id": WORKER_ID}) or {}
+    options = {
+        "full_document": "updateLookup",
+        "full_document_before_change": "whenAvailable",
+        "max_await_time_ms": HEARTBEAT_INTERVAL * 1000,
+    }
+    if state.get("resume_token"):
+        options["resume_after"] = state["resume_token"]
+    # ETags issued before the worker went down may predate writes it hasn't
+    # replayed yet (or never saw, without a resume token): invalidate them all
+    bump(db, ALL_USERS)
+
+    logger.info("Watching exercises for data version changes")
+    with db.exercises.watch(**options) as stream:
+        _heartbeat(db)
+        while stream.alive:
+            change = stream.try_next()
+            if change is not None:
+                bump(db, changed_username(change) or ALL_USERS)
+            _heartbeat(db, stream.resume_token)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain per-user data versions for ETags")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("watch", help="tail the exercises change stream")
+    parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGO_URI'))
+    db = client[os.getenv('MONGO_DB')]
+
+    try:
+        run_worker(db)
+    except KeyboardInterrupt:
+        pass
+    except PyMongoError as e:
+        logger.error("Data version worker failed: %s", e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Fast JSON encoding for analytics responses.
+
+Uses orjson when it is installed and falls back to the standard json module
+otherwise. ObjectId and datetime values are handled natively, either as plain
+strings or, with ``extended=True``, in the same relaxed Extended JSON format
+bson.json_util produces ({"$oid": ...}, {"$date": ...}).
+
+json_response() is a drop-in replacement for flask.jsonify that also
+compresses the body with brotli or gzip when the client accepts it, and
+stream_json_array()/stream_json_object()/stream_ndjson() encode large results a
+batch at a time.
+"""
+import gzip
+import json
+import zlib
+from datetime import date, datetime, timezone
+
+from bson import ObjectId
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 1024
+STREAM_BATCH_SIZE = 500
+# Last line of an NDJSON stream that failed part-way
+ERROR_LINE = b'{"error":"stream interrupted"}\n'
+
+
+def _extended_date(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    millis = value.microsecond // 1000
+    fraction = ".%03d" % millis if millis else ""
+    return {"$date": value.strftime("%Y-%m-%dT%H:%M:%S") + fraction + "Z"}
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _extended_default(value):
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    if isinstance(value, datetime):
+        return _extended_date(value)
+    return _default(value)
+
+
+if orjson is not None:
+    def dumps(obj, extended=False):
+        """Encode obj as JSON bytes"""
+        if extended:
+            # Let the default handler render datetimes as {"$date": ...}
+            return orjson.dumps(obj, default=_extended_default,
+                                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(obj, extended=False):
+        """Encode obj as JSON bytes"""
+        return json.dumps(obj, default=_extended_default if extended else _default,
+                          separators=(",", ":")).encode()
+
+
+def negotiate_encoding():
+    """Pick the best compression the client accepts, or None"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=4)
+    return gzip.compress(body, compresslevel=5)
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of byte chunks incrementally"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=4)
+        for chunk in chunks:
+            out = compressor.process(chunk)
+            if out:
+                yield out
+        yield compressor.finish()
+        return
+
+    compressor = zlib.compressobj(5, zlib.DEFLATED, 31)  # 31 = gzip container
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _with_encoding(response, encoding):
+    response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+def encoded_response(body, mimetype="application/json"):
+    """Wrap an encoded body, compressed if it's large enough and the client accepts it"""
+    encoding = negotiate_encoding() if len(body) >= MIN_COMPRESS_SIZE else None
+    if encoding is None:
+        return Response(body, mimetype=mimetype)
+    return _with_encoding(Response(compress(body, encoding), mimetype=mimetype), encoding)
+
+
+def json_response(*args, **kwargs):
+    """Same call signature as flask.jsonify, encoded with the fast backend"""
+    if args and kwargs:
+        raise TypeError("json_response() takes either positional or keyword arguments, not both")
+    if len(args) == 1:
+        data = args[0]
+    else:
+        data = list(args) if args else kwargs
+    return encoded_response(dumps(data))
+
+
+def stream_json_array(docs, extended=False, batch_size=STREAM_BATCH_SIZE, on_error=None):
+    """
+    Yield a JSON array of documents a batch at a time. If reading fails once
+    the stream has started, the array is left unclosed (and the generator
+    returns False), so clients can't mistake what they got for the whole of it
+    """
+    yield b"["
+    chunk = []
+    first = True
+    try:
+        for doc in docs:
+            chunk.append(dumps(doc, extended))
+            if len(chunk) >= batch_size:
+                yield (b"" if first else b",") + b",".join(chunk)
+                first = False
+                chunk = []
+        if chunk:
+            yield (b"" if first else b",") + b",".join(chunk)
+    except Exception as e:
+        # Headers are already sent, so all we can do is report and cut the body short
+        if on_error is None:
+            raise
+        on_error(e)
+        return False
+    yield b"]"
+    return True
+
+
+def stream_json_object(items, extended=False, batch_size=STREAM_BATCH_SIZE, on_error=None):
+    """Yield a JSON object from (key, value) pairs a batch at a time; left unclosed on error, like stream_json_array"""
+    yield b"{"
+    chunk = []
+    first = True
+    try:
+        for key, value in items:
+            chunk.append(dumps(str(key)) + b":" + dumps(value, extended))
+            if len(chunk) >= batch_size:
+                yield (b"" if first else b",") + b",".join(chunk)
+                first = False
+                chunk = []
+        if chunk:
+            yield (b"" if first else b",") + b",".join(chunk)
+    except Exception as e:
+        if on_error is None:
+            raise
+        on_error(e)
+        return False
+    yield b"}"
+    return True
+
+
+def stream_ndjson(docs, extended=False, batch_size=STREAM_BATCH_SIZE, on_error=None):
+    """
+    Yield documents as newline-delimited JSON a batch at a time. Every line
+    would still parse if the stream were cut short, so a failure ends it with
+    an ERROR_LINE for clients to check for
+    """
+    chunk = []
+    try:
+        for doc in docs:
+            chunk.append(dumps(doc, extended))
+            if len(chunk) >= batch_size:
+                yield b"\n".join(chunk) + b"\n"
+                chunk = []
+        if chunk:
+            yield b"\n".join(chunk) + b"\n"
+    except Exception as e:
+        if on_error is None:
+            raise
+        on_error(e)
+        yield ERROR_LINE
+
+
+def streamed_response(chunks, mimetype="application/json"):
+    """Stream byte chunks to the client, compressed if it accepts it"""
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return Response(chunks, mimetype=mimetype)
+    return _with_encoding(Response(compress_stream(chunks, encoding), mimetype=mimetype), encoding)
@@ -0,0 +1,196 @@
+"""
+Columnar exports of a user's activity history (Parquet, Arrow IPC or CSV).
+
+Exports are built from a projected cursor one record batch at a time and
+written straight to a file in the export cache, keyed by the user and the
+version of their data, so repeat downloads are served from disk (memory
+mapped) without touching MongoDB again. The version comes from the user's
+data_versions document while the change stream worker keeps those complete.
+
+Files are opened before they are handed back, so a concurrent request that
+replaces a stale export can unlink it without breaking a download in progress.
+
+pyarrow is optional: without it only CSV is available.
+"""
+import csv
+import glob
+import hashlib
+import mmap
+import os
+import tempfile
+
+from data_versions import ALL_USERS
+from queries import created_at_of
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EXPORT_BATCH_SIZE = 5000
+SERVE_CHUNK_SIZE = 256 * 1024
+
+FORMATS = {
+    "parquet": {"mimetype": "application/vnd.apache.parquet", "extension": "parquet", "needs_arrow": True},
+    "arrow": {"mimetype": "application/vnd.apache.arrow.file", "extension": "arrow", "needs_arrow": True},
+    "csv": {"mimetype": "text/csv", "extension": "csv", "needs_arrow": False},
+}
+
+COLUMNS = ["id", "date", "exerciseType", "duration", "description", "createdAt"]
+PROJECTION = {"_id": 1, "date": 1, "exerciseType": 1, "duration": 1, "description": 1, "created_at": 1}
+
+if pa is not None:
+    SCHEMA = pa.schema([
+        ("id", pa.string()),
+        ("date", pa.timestamp("ms", tz="UTC")),
+        ("exerciseType", pa.string()),
+        ("duration", pa.int64()),
+        ("description", pa.string()),
+        ("createdAt", pa.timestamp("ms", tz="UTC")),
+    ])
+
+
+def available(fmt):
+    """Whether this server can produce the given format"""
+    return pa is not None or not FORMATS[fmt]["needs_arrow"]
+
+
+def cache_dir():
+    path = os.getenv("EXPORT_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "fitness-exports")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _user_key(username):
+    return hashlib.sha256(username.encode()).hexdigest()[:16]
+
+
+def data_version(db, username, versions=None):
+    """
+    Digest that changes whenever the user's exercises are added, edited or
+    removed: from their data_versions document while versions (a DataVersions)
+    trusts it, otherwise from an aggregation over their exercises
+    """
+    if versions is not None and versions.trusted():
+        current = versions.current(username)
+        raw = f"version:{current.get(username, 0)}:{current.get(ALL_USERS, 0)}"
+        return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+    result = list(db.exercises.aggregate([
+        {"$match": {"username": username}},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "last_id": {"$max": "$_id"},
+            "last_update": {"$max": {"$ifNull": ["$updatedAt", "$updated_at"]}},
+        }},
+    ]))
+    summary = result[0] if result else {}
+    raw = f"{summary.get('count', 0)}:{summary.get('last_id')}:{summary.get('last_update')}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def _row(doc):
+    duration = doc.get("duration")
+    return {
+        "id": str(doc["_id"]),
+        "date": doc.get("date"),
+        "exerciseType": doc.get("exerciseType"),
+        "duration": int(duration) if isinstance(duration, (int, float)) else None,
+        "description": doc.get("description", ""),
+        "createdAt": created_at_of(doc),
+    }
+
+
+def _batches(cursor, batch_size=EXPORT_BATCH_SIZE):
+    """Group cursor rows into column lists of at most batch_size rows"""
+    columns = {name: [] for name in COLUMNS}
+    size = 0
+    for doc in cursor:
+        for name, value in _row(doc).items():
+            columns[name].append(value)
+        size += 1
+        if size >= batch_size:
+            yield columns
+            columns = {name: [] for name in COLUMNS}
+            size = 0
+    if size:
+        yield columns
+
+
+def _write_arrow(cursor, path, fmt):
+    with pa.OSFile(path, "wb") as sink:
+        if fmt == "parquet":
+            writer = pq.ParquetWriter(sink, SCHEMA, compression="zstd")
+        else:
+            writer = pa.ipc.new_file(sink, SCHEMA)
+        with writer:
+            for columns in _batches(cursor):
+                writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=SCHEMA))
+
+
+def _write_csv(cursor, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for columns in _batches(cursor):
+            rows = zip(*(columns[name] for name in COLUMNS))
+            writer.writerows(
+                [value.isoformat() if hasattr(value, "isoformat") else value for value in row]
+                for row in rows
+            )
+
+
+def _open_cached(path):
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        return None
+
+
+def build_export(db, username, fmt, versions=None):
+    """Return an up-to-date export opened for reading, writing it if it isn't cached"""
+    version = data_version(db, username, versions)
+    directory = cache_dir()
+    prefix = os.path.join(directory, f"{_user_key(username)}-")
+    path = f"{prefix}{version}.{FORMATS[fmt]['extension']}"
+    cached = _open_cached(path)
+    if cached is not None:
+        return cached
+
+    cursor = db.exercises.find({"username": username}, PROJECTION).sort("date", 1).batch_size(EXPORT_BATCH_SIZE)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        if fmt == "csv":
+            _write_csv(cursor, tmp_path)
+        else:
+            _write_arrow(cursor, tmp_path, fmt)
+        # Opened before the rename, so the file stays readable whatever happens to the path
+        f = open(tmp_path, "rb")
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+    # Older versions of this user's exports are stale now
+    for stale in glob.glob(f"{prefix}*.{FORMATS[fmt]['extension']}"):
+        if stale != path:
+            try:
+                os.unlink(stale)
+            except OSError:
+                pass
+    return f
+
+
+def file_size(f):
+    return os.fstat(f.fileno()).st_size
+
+
+def iter_file(f, chunk_size=SERVE_CHUNK_SIZE):
+    """Yield an opened export from a memory map, chunk by chunk, closing it at the end"""
+    with f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(0, len(mapped), chunk_size):
+                yield mapped[offset:offset + chunk_size]
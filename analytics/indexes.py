@@ -0,0 +1,172 @@
+"""
+Declarative index management for the collections the analytics and chatbot
+services query.
+
+REQUIRED_INDEXES lists the indexes the query shapes below depend on.
+ensure_indexes() creates any that are missing, and index_report() shows
+usage stats plus the winning plan of each known query shape so a missing
+index (a COLLSCAN) is easy to spot.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from chat_context import context_pipeline, daily_load_pipeline
+
+logger = logging.getLogger("indexes")
+
+REQUIRED_INDEXES = [
+    # Range reads and per-user stats: username equality, newest first
+    {"collection": "exercises", "name": "username_1_date_-1",
+     "keys": [("username", 1), ("date", -1)]},
+    # Per-type breakdowns over a date window
+    {"collection": "exercises", "name": "username_1_exerciseType_1_date_1",
+     "keys": [("username", 1), ("exerciseType", 1), ("date", 1)]},
+    # update_activity_comment also matches on a legacy 'id' field
+    {"collection": "exercises", "name": "id_1",
+     "keys": [("id", 1)], "options": {"sparse": True}},
+]
+
+
+def _sample_window():
+    end = datetime.now()
+    return end - timedelta(days=7), end
+
+
+def query_shapes():
+    """Representative filters for every query the services run against exercises"""
+    start, end = _sample_window()
+    return [
+        {"name": "activities_range", "source": "app.get_activities_by_range",
+         "filter": {"username": "", "date": {"$gte": start, "$lt": end}}, "sort": [("date", -1)]},
+        {"name": "user_stats", "source": "app.user_stats",
+         "filter": {"username": ""}},
+        {"name": "daily_trend", "source": "app.daily_trend_stats",
+         "filter": {"username": "", "date": {"$gte": start, "$lt": end}}},
+        {"name": "series", "source": "app.series_stats",
+         "filter": {"username": "", "date": {"$gte": start, "$lt": end}}},
+        {"name": "weekly_journal", "source": "app.weekly_journal_stats",
+         "filter": {"username": "", "date": {"$gte": start, "$lt": end}}},
+        {"name": "activity_comment", "source": "app.update_activity_comment",
+         "filter": {"$or": [{"_id": ""}, {"id": ""}]}},
+        {"name": "chat_activities", "source": "chatbot_service.load_activities",
+         "filter": {"username": ""}},
+        # Taken from the pipelines themselves so the shapes can't drift from them
+        {"name": "chat_context", "source": "chat_context.fetch_contexts, chatbot_asgi.build_chat_contexts",
+         "filter": context_pipeline("", start, start)[0]["$match"]},
+        {"name": "chat_daily_load", "source": "chatbot_asgi.build_chat_contexts, asgi_app.insights_stats",
+         "filter": daily_load_pipeline("")[0]["$match"]},
+    ]
+
+
+def _same_keys(index_info, keys):
+    return [tuple(k) for k in index_info.get("key", [])] == [tuple(k) for k in keys]
+
+
+def ensure_indexes(db):
+    """Create any declared index that doesn't exist yet"""
+    created = []
+    for spec in REQUIRED_INDEXES:
+        collection = db[spec["collection"]]
+        existing = collection.index_information()
+        if any(_same_keys(info, spec["keys"]) for info in existing.values()):
+            continue
+        collection.create_index(spec["keys"], name=spec["name"], background=True, **spec.get("options", {}))
+        logger.info("Created index %s on %s", spec["name"], spec["collection"])
+        created.append(spec["name"])
+    return created
+
+
+def start_index_build(db):
+    """Run ensure_indexes on a daemon thread so startup isn't blocked"""
+    def build():
+        try:
+            ensure_indexes(db)
+        except Exception as e:
+            logger.error(f"Error ensuring indexes: {e}")
+
+    thread = threading.Thread(target=build, name="ensure-indexes", daemon=True)
+    thread.start()
+    return thread
+
+
+def _plan_stages(plan):
+    """Every stage name in an explain() plan tree"""
+    if isinstance(plan, dict):
+        stages = [plan["stage"]] if "stage" in plan else []
+        for value in plan.values():
+            stages += _plan_stages(value)
+        return stages
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _plan_stages(item)]
+    return []
+
+
+def _index_names(plan):
+    """Every index an explain() plan tree uses"""
+    if isinstance(plan, dict):
+        names = [plan["indexName"]] if "indexName" in plan else []
+        for value in plan.values():
+            names += _index_names(value)
+        return names
+    if isinstance(plan, list):
+        return [name for item in plan for name in _index_names(item)]
+    return []
+
+
+def explain_shape(collection, shape):
+    """Summarise the winning plan for one query shape"""
+    cursor = collection.find(shape["filter"])
+    if shape.get("sort"):
+        cursor = cursor.sort(shape["sort"])
+    winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+    stages = _plan_stages(winning_plan)
+    index_names = _index_names(winning_plan)
+    return {
+        "name": shape["name"],
+        "source": shape["source"],
+        "stages": stages,
+        "indexes": index_names,
+        "collscan": "COLLSCAN" in stages,
+    }
+
+
+def index_report(db):
+    """Declared indexes with usage stats, plus the plan of every known query shape"""
+    usage = {}
+    collections = {spec["collection"] for spec in REQUIRED_INDEXES}
+    for name in collections:
+        for stat in db[name].aggregate([{"$indexStats": {}}]):
+            usage[(name, stat["name"])] = stat
+
+    indexes = []
+    for name in sorted(collections):
+        specs = [spec for spec in REQUIRED_INDEXES if spec["collection"] == name]
+        existing = db[name].index_information()
+        for index_name, info in existing.items():
+            stat = usage.get((name, index_name), {})
+            accesses = stat.get("accesses", {})
+            indexes.append({
+                "collection": name,
+                "name": index_name,
+                "keys": [list(k) for k in info.get("key", [])],
+                "declared": any(_same_keys(info, spec["keys"]) for spec in specs),
+                "ops": accesses.get("ops", 0),
+                "since": accesses.get("since"),
+            })
+        for spec in specs:
+            if not any(_same_keys(info, spec["keys"]) for info in existing.values()):
+                indexes.append({
+                    "collection": name,
+                    "name": spec["name"],
+                    "keys": [list(k) for k in spec["keys"]],
+                    "declared": True,
+                    "missing": True,
+                })
+
+    shapes = [explain_shape(db.exercises, shape) for shape in query_shapes()]
+    return {
+        "indexes": indexes,
+        "query_shapes": shapes,
+        "collscans": [shape["name"] for shape in shapes if shape["collscan"]],
+    }
@@ -0,0 +1,234 @@
+"""
+Training insights: streaks, rolling 7/28-day load, acute:chronic workload
+ratio, consistency and week-over-week change.
+
+Each user's history is turned into a day-indexed array of minutes and
+sessions (index 0 is their first active day) with running totals alongside,
+so any window's load is a difference of two cumulative sums. When a new day
+starts or this process logs a new activity the arrays are extended or patched
+in place rather than rebuilt from the full history.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+from activity_cache import as_number
+
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 28
+# Days of rolling load returned for charting
+ROLLING_DAYS = 28
+
+
+def _cumulative(values):
+    """Running totals with a leading 0, so sum(values[lo:hi]) == cum[hi] - cum[lo]"""
+    return np.concatenate(([0], np.cumsum(values)))
+
+
+def _longest_run(active):
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    return int((ends - starts).max()) if len(starts) else 0
+
+
+def _pct_change(current, previous):
+    return round((current - previous) / previous * 100, 1) if previous else None
+
+
+class TrainingLoad:
+    """Per-day minutes and sessions for one user, with cumulative sums for O(1) windows"""
+
+    __slots__ = ("start_day", "minutes", "sessions", "cum_minutes", "cum_sessions", "cum_active",
+                 "longest_streak", "built_at")
+
+    def __init__(self, start_day, minutes, sessions, built_at=0.0):
+        self.built_at = built_at
+        self._reset(start_day, minutes, sessions)
+
+    def _reset(self, start_day, minutes, sessions):
+        self.start_day = start_day
+        self.minutes = minutes
+        self.sessions = sessions
+        self.cum_minutes = _cumulative(minutes)
+        self.cum_sessions = _cumulative(sessions)
+        self.cum_active = _cumulative(sessions > 0)
+        self.longest_streak = _longest_run(sessions > 0)
+
+    @classmethod
+    def from_activities(cls, activities, today, built_at=0.0):
+        """Build from a UserActivities (day ordinals, durations) up to today"""
+        days = activities.days
+        start_day = min(int(days[0]), today) if len(days) else today
+        end_day = max(int(days[-1]), today) if len(days) else today
+        length = end_day - start_day + 1
+        offsets = days - start_day
+        minutes = np.bincount(offsets, weights=activities.durations, minlength=length)
+        sessions = np.bincount(offsets, minlength=length).astype(np.int32)
+        return cls(start_day, minutes, sessions, built_at)
+
+    @classmethod
+    def from_days(cls, rows, today, built_at=0.0):
+        """Build from (day ordinal, minutes, sessions) rows, e.g. a per-day aggregation, up to today"""
+        days = np.array([row[0] for row in rows], dtype=np.int64)
+        start_day = min(int(days.min()), today) if len(days) else today
+        end_day = max(int(days.max()), today) if len(days) else today
+        length = end_day - start_day + 1
+        offsets = days - start_day
+        minutes = np.bincount(offsets, weights=[float(row[1]) for row in rows], minlength=length)
+        sessions = np.bincount(offsets, weights=[row[2] for row in rows], minlength=length).astype(np.int32)
+        return cls(start_day, minutes, sessions, built_at)
+
+    @property
+    def end_day(self):
+        return self.start_day + len(self.minutes) - 1
+
+    def extend_to(self, day):
+        """Append empty days up to and including day"""
+        extra = day - self.end_day
+        if extra <= 0:
+            return
+        self.minutes = np.concatenate((self.minutes, np.zeros(extra)))
+        self.sessions = np.concatenate((self.sessions, np.zeros(extra, dtype=np.int32)))
+        self.cum_minutes = np.concatenate((self.cum_minutes, np.full(extra, self.cum_minutes[-1])))
+        self.cum_sessions = np.concatenate((self.cum_sessions, np.full(extra, self.cum_sessions[-1])))
+        self.cum_active = np.concatenate((self.cum_active, np.full(extra, self.cum_active[-1])))
+
+    def add(self, day, minutes, sessions=1):
+        """Record a newly logged activity without recomputing the whole history"""
+        if day < self.start_day:
+            # Backdated before the first known day: rare, so just rebuild
+            pad = self.start_day - day
+            self._reset(day, np.concatenate((np.zeros(pad), self.minutes)),
+                        np.concatenate((np.zeros(pad, dtype=np.int32), self.sessions)))
+        self.extend_to(day)
+
+        i = day - self.start_day
+        newly_active = self.sessions[i] == 0 and sessions > 0
+        self.minutes[i] += minutes
+        self.sessions[i] += sessions
+        self.cum_minutes[i + 1:] += minutes
+        self.cum_sessions[i + 1:] += sessions
+        if newly_active:
+            self.cum_active[i + 1:] += 1
+            # The new day may join the runs on either side of it
+            active = self.sessions > 0
+            before = np.flatnonzero(~active[:i])
+            after = np.flatnonzero(~active[i + 1:])
+            left = i - (before[-1] + 1 if len(before) else 0)
+            right = after[0] if len(after) else len(active) - i - 1
+            self.longest_streak = max(self.longest_streak, left + 1 + right)
+
+    @staticmethod
+    def _window(cum, end, days):
+        """Sum over the days-long window ending at index end (inclusive); works on arrays of ends too"""
+        last = len(cum) - 1
+        return cum[np.clip(end + 1, 0, last)] - cum[np.clip(end + 1 - days, 0, last)]
+
+    def _current_streak(self, t):
+        # A streak stays alive until a full day is missed, so today can still be empty
+        if self.sessions[t] == 0:
+            t -= 1
+        if t < 0 or self.sessions[t] == 0:
+            return 0
+        gaps = np.flatnonzero(self.sessions[:t + 1] == 0)
+        return int(t - gaps[-1]) if len(gaps) else t + 1
+
+    def summary(self, today):
+        """Insight metrics as of today (a day ordinal)"""
+        self.extend_to(today)
+        t = today - self.start_day
+
+        acute = self._window(self.cum_minutes, t, ACUTE_DAYS)
+        chronic_weekly = self._window(self.cum_minutes, t, CHRONIC_DAYS) / (CHRONIC_DAYS / 7)
+        active_28 = self._window(self.cum_active, t, CHRONIC_DAYS)
+
+        this_week = self._week(t)
+        last_week = self._week(t - 7)
+
+        # Rolling loads for the last ROLLING_DAYS days, one vector op per window length
+        ends = np.arange(t - ROLLING_DAYS + 1, t + 1)
+        load_7 = self._window(self.cum_minutes, ends, ACUTE_DAYS)
+        load_28 = self._window(self.cum_minutes, ends, CHRONIC_DAYS)
+
+        return {
+            "as_of": date.fromordinal(today).isoformat(),
+            "streak": {
+                "current": self._current_streak(t),
+                "longest": self.longest_streak,
+            },
+            "load": {
+                "acute_7d": as_number(acute, 1),
+                "chronic_weekly_28d": as_number(chronic_weekly, 1),
+                "acwr": round(acute / chronic_weekly, 2) if chronic_weekly else None,
+            },
+            "consistency": {
+                "active_days_28d": int(active_28),
+                "ratio": round(active_28 / CHRONIC_DAYS, 2),
+            },
+            "week_over_week": {
+                "this_week": this_week,
+                "last_week": last_week,
+                "minutes_delta": as_number(this_week["minutes"] - last_week["minutes"], 1),
+                "minutes_change_pct": _pct_change(this_week["minutes"], last_week["minutes"]),
+                "sessions_delta": this_week["sessions"] - last_week["sessions"],
+                "active_days_delta": this_week["active_days"] - last_week["active_days"],
+            },
+            "rolling": [
+                {"date": date.fromordinal(today - ROLLING_DAYS + 1 + i).isoformat(),
+                 "load_7d": as_number(load_7[i], 1), "load_28d": as_number(load_28[i], 1)}
+                for i in range(ROLLING_DAYS)
+            ],
+        }
+
+    def _week(self, end):
+        """Totals for the 7 days ending at index end"""
+        return {
+            "minutes": as_number(self._window(self.cum_minutes, end, ACUTE_DAYS), 1),
+            "sessions": int(self._window(self.cum_sessions, end, ACUTE_DAYS)),
+            "active_days": int(self._window(self.cum_active, end, ACUTE_DAYS)),
+        }
+
+
+class InsightsCache:
+    """Per-user TrainingLoad kept current incrementally, rebuilt after a TTL"""
+
+    def __init__(self, activity_source, max_users=1024, ttl=300, clock=time.monotonic):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._activity_source = activity_source
+        self._clock = clock
+        self._loads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def summary(self, username, today):
+        """Insights for a user as of today (a day ordinal)"""
+        now = self._clock()
+        with self._lock:
+            load = self._loads.get(username)
+            if load is not None and now - load.built_at < self.ttl:
+                self._loads.move_to_end(username)
+                return load.summary(today)
+
+        # Rebuild outside the lock: the activity source may hit MongoDB
+        load = TrainingLoad.from_activities(self._activity_source(username), today, built_at=now)
+        with self._lock:
+            self._loads[username] = load
+            self._loads.move_to_end(username)
+            while len(self._loads) > self.max_users:
+                self._loads.popitem(last=False)
+            return load.summary(today)
+
+    def record(self, username, day, minutes, sessions=1):
+        """Apply an activity this process just wrote, if the user is loaded"""
+        with self._lock:
+            load = self._loads.get(username)
+            if load is not None:
+                load.add(day, minutes, sessions)
+
+    def forget(self, *usernames):
+        with self._lock:
+            for username in usernames:
+                self._loads.pop(username, None)
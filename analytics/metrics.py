@@ -0,0 +1,223 @@
+"""
+Prometheus instrumentation shared by the analytics services.
+
+    init_app(app, "analytics")      # request latency, in-flight gauge, /metrics
+    MongoClient(uri, event_listeners=mongo_event_listeners())
+
+ASGI apps wrap themselves in RequestMetrics and serve latest() on /metrics.
+Routes are labelled by their URL rule (e.g. ``/stats/<username>``) rather than
+the raw path, so usernames never end up as label values. When running under
+gunicorn with several workers, set PROMETHEUS_MULTIPROC_DIR so /metrics
+aggregates across processes.
+"""
+import os
+import re
+import threading
+import time
+
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+                               Histogram, generate_latest, multiprocess)
+
+try:
+    from pymongo import monitoring
+except ImportError:  # services without a database can still use init_app
+    monitoring = None
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["service", "route", "method", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being handled",
+    ["service"],
+    multiprocess_mode="livesum",
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongodb_command_duration_seconds",
+    "MongoDB command duration",
+    ["command", "collection", "status"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+MONGO_POOL_CONNECTIONS = Gauge(
+    "mongodb_pool_connections",
+    "Connections in the MongoDB pool, by state",
+    ["address", "state"],
+    multiprocess_mode="livesum",
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "mongodb_pool_checkout_failures_total",
+    "Failed attempts to check a connection out of the pool",
+    ["address", "reason"],
+)
+
+CHAT_REPLY_LATENCY = Histogram(
+    "chat_reply_duration_seconds",
+    "Time to produce a chat reply, by where it came from (local, cache or model)",
+    ["source"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+CHAT_MODEL_COST = Counter(
+    "chat_model_cost_dollars_total",
+    "Estimated spend on chat model calls",
+)
+
+
+def init_app(app, service):
+    """Record request metrics for a Flask app and expose them on /metrics"""
+
+    @app.before_request
+    def start_timer():
+        g._metrics_start = time.perf_counter()
+        g._metrics_in_flight = True
+        REQUESTS_IN_FLIGHT.labels(service).inc()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            REQUEST_LATENCY.labels(service, route, request.method, str(response.status_code)).observe(
+                time.perf_counter() - start)
+        return response
+
+    @app.teardown_request
+    def finish_request(exc):
+        if g.pop("_metrics_in_flight", False):
+            REQUESTS_IN_FLIGHT.labels(service).dec()
+
+    app.add_url_rule("/metrics", "metrics", metrics)
+    return app
+
+
+def latest():
+    """Current metrics in the Prometheus text format (CONTENT_TYPE_LATEST)"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+def metrics():
+    return Response(latest(), mimetype=CONTENT_TYPE_LATEST)
+
+
+class RequestMetrics:
+    """ASGI middleware recording the same request metrics as init_app"""
+
+    def __init__(self, app, service, routes):
+        self.app = app
+        self.service = service
+        # Starlette's {param} placeholders as Flask's <param>, so both apps share label values
+        self.routes = [(route, re.sub(r"\{(\w+)(:\w+)?\}", r"<\1>", route.path)) for route in routes]
+
+    def _route(self, scope):
+        for route, rule in self.routes:
+            match, _ = route.matches(scope)
+            if match.name == "FULL":
+                return rule
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.labels(self.service).inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.labels(self.service).dec()
+            REQUEST_LATENCY.labels(self.service, self._route(scope), scope["method"], str(status)).observe(
+                time.perf_counter() - start)
+
+
+if monitoring is not None:
+
+    class CommandTimer(monitoring.CommandListener):
+        """Observe every MongoDB command's duration, labelled by command and collection"""
+
+        def __init__(self):
+            self._collections = {}
+            self._lock = threading.Lock()
+
+        def started(self, event):
+            # getMore names its cursor id under the command; the collection is a separate field
+            name = "collection" if event.command_name == "getMore" else event.command_name
+            target = event.command.get(name)
+            collection = target if isinstance(target, str) else ""
+            with self._lock:
+                self._collections[(event.connection_id, event.request_id)] = collection
+
+        def _observe(self, event, status):
+            with self._lock:
+                collection = self._collections.pop((event.connection_id, event.request_id), "")
+            MONGO_COMMAND_DURATION.labels(event.command_name, collection, status).observe(
+                event.duration_micros / 1_000_000)
+
+        def succeeded(self, event):
+            self._observe(event, "ok")
+
+        def failed(self, event):
+            self._observe(event, "failed")
+
+    class PoolGauges(monitoring.ConnectionPoolListener):
+        """Track open and checked-out connections per server"""
+
+        @staticmethod
+        def _address(event):
+            host, port = event.address
+            return f"{host}:{port}"
+
+        def pool_created(self, event):
+            pass
+
+        def pool_ready(self, event):
+            pass
+
+        def pool_cleared(self, event):
+            pass
+
+        def pool_closed(self, event):
+            pass
+
+        def connection_created(self, event):
+            MONGO_POOL_CONNECTIONS.labels(self._address(event), "open").inc()
+
+        def connection_ready(self, event):
+            pass
+
+        def connection_closed(self, event):
+            MONGO_POOL_CONNECTIONS.labels(self._address(event), "open").dec()
+
+        def connection_check_out_started(self, event):
+            pass
+
+        def connection_check_out_failed(self, event):
+            MONGO_POOL_CHECKOUT_FAILURES.labels(self._address(event), str(event.reason)).inc()
+
+        def connection_checked_out(self, event):
+            MONGO_POOL_CONNECTIONS.labels(self._address(event), "checked_out").inc()
+
+        def connection_checked_in(self, event):
+            MONGO_POOL_CONNECTIONS.labels(self._address(event), "checked_out").dec()
+
+
+def mongo_event_listeners():
+    """Listeners to pass to MongoClient(event_listeners=...)"""
+    if monitoring is None:
+        return []
+    return [CommandTimer(), PoolGauges()]
@@ -0,0 +1,215 @@
+"""
+Token-budgeted prompt assembly for the chatbot.
+
+Each turn's messages are, in order:
+
+1. the static instruction block (identical for every user and turn, so the
+   provider's prompt cache can serve it),
+2. the user's context block (fitness data for the period),
+3. a rolling summary of earlier turns, if any have been left out,
+4. up to ``max_history`` of the most recent history messages, as many as fit
+   in the budget, always including the question being asked.
+
+Tokens are counted locally: with tiktoken when it's installed, otherwise
+estimated from the text length. Turns that no longer fit are folded into a
+short extractive summary (the question asked and the first sentence of the
+answer), kept per user and extended as the conversation moves on rather than
+rebuilt, so it also remembers turns that have dropped out of the history
+store.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from chat_usage import calculate_cost
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Per-message framing tokens, and the tokens priming the reply (OpenAI's accounting)
+MESSAGE_OVERHEAD = 4
+REPLY_PRIMING = 3
+SUMMARY_MAX_LINES = 6
+SUMMARY_LINE_CHARS = 120
+# Raw history messages the old assembly sent: the default depth, and the savings report's baseline
+LEGACY_HISTORY_MESSAGES = 10
+
+_encoders = {}
+
+
+def _encoder(model):
+    """tiktoken encoding for a model, or None to estimate (no tiktoken, or its data can't be loaded)"""
+    if tiktoken is None:
+        return None
+    if model not in _encoders:
+        try:
+            _encoders[model] = tiktoken.encoding_for_model(model)
+        except Exception:
+            try:
+                _encoders[model] = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                _encoders[model] = None
+    return _encoders[model]
+
+
+def count_tokens(text, model="gpt-4o-mini"):
+    encoder = _encoder(model)
+    if encoder is not None:
+        return len(encoder.encode(text))
+    # About 4 characters a token for English text
+    return (len(text) + 3) // 4
+
+
+def count_message_tokens(messages, model="gpt-4o-mini"):
+    """Prompt tokens for a chat request: contents plus per-message framing"""
+    return sum(count_tokens(m["content"], model) + MESSAGE_OVERHEAD for m in messages) + REPLY_PRIMING
+
+
+def _first_sentence(text):
+    sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+    return sentence if len(sentence) <= SUMMARY_LINE_CHARS else sentence[:SUMMARY_LINE_CHARS - 1] + "…"
+
+
+def _digest(message):
+    return hashlib.sha1(f"{message['role']}\0{message['content']}".encode()).hexdigest()
+
+
+def summary_line(message):
+    speaker = "User asked" if message["role"] == "user" else "You answered"
+    return f"- {speaker}: {_first_sentence(message['content'])}"
+
+
+def summary_message(lines):
+    return {"role": "system", "content": "Earlier in this conversation:\n" + "\n".join(lines)}
+
+
+class RollingSummaries:
+    """Per-user summary lines of turns left out of the prompt, LRU-bounded and expired when idle"""
+
+    def __init__(self, max_lines=SUMMARY_MAX_LINES, max_users=10000, idle_ttl=3600, clock=time.monotonic):
+        self.max_lines = max_lines
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        # username -> [OrderedDict(message digest -> line), last used]
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _merged(self, username, messages, now):
+        entry = self._users.get(username)
+        lines = OrderedDict() if entry is None or now - entry[1] >= self.idle_ttl else OrderedDict(entry[0])
+        for message in messages:
+            digest = _digest(message)
+            if digest not in lines:
+                lines[digest] = summary_line(message)
+        while len(lines) > self.max_lines:
+            lines.popitem(last=False)
+        return lines
+
+    def preview(self, username, messages):
+        """The summary lines there would be after folding in messages (oldest first)"""
+        with self._lock:
+            return list(self._merged(username, messages, self._clock()).values())
+
+    def extend(self, username, messages):
+        """Fold messages (oldest first) into the user's summary"""
+        now = self._clock()
+        with self._lock:
+            lines = self._merged(username, messages, now)
+            if not lines:
+                self._users.pop(username, None)
+                return
+            self._users[username] = [lines, now]
+            self._users.move_to_end(username)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def forget(self, username):
+        with self._lock:
+            self._users.pop(username, None)
+
+
+class PromptAssembler:
+    """Fits the system prompt and history into a token budget, and tracks what that saves"""
+
+    def __init__(self, budget=1200, max_history=LEGACY_HISTORY_MESSAGES, model="gpt-4o-mini", summaries=None):
+        self.budget = budget
+        self.max_history = max_history
+        self.model = model
+        self.summaries = summaries or RollingSummaries()
+        self.turns = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+
+    def _message_cost(self, message):
+        return count_tokens(message["content"], self.model) + MESSAGE_OVERHEAD
+
+    def assemble(self, username, static_prompt, context_prompt, history):
+        """(messages, report) for a turn; history is oldest first and ends with the question"""
+        messages = [
+            {"role": "system", "content": static_prompt},
+            {"role": "system", "content": context_prompt},
+        ]
+        fixed = count_message_tokens(messages, self.model)
+        costs = [self._message_cost(message) for message in history]
+
+        # Keep the newest messages that fit, leaving room for the summary of the
+        # rest; a bigger summary can push more turns out, so repeat until it fits
+        reserve = 0
+        while True:
+            kept, used = 0, fixed + reserve
+            for cost in reversed(costs):
+                # The question always goes in
+                if kept and (kept == self.max_history or used + cost > self.budget):
+                    break
+                kept += 1
+                used += cost
+            dropped = history[:len(history) - kept]
+            lines = self.summaries.preview(username, dropped)
+            summary_cost = self._message_cost(summary_message(lines)) if lines else 0
+            if summary_cost <= reserve or kept <= 1:
+                break
+            reserve = summary_cost
+        self.summaries.extend(username, dropped)
+
+        if lines:
+            messages.append(summary_message(lines))
+        messages.extend(history[len(history) - kept:])
+        prompt_tokens = fixed + summary_cost + sum(costs[len(costs) - kept:])
+        return messages, self._report(static_prompt, context_prompt, history, prompt_tokens)
+
+    def _report(self, static_prompt, context_prompt, history, prompt_tokens):
+        """Prompt tokens against the previous assembly: the whole prompt plus the last 10 raw messages"""
+        legacy = [{"role": "system", "content": static_prompt + "\n" + context_prompt}] + \
+            history[-LEGACY_HISTORY_MESSAGES:]
+        saved = count_message_tokens(legacy, self.model) - prompt_tokens
+        with self._lock:
+            self.turns += 1
+            self.tokens_saved += saved
+        return {
+            "prompt_tokens": prompt_tokens,
+            "prompt_tokens_saved": saved,
+            "estimated_savings": self.savings(saved),
+        }
+
+    def savings(self, tokens):
+        usage = SimpleNamespace(prompt_tokens=tokens, completion_tokens=0, total_tokens=tokens)
+        return calculate_cost(usage, self.model)["input_cost"]
+
+    def forget(self, username):
+        self.summaries.forget(username)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "exact_counts": _encoder(self.model) is not None,
+                "turns": self.turns,
+                "prompt_tokens_saved": self.tokens_saved,
+                "estimated_savings": self.savings(self.tokens_saved),
+            }
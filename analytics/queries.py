@@ -0,0 +1,398 @@
+"""
+Query builders and result shaping shared by the Flask app (app.py) and the
+ASGI app (asgi_app.py), so both serve identical response shapes.
+"""
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from bson import ObjectId
+
+UK = ZoneInfo("Europe/London")
+
+
+def stats_pipeline(match=None):
+    """Total duration per exercise type, grouped per user"""
+    pipeline = [{"$match": match}] if match else []
+    pipeline += [
+        {
+            "$group": {
+                "_id": {
+                    "username": "$username",
+                    "exerciseType": "$exerciseType"
+                },
+                "totalDuration": {"$sum": "$duration"}
+            }
+        },
+        {
+            "$group": {
+                "_id": "$_id.username",
+                "exercises": {
+                    "$push": {
+                        "exerciseType": "$_id.exerciseType",
+                        "totalDuration": "$totalDuration"
+                    }
+                }
+            }
+        },
+        {
+            "$project": {
+                "username": "$_id",
+                "exercises": 1,
+                "_id": 0
+            }
+        }
+    ]
+    return pipeline
+
+
+def batch_stats_pipeline(usernames, start_date=None, end_date=None):
+    """stats_pipeline for several users at once, optionally limited to [start_date, end_date)"""
+    match = {"username": {"$in": list(usernames)}}
+    if start_date is not None:
+        match["date"] = {"$gte": start_date, "$lt": end_date}
+    return stats_pipeline(match)
+
+
+SERIES_GRANULARITIES = ("day", "week", "month")
+# Default chart length per granularity when no start is given
+SERIES_DEFAULT_BUCKETS = {"day": 7, "week": 12, "month": 12}
+MAX_SERIES_BUCKETS = 1500
+# Indexed by the day of the week (0=Sun) and month - 1
+DAY_NAMES = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
+MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def bucket_start(day, granularity):
+    """First day of the day/week (Monday)/month bucket containing day"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day, granularity):
+    if granularity == "week":
+        return day + timedelta(days=7)
+    if granularity == "month":
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def parse_series_args(granularity=None, start=None, end=None, tz=None, today=None):
+    """Validate /stats/series arguments into (granularity, first day, last day, timezone name).
+
+    end defaults to today in tz and start to a chart's worth of buckets before it.
+    Raises ValueError for unknown granularities or timezones, malformed dates
+    and ranges that are reversed or longer than MAX_SERIES_BUCKETS.
+    """
+    granularity = granularity or "day"
+    if granularity not in SERIES_GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(SERIES_GRANULARITIES)}")
+    tz = tz or "UTC"
+    try:
+        zone = ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"unknown timezone {tz}")
+
+    end_day = datetime.strptime(end, "%Y-%m-%d").date() if end else (today or datetime.now(zone).date())
+    if start:
+        start_day = datetime.strptime(start, "%Y-%m-%d").date()
+    else:
+        start_day = bucket_start(end_day, granularity)
+        for _ in range(SERIES_DEFAULT_BUCKETS[granularity] - 1):
+            start_day = bucket_start(start_day - timedelta(days=1), granularity)
+
+    if start_day > end_day:
+        raise ValueError("start must not be after end")
+    if (end_day - start_day).days + 1 > MAX_SERIES_BUCKETS:
+        raise ValueError(f"range must not exceed {MAX_SERIES_BUCKETS} days")
+    return granularity, start_day, end_day, tz
+
+
+def _midnight(day, zone=timezone.utc):
+    return datetime(day.year, day.month, day.day, tzinfo=zone)
+
+
+def series_pipeline(username, granularity, start_day, end_day, tz="UTC"):
+    """Duration per day/week/month bucket between two local dates, gaps filled with 0.
+
+    Buckets follow the calendar in tz. Activities are first mapped to their local
+    date, re-read as a UTC midnight so $dateTrunc and $densify step through
+    plain calendar days with no DST shifts, then bucketed and densified
+    over the whole requested range. Needs MongoDB 6.0+ ($densify, $fill and the
+    $documents seed).
+    """
+    zone = ZoneInfo(tz)
+    first_bucket = _midnight(bucket_start(start_day, granularity))
+    after_last_bucket = _midnight(next_bucket(bucket_start(end_day, granularity), granularity))
+    local_day = {
+        "$dateFromString": {
+            "dateString": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date", "timezone": tz}},
+            "format": "%Y-%m-%d",
+        }
+    }
+    if granularity == "day":
+        name = {"$arrayElemAt": [DAY_NAMES, {"$subtract": [{"$dayOfWeek": "$bucket"}, 1]}]}
+    elif granularity == "week":
+        name = {"$dateToString": {"format": "%G-W%V", "date": "$bucket"}}
+    else:
+        name = {"$arrayElemAt": [MONTH_NAMES, {"$subtract": [{"$month": "$bucket"}, 1]}]}
+
+    return [
+        {
+            "$match": {
+                "username": username,
+                "date": {"$gte": _midnight(start_day, zone), "$lt": _midnight(end_day + timedelta(days=1), zone)}
+            }
+        },
+        # Zero-duration seed in the first bucket so an empty range still densifies
+        {"$unionWith": {"pipeline": [{"$documents": [{"date": _midnight(start_day, zone), "duration": 0}]}]}},
+        {
+            "$group": {
+                "_id": {"$dateTrunc": {"date": local_day, "unit": granularity, "startOfWeek": "monday"}},
+                "totalDuration": {"$sum": "$duration"}
+            }
+        },
+        {"$project": {"_id": 0, "bucket": "$_id", "totalDuration": 1}},
+        {
+            "$densify": {
+                "field": "bucket",
+                "range": {"step": 1, "unit": granularity, "bounds": [first_bucket, after_last_bucket]}
+            }
+        },
+        {"$fill": {"output": {"totalDuration": {"value": 0}}}},
+        {"$sort": {"bucket": 1}},
+        {
+            "$project": {
+                "_id": 0,
+                # 'Duration' key for Recharts
+                "name": name,
+                "Duration": "$totalDuration",
+                "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$bucket"}}
+            }
+        }
+    ]
+
+
+def _bucket_name(day, granularity):
+    if granularity == "day":
+        return DAY_NAMES[(day.weekday() + 1) % 7]
+    if granularity == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return MONTH_NAMES[day.month - 1]
+
+
+def _pad_series(rows, granularity, start_day, end_day):
+    """Chart points for every bucket, from a $facet branch that came back empty"""
+    if rows:
+        return rows
+    points = []
+    day = bucket_start(start_day, granularity)
+    while day <= end_day:
+        points.append({"name": _bucket_name(day, granularity), "Duration": 0, "date": day.isoformat()})
+        day = next_bucket(day, granularity)
+    return points
+
+
+def daily_trend_pipeline(username, today=None):
+    """The dashboard's 7-day trend: today and the six days before it, in UTC"""
+    granularity, start_day, end_day, tz = parse_series_args("day", today=today)
+    return series_pipeline(username, granularity, start_day, end_day, tz)
+
+
+def daily_trend_points(rows, today=None):
+    """
+    The dashboard's trend branch as daily_trend_pipeline would return it; pass
+    the same today to both. Without the seed (not allowed in $facet) a week with
+    no activities densifies to nothing, so its zero days are filled in here
+    """
+    granularity, start_day, end_day, _ = parse_series_args("day", today=today)
+    return _pad_series(rows, granularity, start_day, end_day)
+
+
+def get_start_of_week(now=None):
+    """Midnight on Monday of the current week"""
+    today = (now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    # Python's weekday() returns 0 for Monday, 6 for Sunday
+    return today - timedelta(days=today.weekday())
+
+
+def parse_day_range(start_date_str, end_date_str, tzinfo=None):
+    """Parse YYYY-MM-DD bounds into [start, end) covering the whole end day.
+
+    Raises ValueError if either date is malformed.
+    """
+    start_date = datetime.strptime(start_date_str, "%Y-%m-%d").replace(tzinfo=tzinfo)
+    end_date = datetime.strptime(end_date_str, "%Y-%m-%d").replace(tzinfo=tzinfo) + timedelta(days=1)
+    return start_date, end_date
+
+
+def dashboard_week(start_date_str=None, end_date_str=None, now=None):
+    """Bounds of the dashboard's weekly view: the given days, or this week so far.
+
+    Raises ValueError if only one bound is given or either is malformed.
+    """
+    if start_date_str is None and end_date_str is None:
+        start_date = get_start_of_week(now)
+        end_date = (now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        return start_date, end_date
+    if not (start_date_str and end_date_str):
+        raise ValueError("start and end must be given together")
+    return parse_day_range(start_date_str, end_date_str)
+
+
+def weekly_journal_pipeline(username, start_date, end_date):
+    return [
+        {
+            "$match": {
+                "username": username,
+                "date": {
+                    "$gte": start_date,
+                    "$lt": end_date
+                }
+            }
+        },
+        {
+            "$group": {
+                "_id": {
+                    "exerciseType": "$exerciseType"
+                },
+                "totalDuration": {"$sum": "$duration"}
+            }
+        },
+        {
+            "$project": {
+                "exerciseType": "$_id.exerciseType",
+                "totalDuration": 1,
+                "_id": 0
+            }
+        }
+    ]
+
+
+def _facet_branch(pipeline):
+    """
+    Drop the username filter from a per-user pipeline so it can run as a $facet
+    branch, along with any $unionWith seed, which $facet doesn't allow
+    """
+    match = {k: v for k, v in pipeline[0]["$match"].items() if k != "username"}
+    return [{"$match": match}] + [stage for stage in pipeline[1:] if "$unionWith" not in stage]
+
+
+def dashboard_pipeline(username, week_start, week_end, today=None):
+    """Per-type totals, the daily trend and the weekly journal from one scan of a user's documents.
+
+    Each branch produces exactly what stats_pipeline, daily_trend_pipeline and
+    weekly_journal_pipeline produce for the same user, except that the trend
+    comes back empty for a week without activities: run it through
+    daily_trend_points.
+    """
+    return [
+        {"$match": {"username": username}},
+        {
+            "$facet": {
+                "stats": stats_pipeline(),
+                "trend": _facet_branch(daily_trend_pipeline(username, today)),
+                "weekly": _facet_branch(weekly_journal_pipeline(username, week_start, week_end)),
+            }
+        }
+    ]
+
+
+def range_query(username, start_date, end_date):
+    return {
+        "username": username,
+        "date": {"$gte": start_date, "$lt": end_date}
+    }
+
+
+def created_at_of(activity):
+    """Creation time of an activity, derived from its ObjectId for legacy records"""
+    created = activity.get("created_at")
+    if isinstance(created, datetime):
+        return created
+    # Old records are backfilled by backfill_created_at.py, reads never write
+    return activity["_id"].generation_time
+
+
+def format_activity(a):
+    """Shape an exercise document for the journal's range view"""
+    # group date
+    dt = a.get("date")
+    if isinstance(dt, datetime):
+        date_str = dt.astimezone(UK).strftime("%Y-%m-%d")
+    else:
+        date_str = a["_id"].generation_time.replace(tzinfo=timezone.utc).astimezone(UK).strftime("%Y-%m-%d")
+
+    created = created_at_of(a)
+    time_str = created.astimezone(UK).strftime("%H:%M")
+
+    return {
+        "id": str(a["_id"]),
+        "username": a.get("username"),
+        "date": date_str,
+        "time": time_str,
+        "activityType": a.get("exerciseType"),
+        "duration": a.get("duration"),
+        "comments": a.get("description", ""),
+        "createdAt": created.isoformat()
+    }
+
+
+def activity_id_query(activity_id):
+    """Match an activity whether its id is an ObjectId, a string _id or a legacy 'id' field"""
+    ors = []
+    try:
+        ors.append({'_id': ObjectId(activity_id)})
+    except Exception:
+        pass
+    ors.append({'_id': activity_id})   # in case _id is stored as string
+    ors.append({'id': activity_id})    # in case 'id' field is used
+    return {'$or': ors}
+
+
+def normalise_activity(body):
+    """Validate an activity payload and build the document to insert.
+
+    Returns (doc, None) on success or (None, error message) if it is invalid.
+    """
+    username = body.get("username")
+    exerciseType = body.get("exerciseType")
+    description = body.get("description", "")
+    duration = body.get("duration", 0)
+    date_in = body.get("date") # expected in ISO format or "YYYY-MM-DD"
+
+    if not all([username, exerciseType, date_in]):
+        return None, "username, exerciseType and date are required"
+
+    # normalise the chosen calendar date to midnight UTC
+    if not isinstance(date_in, str):
+        return None, "date must be YYYY-MM-DD or ISO"
+    # accepts "YYYY-MM-DD" or ISO
+    try:
+        if len(date_in) == 10:
+            dt = datetime.strptime(date_in, "%Y-%m-%d")
+        else:
+            dt = datetime.fromisoformat(date_in.replace("Z", "+00:00"))
+    except Exception:
+        return None, "date must be YYYY-MM-DD or ISO"
+
+    try:
+        duration = int(duration)
+    except (TypeError, ValueError):
+        return None, "duration must be a whole number of minutes"
+
+    date_utc = dt.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
+
+    doc = {
+        "username": username,
+        "exerciseType": exerciseType,
+        "description": description,
+        "duration": duration,
+        "date": date_utc,
+        # fixed time of logging set by the server once
+        "created_at": datetime.now(timezone.utc),
+    }
+    return doc, None
@@ -0,0 +1,114 @@
+"""
+Cache of model replies to repeated chat questions.
+
+Users tap the same suggestion chips again and again, and while their data
+hasn't changed the model's answer wouldn't either. Replies are keyed by the
+user, the question normalised the way chat_intents matches them (lower case,
+emoji and punctuation dropped), the period the question is about, the screen,
+and a digest of the context prompt the reply was generated from. Any change
+to the user's data changes the context prompt, so the digest stops matching
+without the cache having to be told.
+
+Follow-ups that lean on earlier turns ("and yesterday?", "why is that?") are
+never cached, since the same words can need a different answer each time.
+Entries live for ``ttl`` seconds, least recently used first out past
+``max_entries``.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from chat_intents import normalise
+
+# Questions whose answer depends on the conversation so far
+_FOLLOW_UP = re.compile(
+    r"^(and|but|so|also|then|what about|how about)\b"
+    r"|\b(it|that|those|them|you said|earlier|again|instead|more)\b")
+
+
+def context_digest(context_prompt):
+    return hashlib.sha1(context_prompt.encode()).hexdigest()
+
+
+def cacheable(message):
+    """Whether a question stands on its own, so its reply can be reused"""
+    text = normalise(message)
+    return bool(text) and not _FOLLOW_UP.search(text)
+
+
+class ResponseCache:
+    """TTL + LRU cache of model replies, with hit and savings accounting"""
+
+    def __init__(self, ttl=600, max_entries=2048, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_cost = 0.0
+        self._clock = clock
+        # (username, question, days_back, screen, digest) -> (reply, cost, stored_at)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(username, message, days_back, screen, context_prompt, use_cache=True):
+        """
+        Cache key for a question, or None if its reply shouldn't be reused or
+        stored (uncacheable, or the request opted out with use_cache=False)
+        """
+        if not use_cache or not cacheable(message):
+            return None
+        return username, normalise(message), days_back, screen, context_digest(context_prompt)
+
+    def get(self, key):
+        """
+        The cached reply for a key, or None; a hit is counted as saving the
+        original reply's cost. A None key (uncacheable, or opted out) is a bypass
+        """
+        if key is None:
+            with self._lock:
+                self.bypassed += 1
+            return None
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[2] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_cost += entry[1]
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, reply, cost):
+        """Store a model reply and what it cost to generate"""
+        if key is None or not reply:
+            return
+        with self._lock:
+            self._entries[key] = (reply, cost, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, username):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == username]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "saved_cost": round(self.saved_cost, 6),
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
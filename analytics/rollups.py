@@ -0,0 +1,292 @@
+"""
+Materialized per-user daily rollups of the exercises collection.
+
+Each document in ``daily_rollups`` has the same shape as an exercise
+(username, exerciseType, date, duration) plus a session ``count``, where
+``date`` is midnight UTC and ``duration`` is the total for that day. Because
+the shape matches, the stats pipelines in app.py run unchanged against either
+collection.
+
+Usage:
+    python rollups.py rebuild [--user USERNAME]   # backfill from scratch
+    python rollups.py watch                       # tail the change stream
+
+The worker needs change streams, so MongoDB must run as a replica set
+(a single-node one is fine locally, see docs/analytics-operations.md).
+
+Each change recomputes the buckets it touches from the raw exercises rather
+than incrementing them, so replaying a change (after a restart, or from the
+start point of a full rebuild) can't count it twice. A full rebuild is built
+in a separate collection and swapped in, so readers never see it half done.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from pymongo import DeleteMany, DeleteOne, MongoClient, ReplaceOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+ROLLUP_COLLECTION = "daily_rollups"
+# Full rebuilds are written here, then renamed over ROLLUP_COLLECTION
+REBUILD_COLLECTION = "daily_rollups_rebuild"
+STATE_COLLECTION = "rollup_state"
+WORKER_ID = "exercises_change_stream"
+# Seconds between the worker's checks for a full rebuild, even when idle
+STATE_CHECK_INTERVAL = 10
+
+logger = logging.getLogger("rollups")
+
+
+def day_of(value):
+    """Truncate an exercise date to the midnight UTC it is bucketed under"""
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_key(doc):
+    """Return the (username, exerciseType, date) bucket an exercise counts towards"""
+    if not doc or not doc.get("username"):
+        return None
+    day = day_of(doc.get("date"))
+    if day is None:
+        return None
+    return {
+        "username": doc["username"],
+        "exerciseType": doc.get("exerciseType"),
+        "date": day,
+    }
+
+
+def _bucket_id(doc):
+    return doc["username"], doc.get("exerciseType"), doc["date"]
+
+
+def bucket_match(key):
+    """Query for the exercises counted in a rollup bucket"""
+    return {
+        "username": key["username"],
+        "exerciseType": key["exerciseType"],
+        "date": {"$gte": key["date"], "$lt": key["date"] + timedelta(days=1)},
+    }
+
+
+def changed_buckets(change):
+    """The buckets a change stream event touches, or None if they can't be told (no pre-image)"""
+    operation = change.get("operationType")
+    if operation not in ("insert", "update", "replace", "delete"):
+        return []
+    before = change.get("fullDocumentBeforeChange")
+    after = change.get("fullDocument") if operation != "delete" else None
+    if operation != "insert" and before is None:
+        return None
+
+    old, new = rollup_key(before), rollup_key(after)
+    if old == new and (before or {}).get("duration") == (after or {}).get("duration"):
+        # e.g. a comment edit, nothing the rollups track has changed
+        return []
+    keys = []
+    for key in (old, new):
+        if key is not None and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def refresh_ops(keys, docs):
+    """Ops that set each bucket to its recomputed document, or delete it if no exercises are left in it"""
+    recomputed = {_bucket_id(doc): doc for doc in docs}
+    ops = []
+    for key in keys:
+        doc = recomputed.get(_bucket_id(key))
+        ops.append(ReplaceOne(key, doc, upsert=True) if doc is not None else DeleteOne(key))
+    return ops
+
+
+def refresh_buckets(db, keys):
+    """Recompute buckets from the raw exercises; safe to repeat"""
+    if not keys:
+        return
+    docs = db.exercises.aggregate(rollup_pipeline({"$or": [bucket_match(key) for key in keys]}))
+    db[ROLLUP_COLLECTION].bulk_write(refresh_ops(keys, docs), ordered=True)
+
+
+def apply_change(db, change):
+    """Fold a single change stream event into the rollups"""
+    keys = changed_buckets(change)
+    if keys is None:
+        # Pre-images are not available, so the old bucket is unknown
+        after = change.get("fullDocument") if change.get("operationType") != "delete" else None
+        if after and after.get("username"):
+            logger.warning("No pre-image for %s, rebuilding user rollups", change.get("documentKey"))
+            rebuild(db, username=after["username"])
+        else:
+            logger.warning("No pre-image for %s, rollups may drift until the next rebuild", change.get("documentKey"))
+        return
+    refresh_buckets(db, keys)
+
+
+def rollup_pipeline(match=None):
+    """Aggregation that recomputes rollup documents from raw exercises"""
+    pipeline = [{"$match": match}] if match else []
+    pipeline += [
+        {"$match": {"username": {"$type": "string"}, "date": {"$type": "date"}}},
+        {
+            "$group": {
+                "_id": {
+                    "username": "$username",
+                    "exerciseType": "$exerciseType",
+                    "date": {"$dateTrunc": {"date": "$date", "unit": "day"}},
+                },
+                "duration": {"$sum": "$duration"},
+                "count": {"$sum": 1},
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "username": "$_id.username",
+                "exerciseType": {"$ifNull": ["$_id.exerciseType", None]},
+                "date": "$_id.date",
+                "duration": 1,
+                "count": 1,
+            }
+        },
+    ]
+    return pipeline
+
+
+def ensure_rollup_indexes(db, collection=ROLLUP_COLLECTION):
+    """Create the unique bucket index the worker upserts against"""
+    db[collection].create_index(
+        [("username", 1), ("date", 1), ("exerciseType", 1)],
+        name="username_date_exerciseType",
+        unique=True,
+    )
+
+
+def rebuild(db, username=None):
+    """Recompute rollups from scratch, for every user or just one"""
+    if username is None:
+        # Built on the side and renamed into place, so readers keep the old rollups until it's done
+        db.exercises.aggregate(rollup_pipeline() + [{"$out": REBUILD_COLLECTION}])
+        ensure_rollup_indexes(db, REBUILD_COLLECTION)
+        db.client.admin.command("renameCollection", f"{db.name}.{REBUILD_COLLECTION}",
+                                to=f"{db.name}.{ROLLUP_COLLECTION}", dropTarget=True)
+        return
+
+    docs = list(db.exercises.aggregate(rollup_pipeline({"username": username})))
+    ops = [ReplaceOne({"username": username, "exerciseType": doc["exerciseType"], "date": doc["date"]}, doc,
+                      upsert=True) for doc in docs]
+    # Buckets the user no longer has any exercises in
+    stale = {"username": username}
+    if docs:
+        stale["$nor"] = [{"exerciseType": doc["exerciseType"], "date": doc["date"]} for doc in docs]
+    ops.append(DeleteMany(stale))
+    db[ROLLUP_COLLECTION].bulk_write(ops, ordered=True)
+
+
+def enable_pre_images(db):
+    """Ask MongoDB (6.0+) to record pre/post images for exercises"""
+    try:
+        db.command("collMod", "exercises", changeStreamPreAndPostImages={"enabled": True})
+    except OperationFailure as e:
+        logger.warning("Could not enable change stream pre-images: %s", e)
+
+
+def run_worker(db):
+    """Tail the exercises change stream and keep the rollups current"""
+    ensure_rollup_indexes(db)
+    enable_pre_images(db)
+    # The state the worker saves its progress against; a full rebuild replaces it
+    db[STATE_COLLECTION].update_one({"_id": WORKER_ID}, {"$setOnInsert": {"rebuilt_at": None}}, upsert=True)
+
+    while True:
+        state = db[STATE_COLLECTION].find_one({"_id": WORKER_ID}) or {}
+        options = {
+            "full_document": "whenAvailable",
+            "full_document_before_change": "whenAvailable",
+            "max_await_time_ms": STATE_CHECK_INTERVAL * 1000,
+        }
+        if state.get("resume_token"):
+            options["resume_after"] = state["resume_token"]
+        elif state.get("start_at"):
+            options["start_at_operation_time"] = state["start_at"]
+
+        logger.info("Watching exercises for rollup changes")
+        if not _follow_changes(db, options, state.get("rebuilt_at")):
+            return
+        logger.info("Rollups were rebuilt, replaying changes from the rebuild's start point")
+
+
+def _follow_changes(db, options, rebuilt_at):
+    """Apply changes until the stream ends (False) or a full rebuild replaces the rollups (True)"""
+    with db.exercises.watch(**options) as stream:
+        while stream.alive:
+            change = stream.try_next()
+            if change is not None:
+                apply_change(db, change)
+            update = {"updated_at": datetime.now(timezone.utc)}
+            if stream.resume_token is not None:
+                update["resume_token"] = stream.resume_token
+            # Matches nothing once a rebuild has reset the state
+            saved = db[STATE_COLLECTION].update_one({"_id": WORKER_ID, "rebuilt_at": rebuilt_at}, {"$set": update})
+            if saved.matched_count == 0:
+                return True
+    return False
+
+
+def rebuild_all(db, client):
+    """
+    Full backfill that hands the worker a start point taken before the scan.
+
+    Anything written after that point is replayed by the worker. A worker
+    that is already running notices the reset state and starts again from
+    there too, redoing any bucket it refreshed in the old collection while
+    the rebuild ran. Replaying is safe because changes recompute buckets.
+    """
+    start_at = client.admin.command("ping").get("operationTime")
+    rebuild(db)
+    db[STATE_COLLECTION].replace_one(
+        {"_id": WORKER_ID},
+        {"start_at": start_at, "rebuilt_at": datetime.now(timezone.utc)},
+        upsert=True,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the daily_rollups collection")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = sub.add_parser("rebuild", help="recompute rollups from raw exercises")
+    rebuild_parser.add_argument("--user", help="only rebuild this user's rollups")
+    sub.add_parser("watch", help="tail the exercises change stream")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGO_URI'))
+    db = client[os.getenv('MONGO_DB')]
+
+    try:
+        if args.command == "rebuild":
+            if args.user:
+                rebuild(db, username=args.user)
+            else:
+                rebuild_all(db, client)
+            logger.info("Rollups rebuilt")
+        else:
+            run_worker(db)
+    except KeyboardInterrupt:
+        pass
+    except PyMongoError as e:
+        logger.error("Rollup %s failed: %s", args.command, e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
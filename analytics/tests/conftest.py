@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Let tests import the service modules the same way app.py does
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,89 @@
+from datetime import date, datetime, timezone
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from activity_cache import ActivityCache, UserActivities
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def docs():
+    return [
+        {"date": datetime(2024, 5, 14), "duration": 30, "exerciseType": "Running"},
+        {"date": datetime(2024, 5, 10), "duration": 45, "exerciseType": "Cycling"},
+        {"date": datetime(2024, 5, 15, 23, 30, tzinfo=timezone.utc), "duration": 20.5, "exerciseType": "Running"},
+        {"date": datetime(2024, 5, 12), "duration": "n/a", "exerciseType": "Yoga"},
+        {"date": None, "duration": 99, "exerciseType": "Running"},
+    ]
+
+
+def test_totals_and_breakdowns_match_the_pipelines():
+    """Test totals follow $sum: non-numeric durations count as 0, undated rows are skipped"""
+    activities = UserActivities.from_documents(docs())
+
+    assert len(activities) == 4
+    assert activities.total() == 95.5
+    assert activities.by_type() == [("Running", 50.5, 2), ("Cycling", 45, 1), ("Yoga", 0, 1)]
+    # Windows are [start, end) in day ordinals
+    may_12, may_15 = date(2024, 5, 12).toordinal(), date(2024, 5, 15).toordinal()
+    assert activities.by_type(may_12, may_15) == [("Running", 30, 1), ("Yoga", 0, 1)]
+    assert activities.count(may_12) == 3
+
+
+def test_recent_is_newest_first():
+    activities = UserActivities.from_documents(docs())
+    assert activities.recent(limit=2) == [
+        (date(2024, 5, 15).toordinal(), 20.5, "Running"),
+        (date(2024, 5, 14).toordinal(), 30, "Running"),
+    ]
+
+
+def test_cache_hits_until_ttl_or_invalidation():
+    clock = FakeClock()
+    loads = []
+    cache = ActivityCache(lambda username: loads.append(username) or docs(), ttl=60, clock=clock)
+
+    first = cache.get("ann")
+    assert cache.get("ann") is first
+    clock.now += 61
+    assert cache.get("ann") is not first
+    cache.invalidate("ann")
+    cache.get("ann")
+
+    assert loads == ["ann", "ann", "ann"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = ActivityCache(lambda username: docs())
+    size = cache.get("ann").nbytes
+    cache.max_bytes = size * 2
+    cache.get("bob")
+    cache.get("ann")
+    cache.get("cat")
+
+    assert cache.stats()["users"] == 2
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    cache.get("ann")
+    assert cache.stats()["hits"] == 2  # bob was evicted, ann stayed
+
+
+def test_write_during_load_is_not_cached():
+    """Test a load racing an invalidation doesn't store the stale columns"""
+    cache = None
+
+    def loader(username):
+        cache.invalidate(username)
+        return docs()
+
+    cache = ActivityCache(loader)
+    cache.get("ann")
+    assert cache.stats()["users"] == 0
@@ -0,0 +1,108 @@
+import os
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from activity_cache import UserActivities
+from chat_context import (build_dynamic_system_prompt, context_pipeline, context_window, contexts_from_activities,
+                          contexts_from_facet, daily_load_pipeline, daily_load_rows, fetch_contexts)
+from insights import TrainingLoad
+
+NOW = datetime(2024, 5, 16, 14, 30)
+
+DOCS = [
+    {"username": "ann", "exerciseType": "Running", "duration": 30, "date": datetime(2024, 5, 16, 7)},
+    {"username": "ann", "exerciseType": "Cycling", "duration": 45, "date": datetime(2024, 5, 14, 18)},
+    {"username": "ann", "exerciseType": "Running", "duration": 60, "date": datetime(2024, 5, 12, 9)},
+    {"username": "ann", "exerciseType": "Swimming", "duration": 80, "date": datetime(2024, 5, 5, 12)},
+    {"username": "ann", "exerciseType": "Yoga", "duration": 20, "date": datetime(2024, 3, 1, 8)},
+]
+
+
+def _doc(doc):
+    return {key: doc[key] for key in ("exerciseType", "duration", "date")}
+
+
+# What MongoDB returns for context_pipeline("ann", *context_window(14, NOW)) over DOCS
+FACET_RESULT = {
+    "period": [_doc(doc) for doc in DOCS[:4]],
+    "period_breakdown": [
+        {"_id": "Running", "totalDuration": 90, "count": 2},
+        {"_id": "Swimming", "totalDuration": 80, "count": 1},
+        {"_id": "Cycling", "totalDuration": 45, "count": 1},
+    ],
+    "week": [_doc(doc) for doc in DOCS[:3]],
+    "week_breakdown": [
+        {"_id": "Running", "totalDuration": 90, "count": 2},
+        {"_id": "Cycling", "totalDuration": 45, "count": 1},
+    ],
+    "top_types": [
+        {"_id": "Running", "totalDuration": 90, "count": 2},
+        {"_id": "Swimming", "totalDuration": 80, "count": 1},
+        {"_id": "Cycling", "totalDuration": 45, "count": 1},
+        {"_id": "Yoga", "totalDuration": 20, "count": 1},
+    ],
+}
+
+
+def test_week_branches_are_shared_when_the_period_is_the_week():
+    assert set(context_pipeline("ann", *context_window(7, NOW))[1]["$facet"]) == {
+        "period", "period_breakdown", "top_types"}
+    assert set(context_pipeline("ann", *context_window(14, NOW))[1]["$facet"]) == {
+        "period", "period_breakdown", "top_types", "week", "week_breakdown"}
+
+
+def test_facet_and_cached_contexts_give_the_same_prompt():
+    from_facet = contexts_from_facet(FACET_RESULT, 14)
+    from_cache = contexts_from_activities(UserActivities.from_documents(DOCS), 14, now=NOW)
+    assert from_facet == from_cache
+
+    period, fitness = from_facet
+    assert (period["total_activities"], period["total_minutes"]) == (4, 215)
+    assert (fitness["total_activities"], fitness["weekly_minutes"]) == (3, 135)
+    assert fitness["recent_activities"][0] == {"type": "Running", "duration": 30, "date": "2024-05-16"}
+    assert build_dynamic_system_prompt({}, from_facet[0], 14) == build_dynamic_system_prompt({}, from_cache[0], 14)
+
+
+def test_week_context_reuses_the_period_when_they_coincide():
+    result = {key: FACET_RESULT[key] for key in ("top_types",)}
+    result["period"], result["period_breakdown"] = FACET_RESULT["week"], FACET_RESULT["week_breakdown"]
+    period, fitness = contexts_from_facet(result, 7)
+    assert fitness["weekly_breakdown"] == period["breakdown"]
+    assert fitness["total_activities"] == period["total_activities"] == 3
+
+
+@pytest.mark.skipif(not os.getenv("TEST_MONGO_URI"), reason="set TEST_MONGO_URI to run against MongoDB")
+@pytest.mark.parametrize("days_back", [1, 7, 30])
+def test_aggregation_matches_cache(days_back):
+    pymongo = pytest.importorskip("pymongo")
+    client = pymongo.MongoClient(os.environ["TEST_MONGO_URI"])
+    db = client["test_chat_context"]
+    try:
+        db.exercises.insert_many([dict(doc) for doc in DOCS])
+        assert fetch_contexts(db, "ann", days_back, now=NOW) == \
+            contexts_from_activities(UserActivities.from_documents(DOCS), days_back, now=NOW)
+    finally:
+        client.drop_database("test_chat_context")
+
+
+def test_daily_load_rows():
+    docs = [{"_id": "2024-05-16", "minutes": 30, "sessions": 1}, {"_id": "2024-05-14", "minutes": 45.5, "sessions": 2}]
+    assert daily_load_rows(docs) == [(NOW.toordinal(), 30, 1), (NOW.toordinal() - 2, 45.5, 2)]
+
+
+@pytest.mark.skipif(not os.getenv("TEST_MONGO_URI"), reason="set TEST_MONGO_URI to run against MongoDB")
+def test_daily_load_matches_cache():
+    pymongo = pytest.importorskip("pymongo")
+    client = pymongo.MongoClient(os.environ["TEST_MONGO_URI"])
+    db = client["test_chat_context"]
+    today = NOW.toordinal()
+    try:
+        db.exercises.insert_many([dict(doc) for doc in DOCS])
+        rows = daily_load_rows(db.exercises.aggregate(daily_load_pipeline("ann")))
+        assert TrainingLoad.from_days(rows, today).summary(today) == \
+            TrainingLoad.from_activities(UserActivities.from_documents(DOCS), today).summary(today)
+    finally:
+        client.drop_database("test_chat_context")
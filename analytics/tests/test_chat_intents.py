@@ -0,0 +1,60 @@
+import pytest
+
+from chat_intents import IntentRouter, answer, classify
+
+CONTEXT = {
+    "activities": [
+        {"type": "Cycling", "duration": 75, "date": "2024-05-16"},
+        {"type": "Yoga", "duration": 30, "date": "2024-05-14"},
+    ],
+    "breakdown": [{"type": "Cycling", "duration": 75, "count": 1}, {"type": "Yoga", "duration": 30, "count": 1}],
+    "total_activities": 2,
+    "total_minutes": 105,
+    "period_days": 7,
+}
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("How many workouts did I do this week?", "count"),
+    ("how many exercises have I done in the last 30 days", "count"),
+    ("How many times did I work out today?", "count"),
+    ("What's my total workout time this month?", "total_time"),
+    ("How much time did I spend working out this week?", "total_time"),
+    ("What was my last workout?", "last_workout"),
+    ("When did I last exercise?", "last_workout"),
+])
+def test_recognises_lookups(message, intent):
+    assert classify(message) == intent
+
+
+@pytest.mark.parametrize("message", [
+    "How many workouts should I do per week?",
+    "How many runs did I do this week?",
+    "How many workouts did I do, and how does that compare to last week?",
+    "How many workouts this week? What should I do tomorrow?",
+    "Give me a plan for next week",
+    "How many workouts do I need to hit my goal?",
+])
+def test_leaves_everything_else_to_the_model(message):
+    assert classify(message) is None
+
+
+def test_templated_answers_use_the_period_context():
+    assert answer("count", CONTEXT, 7) == "In the last 7 days, you've logged 2 activities for 1 hr 45 min in total. Keep it up! 🔥"
+    assert answer("total_time", CONTEXT, 1).startswith("Today, you've trained for 1 hr 45 min across 2 activities")
+    assert answer("last_workout", CONTEXT, 7) == "Your last workout was Cycling for 1 hr 15 min on 2024-05-16. ⭐"
+    # Nothing in the period: the last workout may be older, so the model answers
+    assert answer("last_workout", {"activities": [], "total_activities": 0}, 7) is None
+
+
+def test_router_reports_hit_rate_and_savings():
+    router = IntentRouter()
+    assert router.route("how many workouts this week", CONTEXT, 7) == (
+        "count", answer("count", CONTEXT, 7))
+    assert router.route("any tips for recovery?", CONTEXT, 7) is None
+    router.record_model_reply(0.0002)
+
+    stats = router.stats()
+    assert (stats["questions"], stats["answered_locally"], stats["hit_rate"]) == (2, 1, 0.5)
+    assert stats["by_intent"]["count"] == 1
+    assert stats["estimated_savings"] == 0.0002
@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import pytest
+
+from chat_stream import astream_chat, sse, stream_chat
+
+openai = pytest.importorskip("openai")
+
+from benchmarks.fake_openai import REPLY, start  # noqa: E402
+
+
+def _events(frames):
+    events = []
+    for frame in frames:
+        lines = frame.strip().split("\n")
+        assert lines[0].startswith("event: ") and lines[1].startswith("data: ")
+        events.append((lines[0][len("event: "):], json.loads(lines[1][len("data: "):])))
+    return events
+
+
+@pytest.fixture
+def fake_openai():
+    server, base_url = start(first_token_delay=0, token_delay=0)
+    yield openai.OpenAI(api_key="fake", base_url=base_url, max_retries=0)
+    server.shutdown()
+
+
+def test_sse_frame():
+    assert sse("token", {"content": "Hi"}) == 'event: token\ndata: {"content": "Hi"}\n\n'
+
+
+def test_streams_tokens_then_finishes_with_usage(fake_openai):
+    finished = []
+
+    def finish(text, usage):
+        finished.append((text, usage))
+        return {"response": text, "completion_tokens": usage.completion_tokens}
+
+    events = _events(stream_chat(fake_openai, "gpt-4o-mini", [{"role": "user", "content": "how did I do"}], finish))
+
+    tokens = [data["content"] for event, data in events if event == "token"]
+    assert len(tokens) > 1 and "".join(tokens) == REPLY
+    assert events[-1] == ("done", {"response": REPLY, "completion_tokens": len(tokens)})
+    assert len(finished) == 1 and finished[0][1].prompt_tokens == 4
+
+
+def test_failed_stream_sends_an_error_and_never_finishes():
+    client = openai.OpenAI(api_key="fake", base_url="http://127.0.0.1:9/v1", max_retries=0)
+    finished = []
+    events = _events(stream_chat(client, "gpt-4o-mini", [], lambda *args: finished.append(args)))
+    assert [event for event, _ in events] == ["error"]
+    assert events[0][1]["success"] is False
+    assert finished == []
+
+
+def test_async_stream_matches_the_sync_one():
+    server, base_url = start(first_token_delay=0, token_delay=0)
+    client = openai.AsyncOpenAI(api_key="fake", base_url=base_url, max_retries=0)
+
+    async def finish(text, usage):
+        return {"response": text, "completion_tokens": usage.completion_tokens}
+
+    async def collect():
+        return [frame async for frame in astream_chat(client, "gpt-4o-mini", [{"role": "user", "content": "hi"}],
+                                                      finish)]
+    try:
+        events = _events(asyncio.run(collect()))
+    finally:
+        server.shutdown()
+
+    tokens = [data["content"] for event, data in events if event == "token"]
+    assert "".join(tokens) == REPLY
+    assert events[-1] == ("done", {"response": REPLY, "completion_tokens": len(tokens)})
@@ -0,0 +1,27 @@
+from chat_suggestions import get_dynamic_suggestions, suggestions_after_reply
+
+CONTEXT = {"total_activities": 12, "weekly_minutes": 180}
+
+
+def turns(*questions):
+    history = []
+    for question in questions:
+        history += [{"role": "user", "content": question}, {"role": "assistant", "content": "Nice work! 🎉"}]
+    return history
+
+
+def test_suggestions_follow_the_reply():
+    history = turns("Hi there", "What did I do yesterday?") + [{"role": "user", "content": "How am I doing?"}]
+    reply = "Running is your strongest activity this week."
+
+    suggestions = suggestions_after_reply("general", history, reply, CONTEXT)
+    assert "Where can I improve?" in suggestions
+    assert suggestions == get_dynamic_suggestions(
+        "general", history[-5:] + [{"role": "assistant", "content": reply}], CONTEXT)
+    assert suggestions != get_dynamic_suggestions("general", history, CONTEXT)
+
+
+def test_first_turn_gets_fresh_start_suggestions():
+    history = [{"role": "user", "content": "What's my strongest activity?"}]
+    assert suggestions_after_reply("general", history, "Cycling, by far!", CONTEXT) == \
+        get_dynamic_suggestions("general", [], CONTEXT)
@@ -0,0 +1,103 @@
+import threading
+from datetime import date
+
+import pytest
+
+from context_cache import ContextCache
+
+TODAY = date(2024, 5, 16)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def counting_builder():
+    calls = []
+
+    def build(username, days_back):
+        calls.append((username, days_back))
+        return f"{username}:{days_back}:{len(calls)}"
+    return build, calls
+
+
+def test_hits_until_ttl_or_the_day_changes():
+    clock = Clock()
+    build, calls = counting_builder()
+    cache = ContextCache(build, ttl=60, clock=clock)
+
+    assert cache.get("ann", 7, TODAY) == cache.get("ann", 7, TODAY) == "ann:7:1"
+    assert cache.get("ann", 30, TODAY) == "ann:30:2"
+    clock.now = 61
+    assert cache.get("ann", 7, TODAY) == "ann:7:3"
+    assert cache.get("ann", 7, date(2024, 5, 17)) == "ann:7:4"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 4
+
+
+def test_version_change_invalidates_and_calls_the_hook_once():
+    versions = {"ann": 1}
+    changed = []
+    build, calls = counting_builder()
+    cache = ContextCache(build, version_of=versions.get, on_change=changed.append)
+
+    cache.get("ann", 7, TODAY)
+    cache.get("ann", 30, TODAY)
+    versions["ann"] = 2
+    assert cache.get("ann", 7, TODAY) == "ann:7:3"
+    assert cache.get("ann", 30, TODAY) == "ann:30:4"
+    assert changed == ["ann"]
+
+
+def test_invalidate_hook():
+    build, calls = counting_builder()
+    cache = ContextCache(build)
+    cache.get("ann", 7, TODAY)
+    cache.invalidate("ann")
+    cache.get("ann", 7, TODAY)
+    assert len(calls) == 2
+
+
+def test_concurrent_misses_share_one_build():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def build(username, days_back):
+        calls.append(username)
+        started.set()
+        release.wait(5)
+        return "context"
+
+    cache = ContextCache(build)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("ann", 7, TODAY))) for _ in range(5)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while cache.stats()["shared"] < 4:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["ann"] and results == ["context"] * 5
+    assert cache.stats()["hit_ratio"] == 0.8
+
+
+def test_failed_build_is_not_cached():
+    attempts = []
+
+    def build(username, days_back):
+        attempts.append(username)
+        if len(attempts) == 1:
+            raise RuntimeError("mongo down")
+        return "context"
+
+    cache = ContextCache(build)
+    with pytest.raises(RuntimeError):
+        cache.get("ann", 7, TODAY)
+    assert cache.get("ann", 7, TODAY) == "context"
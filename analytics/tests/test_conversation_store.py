@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from conversation_store import MemoryConversationStore, MongoConversationStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_keeps_only_the_last_messages_per_user():
+    store = MemoryConversationStore(max_messages=3)
+    for i in range(5):
+        store.append("ann", "user", f"q{i}")
+    assert [m["content"] for m in store.recent("ann")] == ["q2", "q3", "q4"]
+    assert [m["content"] for m in store.recent("ann", 2)] == ["q3", "q4"]
+    assert store.recent("bob") == []
+
+
+def test_evicts_least_recently_active_user():
+    store = MemoryConversationStore(max_users=2)
+    store.append("ann", "user", "hi")
+    store.append("bob", "user", "hi")
+    store.append("ann", "assistant", "hello")
+    store.append("cat", "user", "hi")
+    assert store.recent("bob") == []
+    assert len(store.recent("ann")) == 2
+    assert store.stats()["evictions"] == 1
+
+
+def test_forgets_idle_users_and_resets():
+    clock = Clock()
+    store = MemoryConversationStore(idle_ttl=60, clock=clock)
+    store.append("ann", "user", "hi")
+    clock.now = 30
+    store.append("bob", "user", "hi")
+    clock.now = 70
+    assert store.recent("ann") == []
+    assert store.recent("bob") == [{"role": "user", "content": "hi"}]
+    store.reset("bob")
+    assert store.recent("bob") == []
+    assert store.stats()["users"] == 0
+
+
+@pytest.mark.skipif(not os.getenv("TEST_MONGO_URI"), reason="set TEST_MONGO_URI to run against MongoDB")
+def test_mongo_store_reads_back_to_the_last_reset():
+    import pymongo
+    client = pymongo.MongoClient(os.environ["TEST_MONGO_URI"])
+    db = client["test_conversation_store"]
+    try:
+        store = MongoConversationStore(db, max_messages=3, size_bytes=1024 * 1024)
+        assert db.chat_messages.options()["capped"]
+        store.append("ann", "user", "old")
+        store.reset("ann")
+        for i in range(4):
+            store.append("ann", "user", f"q{i}")
+        store.append("bob", "user", "hi")
+        assert [m["content"] for m in store.recent("ann")] == ["q1", "q2", "q3"]
+        assert [m["content"] for m in store.recent("ann", 10)] == ["q1", "q2", "q3"]
+        store.reset("ann")
+        assert store.recent("ann") == []
+        assert store.recent("bob") == [{"role": "user", "content": "hi"}]
+    finally:
+        client.drop_database("test_conversation_store")
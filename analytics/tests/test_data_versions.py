@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("dotenv")
+
+from data_versions import ALL_USERS, DataVersions, bump_ops, bump_user, changed_username, etag_for
+from insights import InsightsCache
+
+
+def test_etag_changes_with_user_version_epoch_and_key():
+    tag = etag_for({"ann": 3}, "ann", "/stats/ann")
+    assert tag == etag_for({"ann": 3, "bob": 9}, "ann", "/stats/ann")
+    assert tag != etag_for({"ann": 4}, "ann", "/stats/ann")
+    assert tag != etag_for({"ann": 3, ALL_USERS: 1}, "ann", "/stats/ann")
+    assert tag != etag_for({"ann": 3}, "ann", "/stats/ann?start=2024-05-01")
+    assert "-" not in tag  # compressed variants append -br/-gzip
+
+
+def test_bump_ops_one_upsert_per_user():
+    ops = bump_ops(["bob", "ann", "bob", None])
+    assert [op._filter for op in ops] == [{"_id": "ann"}, {"_id": "bob"}]
+    assert all(op._upsert for op in ops)
+
+
+def test_changed_username_falls_back_to_pre_image():
+    assert changed_username({"fullDocument": {"username": "ann"}}) == "ann"
+    assert changed_username({"fullDocument": None, "fullDocumentBeforeChange": {"username": "bob"}}) == "bob"
+    assert changed_username({"operationType": "delete"}) is None
+
+
+class StateCollection:
+    def __init__(self, heartbeat):
+        self.heartbeat = heartbeat
+
+    def find_one(self, *args, **kwargs):
+        return {"heartbeat": self.heartbeat} if self.heartbeat else None
+
+
+@pytest.mark.parametrize("age, trusted", [(None, False), (5, True), (120, False)])
+def test_etags_only_while_worker_heartbeat_is_recent(age, trusted):
+    heartbeat = datetime.now(timezone.utc) - timedelta(seconds=age) if age is not None else None
+    versions = DataVersions({"data_version_state": StateCollection(heartbeat)})
+    assert versions.trusted() is trusted
+
+
+class VersionsCollection:
+    def __init__(self, versions):
+        self.versions = versions
+
+    def find(self, query, projection):
+        return [{"_id": name, "version": version} for name, version in self.versions.items()
+                if name in query["_id"]["$in"]]
+
+    def find_one_and_update(self, query, update, **kwargs):
+        self.versions[query["_id"]] = self.versions.get(query["_id"], 0) + update["$inc"]["version"]
+        return {"_id": query["_id"], "version": self.versions[query["_id"]]}
+
+
+def test_on_change_when_a_users_version_moves():
+    changed = []
+    store = VersionsCollection({"ann": 1})
+    versions = DataVersions({"data_version_state": StateCollection(datetime.now(timezone.utc)),
+                             "data_versions": store}, on_change=changed.append)
+
+    # First sight: whatever was cached before can't be vouched for
+    first = versions.etag("ann", "/stats/ann")
+    assert changed == ["ann"]
+    assert versions.etag("ann", "/stats/ann") == first and changed == ["ann"]
+
+    store.versions["ann"] = 2
+    assert versions.etag("ann", "/stats/ann") != first
+    assert changed == ["ann", "ann"]
+    store.versions[ALL_USERS] = 1
+    versions.etag("ann", "/stats/ann?start=2024-05-01")
+    assert changed == ["ann", "ann", "ann"]
+
+
+def test_own_write_keeps_the_insights_it_patched():
+    pytest.importorskip("numpy")
+    from activity_cache import UserActivities
+
+    loads = []
+
+    def source(username):
+        loads.append(username)
+        return UserActivities.from_documents([{"date": datetime(2024, 5, 15), "duration": 30,
+                                               "exerciseType": "Running"}])
+
+    store = VersionsCollection({"ann": 1})
+    db = {"data_version_state": StateCollection(datetime.now(timezone.utc)), "data_versions": store}
+    insights = InsightsCache(source, clock=lambda: 0.0)
+    versions = DataVersions(db, on_change=insights.forget)
+    today = datetime(2024, 5, 16).toordinal()
+    versions.etag("ann", "/stats/ann")
+    insights.summary("ann", today)
+
+    # What create_activity does: patch the loaded insights, then bump and report the version
+    insights.record("ann", today, 45)
+    versions.written("ann", bump_user(db, "ann"))
+    versions.etag("ann", "/stats/ann")
+    assert insights.summary("ann", today)["load"]["acute_7d"] == 75
+    assert loads == ["ann"]
+
+    # Someone else's write landing before ours still drops them
+    store.versions["ann"] += 1
+    versions.written("ann", bump_user(db, "ann"))
+    versions.etag("ann", "/stats/ann")
+    insights.summary("ann", today)
+    assert loads == ["ann", "ann"]
@@ -0,0 +1,89 @@
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("flask")
+json_util = pytest.importorskip("bson.json_util")
+
+from bson import ObjectId
+from flask import Flask
+from encoding import ERROR_LINE, dumps, json_response, stream_json_array, stream_json_object, stream_ndjson
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def test_extended_matches_json_util():
+    """Test extended mode renders ObjectId and datetime the way json_util does"""
+    doc = {
+        "_id": ObjectId("65f0c0ffee0000000000beef"),
+        "date": datetime(2024, 3, 1, 0, 0, 0),
+        "created_at": datetime(2024, 3, 1, 9, 30, 15, 250000),
+        "duration": 30,
+    }
+    assert json.loads(dumps(doc, extended=True)) == json.loads(json_util.dumps(doc))
+
+
+def test_plain_mode_uses_strings():
+    """Test ObjectIds become plain strings outside extended mode"""
+    oid = ObjectId("65f0c0ffee0000000000beef")
+    assert json.loads(dumps({"id": oid})) == {"id": str(oid)}
+
+
+def test_json_response_gzip_negotiation(app):
+    """Test large bodies are gzipped only when the client accepts it"""
+    payload = {"stats": [{"exerciseType": "Running", "totalDuration": i} for i in range(200)]}
+
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        response = json_response(payload)
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert json.loads(gzip.decompress(response.get_data())) == payload
+
+    with app.test_request_context():
+        response = json_response(payload)
+        assert "Content-Encoding" not in response.headers
+        assert json.loads(response.get_data()) == payload
+
+
+def test_stream_json_array_batches():
+    """Test the streamed array is valid JSON across batch boundaries"""
+    docs = [{"n": i} for i in range(7)]
+    body = b"".join(stream_json_array(iter(docs), batch_size=3))
+    assert json.loads(body) == docs
+
+    assert json.loads(b"".join(stream_json_array(iter([])))) == []
+
+
+def failing_cursor(docs):
+    yield from docs
+    raise RuntimeError("cursor died")
+
+
+def test_failed_streams_are_not_well_formed():
+    """Test a cursor failing mid-stream leaves the body detectably incomplete"""
+    errors = []
+    docs = [{"n": i} for i in range(5)]
+    body = b"".join(stream_json_array(failing_cursor(docs), batch_size=2, on_error=errors.append))
+    assert body.startswith(b'[{"n":0}')
+    with pytest.raises(ValueError):
+        json.loads(body)
+
+    pairs = [(f"user{i}", []) for i in range(3)]
+    with pytest.raises(ValueError):
+        json.loads(b"".join(stream_json_object(failing_cursor(pairs), on_error=errors.append)))
+
+    lines = b"".join(stream_ndjson(failing_cursor(docs), batch_size=2,
+                                   on_error=errors.append)).splitlines(keepends=True)
+    assert lines[-1] == ERROR_LINE and len(lines) == 5
+    assert len(errors) == 3
+
+
+def test_stream_json_object_round_trips():
+    pairs = [(f"user{i}", [{"exerciseType": "Running", "totalDuration": i}]) for i in range(5)]
+    body = b"".join(stream_json_object(iter(pairs), batch_size=2))
+    assert json.loads(body) == dict(pairs)
+    assert b"".join(stream_json_object(iter([]))) == b"{}"
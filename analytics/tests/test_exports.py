@@ -0,0 +1,85 @@
+import os
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("dotenv")
+
+from bson import ObjectId
+
+import exports
+from exports import build_export, data_version, file_size, iter_file
+
+
+class Cursor(list):
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, size):
+        return self
+
+
+class Exercises:
+    def __init__(self, docs):
+        self.docs = docs
+        self.aggregations = 0
+
+    def find(self, query, projection):
+        return Cursor(doc for doc in self.docs if doc["username"] == query["username"])
+
+    def aggregate(self, pipeline):
+        self.aggregations += 1
+        return iter([{"count": len(self.docs)}])
+
+
+class Database(dict):
+    @property
+    def exercises(self):
+        return self["exercises"]
+
+
+class Versions:
+    def __init__(self, version, trusted=True):
+        self.version = version
+        self._trusted = trusted
+
+    def trusted(self):
+        return self._trusted
+
+    def current(self, username):
+        return {username: self.version}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv("EXPORT_CACHE_DIR", str(tmp_path))
+    docs = [{"_id": ObjectId(), "username": "ann", "date": datetime(2024, 5, i + 1), "exerciseType": "Running",
+             "duration": 30, "description": ""} for i in range(3)]
+    return Database(exercises=Exercises(docs))
+
+
+def test_version_comes_from_data_versions_while_trusted(db):
+    assert data_version(db, "ann", Versions(1)) != data_version(db, "ann", Versions(2))
+    assert db["exercises"].aggregations == 0
+    data_version(db, "ann", Versions(1, trusted=False))
+    assert db["exercises"].aggregations == 1
+
+
+def test_export_survives_its_file_being_replaced(db):
+    first = build_export(db, "ann", "csv", Versions(1))
+    size = file_size(first)
+    # A newer version is written and removes the one still being served
+    second = build_export(db, "ann", "csv", Versions(2))
+    assert len(os.listdir(exports.cache_dir())) == 1
+
+    body = b"".join(iter_file(first))
+    assert first.closed
+    assert len(body) == size and body.startswith(b"id,date,exerciseType")
+    assert b"".join(iter_file(second)) == body
+
+
+def test_cached_export_is_reused(db, monkeypatch):
+    b"".join(iter_file(build_export(db, "ann", "csv", Versions(1))))
+    monkeypatch.setattr(db["exercises"], "find", lambda *args: pytest.fail("export was rebuilt"))
+    assert b"".join(iter_file(build_export(db, "ann", "csv", Versions(1)))).count(b"\n") == 4
@@ -0,0 +1,18 @@
+from indexes import REQUIRED_INDEXES, query_shapes
+
+
+def filter_fields(query):
+    """Each set of fields one index would have to serve; an $or's branches are planned separately"""
+    if "$or" in query:
+        return [fields for branch in query["$or"] for fields in filter_fields(branch)]
+    return [set(query)]
+
+
+def test_every_query_shape_has_an_index_prefix():
+    prefixes = [{key for key, _ in spec["keys"][:n]}
+                for spec in REQUIRED_INDEXES if spec["collection"] == "exercises"
+                for n in range(1, len(spec["keys"]) + 1)]
+    prefixes.append({"_id"})
+    for shape in query_shapes():
+        for fields in filter_fields(shape["filter"]):
+            assert fields in prefixes, f"{shape['name']} filters on {sorted(fields)} with no index prefix"
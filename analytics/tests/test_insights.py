@@ -0,0 +1,77 @@
+from datetime import date, datetime
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from activity_cache import UserActivities
+from insights import InsightsCache, TrainingLoad
+
+TODAY = date(2024, 5, 16).toordinal()
+
+
+def activities(*days_and_minutes):
+    return UserActivities.from_documents(
+        {"date": datetime.combine(date.fromordinal(TODAY - ago), datetime.min.time()),
+         "duration": minutes, "exerciseType": "Running"}
+        for ago, minutes in days_and_minutes)
+
+
+def test_streaks_and_load():
+    # Active yesterday and the two days before, a gap, then a 4-day run
+    load = TrainingLoad.from_activities(activities((1, 30), (2, 30), (3, 40), (5, 20), (6, 20), (7, 20), (8, 20)),
+                                        TODAY)
+    summary = load.summary(TODAY)
+
+    # Today isn't over yet, so the run ending yesterday still counts
+    assert summary["streak"] == {"current": 3, "longest": 4}
+    # Today and the six days before it
+    assert summary["load"]["acute_7d"] == 140
+    assert summary["load"]["chronic_weekly_28d"] == 45
+    assert summary["load"]["acwr"] == pytest.approx(140 / 45, abs=0.01)
+    assert summary["consistency"]["active_days_28d"] == 7
+    assert summary["week_over_week"]["last_week"] == {"minutes": 40, "sessions": 2, "active_days": 2}
+    assert summary["week_over_week"]["minutes_delta"] == 100
+    assert summary["rolling"][-1] == {"date": "2024-05-16", "load_7d": 140, "load_28d": 180}
+
+
+def test_empty_history():
+    summary = TrainingLoad.from_activities(activities(), TODAY).summary(TODAY)
+    assert summary["streak"] == {"current": 0, "longest": 0}
+    assert summary["load"]["acwr"] is None
+    assert summary["week_over_week"]["minutes_change_pct"] is None
+
+
+@pytest.mark.parametrize("new_day", [0, 4, 12, 40])
+def test_incremental_add_matches_rebuild(new_day):
+    history = [(1, 30), (2, 30), (3, 40), (5, 20), (6, 20), (7, 20), (8, 20), (20, 60)]
+    load = TrainingLoad.from_activities(activities(*history), TODAY - 1)
+    load.add(TODAY - new_day, 25)
+
+    rebuilt = TrainingLoad.from_activities(activities(*history, (new_day, 25)), TODAY)
+    assert load.summary(TODAY) == rebuilt.summary(TODAY)
+
+
+def test_daily_rows_match_activities():
+    history = [(1, 30), (1, 15), (2, 30), (3, 40), (9, 20), (30, 60)]
+    rows = [(TODAY - 1, 45, 2), (TODAY - 2, 30, 1), (TODAY - 3, 40, 1), (TODAY - 9, 20, 1), (TODAY - 30, 60, 1)]
+    assert (TrainingLoad.from_days(rows, TODAY).summary(TODAY)
+            == TrainingLoad.from_activities(activities(*history), TODAY).summary(TODAY))
+    assert TrainingLoad.from_days([], TODAY).summary(TODAY) == TrainingLoad.from_activities(activities(), TODAY).summary(TODAY)
+
+
+def test_cache_records_new_activities_without_reloading():
+    loads = []
+
+    def source(username):
+        loads.append(username)
+        return activities((1, 30))
+
+    cache = InsightsCache(source, clock=lambda: 0.0)
+    assert cache.summary("ann", TODAY)["streak"]["current"] == 1
+    cache.record("ann", TODAY, 45)
+    summary = cache.summary("ann", TODAY + 1)
+
+    assert summary["streak"]["current"] == 2
+    assert summary["load"]["acute_7d"] == 75
+    assert loads == ["ann"]
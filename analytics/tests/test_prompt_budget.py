@@ -0,0 +1,69 @@
+from prompt_budget import PromptAssembler, RollingSummaries, count_message_tokens
+
+STATIC = "You are FitCoach. " * 20
+CONTEXT = "USER'S FITNESS DATA (LAST 7 DAYS): 4 activities. " * 10
+
+
+def conversation(turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Question {i}: how should I pace my long run this weekend?"})
+        history.append({"role": "assistant", "content": f"Answer {i}: start easy and finish strong. " * 3})
+    return history
+
+
+def test_short_conversations_are_sent_whole():
+    assembler = PromptAssembler(budget=2000, max_history=10)
+    history = conversation(2) + [{"role": "user", "content": "and after that?"}]
+    messages, report = assembler.assemble("ann", STATIC, CONTEXT, history)
+
+    assert messages[0] == {"role": "system", "content": STATIC}
+    assert messages[1] == {"role": "system", "content": CONTEXT}
+    assert messages[2:] == history
+    assert report["prompt_tokens"] == count_message_tokens(messages)
+
+
+def test_older_turns_are_summarised_to_fit_the_budget():
+    assembler = PromptAssembler(budget=400)
+    history = conversation(8) + [{"role": "user", "content": "what next?"}]
+    messages, report = assembler.assemble("ann", STATIC, CONTEXT, history)
+
+    assert report["prompt_tokens"] == count_message_tokens(messages) <= 400
+    assert messages[-1] == history[-1]
+    summary = messages[2]["content"]
+    assert summary.startswith("Earlier in this conversation:")
+    # The newest left-out turns, one line per message, up to SUMMARY_MAX_LINES
+    lines = summary.split("\n")[1:]
+    assert len(lines) == 6
+    assert lines[-2:] == ["- User asked: Question 6: how should I pace my long run this weekend?",
+                          "- You answered: Answer 6: start easy and finish strong."]
+    assert messages[3:] == history[14:]
+    assert report["prompt_tokens_saved"] > 0 and report["estimated_savings"] > 0
+    assert assembler.stats()["prompt_tokens_saved"] == report["prompt_tokens_saved"]
+
+
+def test_history_beyond_the_message_cap_is_summarised():
+    assembler = PromptAssembler(budget=5000, max_history=4)
+    history = conversation(4) + [{"role": "user", "content": "what next?"}]
+    messages, _ = assembler.assemble("ann", STATIC, CONTEXT, history)
+    assert messages[3:] == history[-4:]
+    assert messages[2]["content"].count("\n- ") == 5
+
+
+def test_the_question_is_always_sent():
+    assembler = PromptAssembler(budget=10)
+    question = {"role": "user", "content": "hi"}
+    messages, _ = assembler.assemble("ann", STATIC, CONTEXT, conversation(1) + [question])
+    assert messages[-1] == question
+
+
+def test_summary_rolls_forward_and_is_bounded():
+    summaries = RollingSummaries(max_lines=3)
+    history = conversation(3)
+    summaries.extend("ann", history[:2])
+    summaries.extend("ann", history[1:4])
+    lines = summaries.preview("ann", [])
+    assert len(lines) == 3
+    assert lines[0].startswith("- You answered: Answer 0")
+    summaries.forget("ann")
+    assert summaries.preview("ann", []) == []
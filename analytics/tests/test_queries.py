@@ -0,0 +1,118 @@
+import os
+from datetime import date, datetime, timezone
+
+import pytest
+
+pytest.importorskip("bson")
+
+from queries import (batch_stats_pipeline, daily_trend_pipeline, daily_trend_points, dashboard_pipeline,
+                     dashboard_week, parse_series_args, series_pipeline, stats_pipeline, weekly_journal_pipeline)
+
+NOW = datetime(2024, 5, 16, 14, 30)  # a Thursday
+
+
+def test_dashboard_week_defaults_to_this_week():
+    assert dashboard_week(now=NOW) == (datetime(2024, 5, 13), datetime(2024, 5, 17))
+
+
+def test_dashboard_week_needs_both_bounds():
+    assert dashboard_week("2024-05-01", "2024-05-07") == (datetime(2024, 5, 1), datetime(2024, 5, 8))
+    with pytest.raises(ValueError):
+        dashboard_week("2024-05-01", None)
+
+
+def test_dashboard_branches_match_standalone_pipelines():
+    week = (datetime(2024, 5, 13), datetime(2024, 5, 17))
+    match, facet = dashboard_pipeline("ann@example.com", *week, today=NOW.date())
+
+    assert match == {"$match": {"username": "ann@example.com"}}
+    branches = facet["$facet"]
+    assert branches["stats"] == stats_pipeline()
+    # Same stages as the standalone endpoints, minus the username filter already
+    # applied and the $unionWith seed, which $facet doesn't allow
+    standalone_trend = daily_trend_pipeline("ann@example.com", today=NOW.date())
+    assert branches["trend"][0] == {"$match": {"date": standalone_trend[0]["$match"]["date"]}}
+    assert branches["trend"][1:] == [stage for stage in standalone_trend[1:] if "$unionWith" not in stage]
+    assert len(branches["trend"]) == len(standalone_trend) - 1
+    standalone_weekly = weekly_journal_pipeline("ann@example.com", *week)
+    assert branches["weekly"][0] == {"$match": {"date": standalone_weekly[0]["$match"]["date"]}}
+    assert branches["weekly"][1:] == standalone_weekly[1:]
+
+
+def test_series_args_default_to_a_chart_of_buckets():
+    assert parse_series_args(today=NOW.date()) == ("day", date(2024, 5, 10), date(2024, 5, 16), "UTC")
+    granularity, start, end, _ = parse_series_args("week", today=NOW.date())
+    assert (granularity, start, end) == ("week", date(2024, 2, 26), date(2024, 5, 16))
+    assert parse_series_args("month", today=NOW.date())[1] == date(2023, 6, 1)
+
+
+@pytest.mark.parametrize("args", [
+    {"granularity": "hour"},
+    {"tz": "Mars/Olympus_Mons"},
+    {"start": "2024-05-20", "end": "2024-05-01"},
+    {"start": "2019-01-01", "end": "2024-05-01"},
+    {"start": "16/05/2024"},
+])
+def test_series_args_rejects_bad_input(args):
+    with pytest.raises(ValueError):
+        parse_series_args(**args)
+
+
+def test_series_pipeline_densifies_whole_buckets_in_local_time():
+    pipeline = series_pipeline("ann", "month", date(2024, 3, 15), date(2024, 4, 2), "Europe/London")
+    match = pipeline[0]["$match"]["date"]
+    # Local midnights: GMT before the clocks change, BST after
+    assert match["$gte"].astimezone(timezone.utc) == datetime(2024, 3, 15, tzinfo=timezone.utc)
+    assert match["$lt"].astimezone(timezone.utc) == datetime(2024, 4, 2, 23, tzinfo=timezone.utc)
+    densify = next(stage["$densify"] for stage in pipeline if "$densify" in stage)
+    assert densify["range"]["bounds"] == [datetime(2024, 3, 1, tzinfo=timezone.utc),
+                                          datetime(2024, 5, 1, tzinfo=timezone.utc)]
+    assert densify["range"]["unit"] == "month"
+    assert any("$fill" in stage for stage in pipeline)
+
+
+def test_empty_dashboard_trend_is_padded():
+    days = daily_trend_points([], today=NOW.date())
+    assert [p["name"] for p in days] == ["Fri", "Sat", "Sun", "Mon", "Tue", "Wed", "Thu"]
+    assert [p["date"] for p in days][0] == "2024-05-10"
+    assert {p["Duration"] for p in days} == {0}
+    densified = [{"name": "Thu", "Duration": 30, "date": "2024-05-16"}]
+    assert daily_trend_points(densified, today=NOW.date()) is densified
+
+
+def test_batch_stats_pipeline_filters_users_and_dates():
+    match = batch_stats_pipeline(["ann", "bob"], datetime(2024, 5, 1), datetime(2024, 5, 8))[0]["$match"]
+    assert match == {"username": {"$in": ["ann", "bob"]},
+                     "date": {"$gte": datetime(2024, 5, 1), "$lt": datetime(2024, 5, 8)}}
+    assert batch_stats_pipeline(["ann"])[1:] == stats_pipeline()
+
+
+@pytest.mark.skipif(not os.getenv("TEST_MONGO_URI"), reason="set TEST_MONGO_URI to run against MongoDB")
+def test_dashboard_and_series_run_on_mongodb():
+    import pymongo
+    client = pymongo.MongoClient(os.environ["TEST_MONGO_URI"])
+    db = client["test_queries"]
+    try:
+        db.exercises.insert_many([
+            {"username": "ann", "exerciseType": "Running", "duration": 30, "date": datetime(2024, 5, 14, 7)},
+            {"username": "ann", "exerciseType": "Yoga", "duration": 20, "date": datetime(2024, 5, 14, 19)},
+            {"username": "bob", "exerciseType": "Running", "duration": 99, "date": datetime(2024, 5, 14, 7)},
+        ])
+        week = (datetime(2024, 5, 13), datetime(2024, 5, 17))
+        standalone = list(db.exercises.aggregate(daily_trend_pipeline("ann", today=NOW.date())))
+        assert [p["Duration"] for p in standalone] == [0, 0, 0, 0, 50, 0, 0]
+        result = list(db.exercises.aggregate(dashboard_pipeline("ann", *week, today=NOW.date())))[0]
+        assert daily_trend_points(result["trend"], today=NOW.date()) == standalone
+        assert sorted(result["weekly"], key=lambda w: w["exerciseType"]) == [
+            {"exerciseType": "Running", "totalDuration": 30}, {"exerciseType": "Yoga", "totalDuration": 20}]
+
+        # An empty range is still densified to a full chart by the seed
+        granularity, start, end, tz = parse_series_args("week", "2023-01-02", "2023-01-15")
+        assert list(db.exercises.aggregate(series_pipeline("ann", granularity, start, end, tz))) == [
+            {"name": "2023-W01", "Duration": 0, "date": "2023-01-02"},
+            {"name": "2023-W02", "Duration": 0, "date": "2023-01-09"}]
+        empty_week = list(db.exercises.aggregate(dashboard_pipeline("cat", *week, today=NOW.date())))[0]
+        assert daily_trend_points(empty_week["trend"], today=NOW.date()) == list(
+            db.exercises.aggregate(daily_trend_pipeline("cat", today=NOW.date())))
+    finally:
+        client.drop_database("test_queries")
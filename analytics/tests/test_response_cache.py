@@ -0,0 +1,72 @@
+from response_cache import ResponseCache, cacheable
+
+CONTEXT = "USER'S FITNESS DATA (LAST 7 DAYS): 4 activities, 200 minutes"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_chip_variants_share_a_reply():
+    cache = ResponseCache()
+    key = cache.key("ann", "How am I doing this week? 📊", 7, "journal", CONTEXT)
+    cache.put(key, "Great week! 💪", 0.0002)
+
+    assert cache.get(cache.key("ann", "how am i doing this week", 7, "journal", CONTEXT)) == "Great week! 💪"
+    assert cache.get(cache.key("bob", "How am I doing this week? 📊", 7, "journal", CONTEXT)) is None
+    assert cache.get(cache.key("ann", "How am I doing this week? 📊", 30, "journal", CONTEXT)) is None
+    assert cache.get(cache.key("ann", "How am I doing this week? 📊", 7, "dashboard", CONTEXT)) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 3
+    assert stats["saved_cost"] == 0.0002
+
+
+def test_changed_data_misses():
+    cache = ResponseCache()
+    cache.put(cache.key("ann", "What's my strongest activity?", 7, "journal", CONTEXT), "Cycling", 0.0001)
+    assert cache.get(cache.key("ann", "What's my strongest activity?", 7, "journal", CONTEXT + ", 1 more")) is None
+
+
+def test_entries_expire_and_are_bounded():
+    clock = Clock()
+    cache = ResponseCache(ttl=600, max_entries=2, clock=clock)
+    keys = [cache.key("ann", question, 7, "journal", CONTEXT)
+            for question in ("How consistent am I?", "Where can I improve?", "What's my weekly average?")]
+    for key in keys:
+        cache.put(key, "reply", 0.0001)
+    assert cache.get(keys[0]) is None and cache.get(keys[2]) == "reply"
+    clock.now = 600
+    assert cache.get(keys[2]) is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_follow_ups_and_opt_outs_bypass_the_cache():
+    assert not cacheable("and yesterday?")
+    assert not cacheable("Why is that?")
+    assert cacheable("What's achievable this month?")
+    cache = ResponseCache()
+    assert cache.key("ann", "Tell me more", 7, "journal", CONTEXT) is None
+    assert cache.get(None) is None
+    assert cache.stats()["bypassed"] == 1 and cache.stats()["hit_rate"] == 0.0
+
+
+def test_opted_out_replies_are_not_stored():
+    cache = ResponseCache()
+    # What the chat routes do for a request sent with "cache": false
+    key = cache.key("ann", "How consistent am I?", 7, "journal", CONTEXT, use_cache=False)
+    assert cache.get(key) is None
+    cache.put(key, "Very", 0.0001)
+    assert cache.stats()["entries"] == 0
+    assert cache.get(cache.key("ann", "How consistent am I?", 7, "journal", CONTEXT)) is None
+
+
+def test_forget_drops_a_users_replies():
+    cache = ResponseCache()
+    key = cache.key("ann", "How consistent am I?", 7, "journal", CONTEXT)
+    cache.put(key, "Very", 0.0001)
+    cache.forget("ann")
+    assert cache.get(key) is None
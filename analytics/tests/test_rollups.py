@@ -0,0 +1,110 @@
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("dotenv")
+
+from rollups import ROLLUP_COLLECTION, apply_change, changed_buckets, rebuild, rebuild_all, refresh_ops
+
+RUN = {"_id": 1, "username": "ann", "exerciseType": "Running", "duration": 30, "date": datetime(2024, 5, 16, 7)}
+RUN_BUCKET = {"username": "ann", "exerciseType": "Running", "date": datetime(2024, 5, 16)}
+
+
+def test_insert_touches_its_bucket():
+    change = {"operationType": "insert", "fullDocument": RUN}
+    assert changed_buckets(change) == [RUN_BUCKET]
+
+
+def test_update_touches_the_old_and_new_buckets():
+    moved = dict(RUN, date=datetime(2024, 5, 15, 23, tzinfo=timezone.utc), exerciseType="Cycling")
+    change = {"operationType": "update", "fullDocumentBeforeChange": RUN, "fullDocument": moved}
+    assert changed_buckets(change) == [
+        RUN_BUCKET, {"username": "ann", "exerciseType": "Cycling", "date": datetime(2024, 5, 15)}]
+
+    longer = {"operationType": "update", "fullDocumentBeforeChange": RUN, "fullDocument": dict(RUN, duration=45)}
+    assert changed_buckets(longer) == [RUN_BUCKET]
+
+
+def test_comment_edits_and_other_events_touch_nothing():
+    edit = {"operationType": "update", "fullDocumentBeforeChange": RUN, "fullDocument": dict(RUN, description="hi")}
+    assert changed_buckets(edit) == []
+    assert changed_buckets({"operationType": "drop"}) == []
+
+
+def test_delete_uses_the_pre_image():
+    change = {"operationType": "delete", "fullDocumentBeforeChange": RUN, "documentKey": {"_id": 1}}
+    assert changed_buckets(change) == [RUN_BUCKET]
+    assert changed_buckets({"operationType": "delete", "documentKey": {"_id": 1}}) is None
+
+
+def test_refresh_replaces_or_deletes_each_bucket():
+    cycling = {"username": "ann", "exerciseType": "Cycling", "date": datetime(2024, 5, 15)}
+    ops = refresh_ops([RUN_BUCKET, cycling], [dict(RUN_BUCKET, duration=75, count=2)])
+    assert type(ops[0]).__name__ == "ReplaceOne" and ops[0]._filter == RUN_BUCKET
+    assert ops[0]._doc == dict(RUN_BUCKET, duration=75, count=2) and ops[0]._upsert
+    assert type(ops[1]).__name__ == "DeleteOne" and ops[1]._filter == cycling
+
+
+class Collection:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.pipelines = []
+        self.writes = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return iter(self.docs)
+
+    def bulk_write(self, ops, ordered=True):
+        self.writes.append(ops)
+
+
+class Database(dict):
+    def __missing__(self, name):
+        self[name] = Collection()
+        return self[name]
+
+    @property
+    def exercises(self):
+        return self["exercises"]
+
+
+def test_update_without_pre_image_rebuilds_the_user():
+    db = Database(exercises=Collection([dict(RUN_BUCKET, duration=30, count=1)]))
+    apply_change(db, {"operationType": "update", "fullDocument": RUN, "documentKey": {"_id": 1}})
+
+    assert db.exercises.pipelines[0][0] == {"$match": {"username": "ann"}}
+    ops = db[ROLLUP_COLLECTION].writes[0]
+    assert [type(op).__name__ for op in ops] == ["ReplaceOne", "DeleteMany"]
+    assert ops[1]._filter == {"username": "ann", "$nor": [{"exerciseType": "Running", "date": datetime(2024, 5, 16)}]}
+
+
+def test_delete_without_pre_image_is_skipped():
+    db = Database()
+    apply_change(db, {"operationType": "delete", "documentKey": {"_id": 1}})
+    assert db[ROLLUP_COLLECTION].writes == [] and db.exercises.pipelines == []
+
+
+@pytest.mark.skipif(not os.getenv("TEST_MONGO_URI"), reason="set TEST_MONGO_URI to run against MongoDB")
+def test_replayed_changes_are_not_counted_twice():
+    import pymongo
+    client = pymongo.MongoClient(os.environ["TEST_MONGO_URI"])
+    db = client["test_rollups"]
+    try:
+        db.exercises.insert_one(dict(RUN))
+        rebuild_all(db, client)
+        second = {"_id": 2, "username": "ann", "exerciseType": "Running", "duration": 15, "date": datetime(2024, 5, 16, 18)}
+        db.exercises.insert_one(dict(second))
+        for _ in range(2):
+            apply_change(db, {"operationType": "insert", "fullDocument": second})
+        db.exercises.delete_one({"_id": 1})
+        apply_change(db, {"operationType": "delete", "fullDocumentBeforeChange": RUN, "documentKey": {"_id": 1}})
+
+        rollups = list(db[ROLLUP_COLLECTION].find({}, {"_id": 0}))
+        assert rollups == [dict(RUN_BUCKET, duration=15, count=1)]
+        rebuild(db, username="ann")
+        assert list(db[ROLLUP_COLLECTION].find({}, {"_id": 0})) == rollups
+    finally:
+        client.drop_database("test_rollups")
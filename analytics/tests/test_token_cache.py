@@ -0,0 +1,58 @@
+import pytest
+from token_cache import TokenCache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_hit_after_put(clock):
+    """Test a verified token is served from the cache until it expires"""
+    cache = TokenCache(clock=clock)
+    assert cache.get("token-a") is None
+    cache.put("token-a", {"sub": "alice", "exp": 1060})
+
+    assert cache.get("token-a") == {"sub": "alice", "exp": 1060}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entry_evicted_at_exp(clock):
+    """Test an entry is dropped once the token's exp has passed"""
+    cache = TokenCache(clock=clock)
+    cache.put("token-a", {"sub": "alice", "exp": 1060})
+    clock.now = 1060
+
+    assert cache.get("token-a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_lru_capacity(clock):
+    """Test the least recently used token is evicted when the cache is full"""
+    cache = TokenCache(max_size=2, clock=clock)
+    cache.put("a", {"exp": 2000})
+    cache.put("b", {"exp": 2000})
+    cache.get("a")
+    cache.put("c", {"exp": 2000})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_tokens_without_valid_exp_not_cached(clock):
+    """Test claims with no exp, or an exp in the past, are never stored"""
+    cache = TokenCache(clock=clock)
+    cache.put("no-exp", {"sub": "alice"})
+    cache.put("expired", {"sub": "alice", "exp": 999})
+
+    assert cache.stats()["size"] == 0
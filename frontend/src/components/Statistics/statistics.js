@@ -114,11 +114,19 @@ const Statistics = ({ currentUser }) => {
     const formattedEnd = endDate.toISOString().split("T")[0];
     console.log("Fetching stats for:", formattedStart, "to", formattedEnd);
 
-    const query = `query WeeklyStats($username: String!, $startDate: String!, $endDate: String!) {
+    // Weekly summary and daily trend come from a single dashboard request
+    const query = `query Dashboard($username: String!, $startDate: String, $endDate: String) {
                         analytics {
-                          weeklyStats(username: $username, startDate: $startDate, endDate: $endDate) {
-                            exerciseType
-                            totalDuration
+                          dashboard(username: $username, startDate: $startDate, endDate: $endDate) {
+                            weekly {
+                              exerciseType
+                              totalDuration
+                            }
+                            trend {
+                              name
+                              Duration
+                              date
+                            }
                           }
                         }
                       }`;
@@ -140,7 +148,8 @@ const Statistics = ({ currentUser }) => {
     })
       .then((res) => res.json())
       .then((result) => {
-        const stats = result.data?.analytics?.weeklyStats || [];
+        const dashboard = result.data?.analytics?.dashboard;
+        const stats = dashboard?.weekly || [];
         console.log("Fetched weekly trend stats:", stats);
 
         // Derive same frontend state shape
@@ -159,43 +168,14 @@ const Statistics = ({ currentUser }) => {
           exercises,
         });
 
-        const query_daily_trend = `
-        query DailyTrend($username: String!) {
-          analytics {
-            dailyTrend(username: $username) {
-              name
-              Duration
-              date
-            }
-          }
-        }
-      `;
-        fetch("http://localhost:4000/graphql", {
-          method: "POST",
-          headers: {
-            "Content-Type": "application/json",
-            Authorization: `Bearer ${jwt}`,
-          },
-          body: JSON.stringify({
-            query: query_daily_trend,
-            variables: {
-              username: currentUser,
-            },
-          }),
-        })
-          .then((res) => res.json())
-          .then((result) => {
-            const stats_trend = result.data?.analytics?.dailyTrend || [];
-
-            // const trend = exercises.map((ex, i) => ({ name: ex.exerciseType, Duration: ex.totalDuration }));
-            console.log("Fetched daily trend stats:", stats_trend);
-            const trend = stats_trend.map((item) => ({
-              name: item.name,
-              Duration: item.Duration,
-              date: item.date || "",
-            }));
-            setWeeklyData(trend);
-          });
+        const stats_trend = dashboard?.trend || [];
+        console.log("Fetched daily trend stats:", stats_trend);
+        const trend = stats_trend.map((item) => ({
+          name: item.name,
+          Duration: item.Duration,
+          date: item.date || "",
+        }));
+        setWeeklyData(trend);
       })
       .catch((err) => {
         console.error("GraphQL stats fetch failed:", err);
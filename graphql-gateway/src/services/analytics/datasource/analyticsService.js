@@ -49,6 +49,23 @@ export class AnalyticsService {
   }
   
 
+  async getDashboard(username, startDate, endDate, context) {
+    const { data } = await axios.get(`${this.baseURL}/stats/dashboard/${username}`, {
+      params: {
+        start: startDate,
+        end: endDate
+      },
+      headers: { Authorization: context.authHeader },
+      timeout: 5000
+    });
+    return {
+      stats: data.stats || [],
+      trend: data.trend || [],
+      weekly: data.weekly || []
+    };
+  }
+
+
   async getActivitiesRange(username, startDate, endDate, context) {
     const { data } = await axios.get(`${this.baseURL}/api/activities/range`, {
       params: {
@@ -96,6 +96,32 @@ const analyticsQueryResolvers = {
   },
 
 
+  /**
+   * Get totals, daily trend and weekly statistics for a user in one round trip
+   */
+  dashboard: async (_, { username, startDate, endDate }, context) => {
+    try {
+      // Validate username and, when given, the weekly date range
+      const validatedUsername = validateUsername(username);
+      const validatedDates = startDate || endDate
+        ? validateDateRange(startDate, endDate)
+        : { startDate: undefined, endDate: undefined };
+
+      return await retryWithFallback(async () => {
+        return await analyticsService.getDashboard(
+          validatedUsername,
+          validatedDates.startDate,
+          validatedDates.endDate,
+          context
+        );
+      });
+    } catch (error) {
+      handleServiceError(error, 'fetch dashboard stats');
+      return { stats: [], trend: [], weekly: [] };
+    }
+  },
+
+
   /**
    * Get detailed data for activities for a user within date range (journal page)
    */
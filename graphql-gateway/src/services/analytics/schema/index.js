@@ -20,6 +20,12 @@ export const analyticsTypeDefs = `#graphql
     date: String!
   }
 
+  type Dashboard {
+    stats: [UserStats!]!
+    trend: [DailyTrend!]!
+    weekly: [WeeklyStats!]!
+  }
+
   type ActivitiesRange {
     id: String!
     username: String!
@@ -49,6 +55,9 @@ export const analyticsTypeDefs = `#graphql
     # Get daily trend data (for line chart)
     dailyTrend(username: String!): [DailyTrend!]!
 
+    # Get per-type totals, daily trend and weekly statistics in one request (statistics page)
+    dashboard(username: String!, startDate: String, endDate: String): Dashboard!
+
     # Get all activities data for a user within date range (for journal page)
     activitiesRange(username: String!, startDate: String!, endDate: String!): [ActivitiesRange!]!
 
@@ -109,6 +109,44 @@ describe('Analytics Resolvers Tests', () => {
         }
       });
     });
+
+    describe('dashboard', () => {
+      it('should validate username', async () => {
+        await assert.rejects(
+          () => analyticsResolvers.AnalyticsQuery.dashboard(null, { username: 'notanemail' }, {}),
+          ValidationError,
+          'Should validate username (must be email)'
+        );
+      });
+
+      it('should validate date range when given', async () => {
+        await assert.rejects(
+          () => analyticsResolvers.AnalyticsQuery.dashboard(
+            null,
+            { username: 'testuser@example.com', startDate: '2024-01-31', endDate: '2024-01-01' },
+            {}
+          ),
+          ValidationError,
+          'Should validate date range (end before start)'
+        );
+      });
+
+      it('should return all three views (may be empty on error)', async () => {
+        try {
+          const result = await analyticsResolvers.AnalyticsQuery.dashboard(
+            null,
+            { username: 'testuser@example.com' },
+            {}
+          );
+          assert.ok(Array.isArray(result.stats), 'Should return stats array');
+          assert.ok(Array.isArray(result.trend), 'Should return trend array');
+          assert.ok(Array.isArray(result.weekly), 'Should return weekly array');
+        } catch (error) {
+          // May throw service errors
+          assert.ok(error, 'May throw errors');
+        }
+      });
+    });
   });
 
   describe('Resolver Structure', () => {
@@ -122,6 +160,7 @@ describe('Analytics Resolvers Tests', () => {
       assert.strictEqual(typeof analyticsResolvers.AnalyticsQuery.allStats, 'function', 'Should have allStats resolver');
       assert.strictEqual(typeof analyticsResolvers.AnalyticsQuery.userStats, 'function', 'Should have userStats resolver');
       assert.strictEqual(typeof analyticsResolvers.AnalyticsQuery.weeklyStats, 'function', 'Should have weeklyStats resolver');
+      assert.strictEqual(typeof analyticsResolvers.AnalyticsQuery.dashboard, 'function', 'Should have dashboard resolver');
     });
   });
 });